@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+
+import click
+import concurrent.futures
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import functools
+
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+
+from datalogger.libraries.config import load_config, config_snapshot
+from datalogger.libraries.datalogging import DataLogger
+from datalogger.libraries.storage import percentiles
+from datalogger.libraries.ring_buffer import LiveBuffer
+from datalogger.libraries.usb_20x_sim import usb_20x_sim
+
+
+logging.basicConfig(level=logging.INFO, format='(%(threadName)-9s) %(message)s', )
+
+logging.getLogger('matplotlib').setLevel(logging.WARNING)
+
+STAGES = ['collect_data', 'process_data', 'qt_fan_out', 'output_final_results']
+
+
+class StageTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {stage: [] for stage in STAGES}
+
+    def add(self, stage, duration):
+        with self.lock:
+            self.timings[stage].append(duration)
+
+    def wrap(self, stage, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, perf_counter() - start)
+
+        return timed
+
+    def summary(self):
+        summary = {}
+        for stage, timings in self.timings.items():
+            summary[stage] = {
+                'calls': len(timings),
+                'total_s': sum(timings),
+                'mean_ms': np.mean(timings) * 1000 if timings else 0.,
+                **percentiles(timings)
+            }
+
+        return summary
+
+
+def qt_pull_loop(live, stop_event, fps=25):
+    # Stands in for the Qt window pulling the latest samples on its timer
+    cursor = 0
+    while not stop_event.wait(1 / fps):
+        values, cursor, skipped = live.read(cursor)
+
+
+def build_sensors(sensors, nchan):
+    base_sensors = sorted(sensors.values(), key=lambda sensor: sensor['channel'])
+
+    built = {}
+    for chan in range(nchan):
+        sensor = copy.copy(base_sensors[chan % len(base_sensors)])
+        sensor['channel'] = chan
+
+        if chan >= len(base_sensors):
+            sensor['sensor_name'] = f'{sensor["sensor_name"]} {chan}'
+
+        built[f'channel{chan}'] = sensor
+
+    return built
+
+
+def run_point(config, frequency, nchan, duration, realtime):
+    sensors = build_sensors(load_config(config), nchan)
+
+    device = functools.partial(
+        usb_20x_sim,
+        sensors=config_snapshot(sensors),
+        realtime=realtime,
+        burn_start=min(3., duration / 4),
+        burn_time=min(4., duration / 3),
+        # By the scans produced rather than the time, the same data whether it is generated in real time or not
+        max_scans=int(duration * frequency),
+        seed=0
+    )
+
+    timer = StageTimer()
+    enqueue_times = deque()
+    latencies = []
+    samples = [0]
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        data_logger = DataLogger(frequency, sensors, base_dir=base_dir, device=device)
+
+        ring = data_logger.ring
+        ring_write = ring.write
+        process_data = data_logger.process_data
+
+        def timed_ring_write(scans):
+            written = ring_write(scans)
+            if written:
+                enqueue_times.append((ring.write_cursor, perf_counter()))
+
+            return written
+
+        def timed_process_data(raw_input_data):
+            process_data(raw_input_data)
+
+            samples[0] += raw_input_data.size
+
+            # A batch is done once the consumer has processed its last scan
+            processed = ring.read_cursor + len(raw_input_data)
+            while enqueue_times and enqueue_times[0][0] <= processed:
+                latencies.append(perf_counter() - enqueue_times.popleft()[1])
+
+        ring.write = timed_ring_write
+        data_logger.collect_data = timer.wrap('collect_data', data_logger.collect_data)
+        data_logger.process_data = timer.wrap('process_data', timed_process_data)
+        data_logger.output_final_results = timer.wrap('output_final_results', data_logger.output_final_results)
+
+        live = LiveBuffer(8 * 2**data_logger.batch_exp, nchan)
+        live.write = timer.wrap('qt_fan_out', live.write)
+
+        qt_stop = threading.Event()
+        qt_pull = threading.Thread(name='qt_pull', target=qt_pull_loop, daemon=True, args=(live, qt_stop))
+        qt_pull.start()
+
+        data_logger.start(live)
+
+        start = perf_counter()
+        data_logger.wait_for_datalogger()
+        elapsed = perf_counter() - start
+
+        data_logger.stop()
+        data_logger.wait_for_datalogger()
+        data_logger.output_final_results()
+
+        qt_stop.set()
+
+    return {
+        'frequency': frequency,
+        'channels': nchan,
+        'elapsed_s': elapsed,
+        'samples': samples[0],
+        'samples_per_s': samples[0] / elapsed,
+        'batches': len(latencies),
+        'dropped_batches': data_logger.dropped_batches,
+        'ring_max_fill': data_logger.ring.max_fill / data_logger.ring.capacity,
+        'latency_ms': percentiles(latencies),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'storage': data_logger.storage.metrics(),
+        'render_s': data_logger.render_times,
+        'stages': timer.summary()
+    }
+
+
+def run_isolated(*args):
+    # A fresh process per point so the peak RSS belongs to that point only, not a daemon so it can render the plots in a pool
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_point, *args).result()
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    regressions = []
+
+    for key, result in results.items():
+        if key not in baseline['results']:
+            logging.info(f'{key}: not in the baseline, skipping')
+            continue
+
+        base = baseline['results'][key]
+
+        if result['samples_per_s'] < base['samples_per_s'] * (1 - tolerance):
+            regressions.append(f'{key}: {result["samples_per_s"]:.0f} samples/s, baseline {base["samples_per_s"]:.0f}')
+
+        if result['dropped_batches'] > base['dropped_batches']:
+            regressions.append(f'{key}: {result["dropped_batches"]} dropped batches, baseline {base["dropped_batches"]}')
+
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f'{key}: peak RSS {result["peak_rss_mb"]:.1f} MB, baseline {base["peak_rss_mb"]:.1f} MB')
+
+        for metric in ('p50', 'p95'):
+            current, previous = result['latency_ms'][metric], base['latency_ms'][metric]
+
+            # Ignore jitter in latencies that are too small to matter
+            if current > previous * (1 + tolerance) and current - previous > 1:
+                regressions.append(f'{key}: {metric} batch latency {current:.1f} ms, baseline {previous:.1f} ms')
+
+        for stage in STAGES:
+            if stage not in base['stages']:
+                continue
+
+            current, previous = result['stages'][stage]['mean_ms'], base['stages'][stage]['mean_ms']
+
+            if current > previous * (1 + tolerance) and current - previous > 1:
+                regressions.append(f'{key}: {stage} mean {current:.2f} ms, baseline {previous:.2f} ms')
+
+    return regressions
+
+
+def log_result(key, result):
+    logging.info(
+        f'{key}: {result["samples_per_s"]:.0f} samples/s  '
+        f'latency p50 {result["latency_ms"]["p50"]:.1f} ms  p95 {result["latency_ms"]["p95"]:.1f} ms  p99 {result["latency_ms"]["p99"]:.1f} ms  '
+        f'peak RSS {result["peak_rss_mb"]:.1f} MB  dropped batches {result["dropped_batches"]}'
+    )
+
+    if 'storage' in result:
+        storage = result['storage']
+        logging.info(
+            f'    storage: {storage["writes"]} writes  latency p50 {storage["write_latency_ms"]["p50"]:.2f} ms  '
+            f'p95 {storage["write_latency_ms"]["p95"]:.2f} ms  max queue depth {storage["max_queue_depth"]}'
+        )
+
+    for stage, timing in result['stages'].items():
+        logging.info(f'    {stage:<22} calls {timing["calls"]:>6}  mean {timing["mean_ms"]:8.2f} ms  p95 {timing["p95"]:8.2f} ms  total {timing["total_s"]:7.2f} s')
+
+
+@click.command()
+@click.option('-f', '--freqs', type=str, default='100,1000,5000,10000', help='Comma separated sample rates to test - Default: 100,1000,5000,10000 Hz')
+@click.option('-c', '--channels', type=str, default='1,3,5', help='Comma separated channel counts to test - Default: 1,3,5')
+@click.option('-t', '--duration', type=float, default=12, help='Seconds of data per run - Default: 12')
+@click.option('--fast', is_flag=True, help='Generate the data as fast as it is read instead of in real time')
+@click.option('--config', type=str, default='datalogger/sensors.json.example', help='Sensor config to build the channels from - Default: datalogger/sensors.json.example')
+@click.option('-b', '--baseline', type=str, default='benchmark_baseline.json', help='Baseline file - Default: benchmark_baseline.json')
+@click.option('--save', is_flag=True, help='Save the results as the new baseline instead of comparing against it')
+@click.option('--tolerance', type=float, default=0.2, help='Allowed regression as a fraction of the baseline - Default: 0.2')
+@click.option('-d', '--debug', is_flag=True, help='Turn on debugging')
+def main(freqs, channels, duration, fast, config, baseline, save, tolerance, debug):
+    if debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    mode = 'fast' if fast else 'realtime'
+
+    results = {}
+    for frequency in [int(freq) for freq in freqs.split(',')]:
+        for nchan in [int(chan) for chan in channels.split(',')]:
+            key = f'{mode} {frequency} Hz x {nchan} ch'
+
+            logging.info(f'Running {key} for {duration} seconds...')
+            results[key] = run_isolated(config, frequency, nchan, duration, not fast)
+
+            log_result(key, results[key])
+
+    if save or not os.path.exists(baseline):
+        with open(baseline, 'w') as baseline_file:
+            json.dump({
+                'created': datetime.now().isoformat(),
+                'host': platform.node(),
+                'machine': platform.machine(),
+                'duration': duration,
+                'results': results
+            }, baseline_file, indent=4, sort_keys=True)
+
+        logging.info(f'Saved baseline to {baseline}')
+        return
+
+    with open(baseline) as baseline_file:
+        regressions = compare_to_baseline(results, json.load(baseline_file), tolerance)
+
+    if regressions:
+        logging.error('#' * 60)
+        logging.error(f'PERFORMANCE REGRESSION against {baseline}:')
+        for regression in regressions:
+            logging.error(f'  {regression}')
+        logging.error('#' * 60)
+        sys.exit(1)
+
+    logging.info(f'No regressions against {baseline}')
+
+
+if __name__ == '__main__':
+    main()
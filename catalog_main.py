@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+import click
+import logging
+import os
+import re
+
+from datalogger.libraries.catalog import RunCatalog, CATALOG_NAME
+
+
+logging.basicConfig(level=logging.INFO, format='(%(threadName)-9s) %(message)s', )
+
+
+def default_data_dir():
+    # The same place datalogger_main logs to
+    if os.path.exists('/media/pi/') and os.listdir('/media/pi/'):
+        return f'/media/pi/{os.listdir("/media/pi/")[0]}'
+
+    return '/home/pi/Desktop/data'
+
+
+def parse_peak(peak):
+    match = re.match(r'^\s*(.+?)\s*(>=|<=|>|<)\s*(-?[\d.]+)\s*$', peak)
+    if not match:
+        raise click.BadParameter(f'Expected something like "Chamber Pressure>500", got "{peak}"')
+
+    sensor_name, operator, value = match.groups()
+
+    return sensor_name, operator, float(value)
+
+
+@click.group()
+@click.option('--data', type=str, default=None, help='Data directory holding the runs - Default: where datalogger_main logs to')
+@click.option('--catalog', type=str, default=None, help=f'Catalog file - Default: {CATALOG_NAME} in the data directory')
+@click.option('-d', '--debug', is_flag=True, help='Turn on debugging')
+@click.pass_context
+def main(ctx, data, catalog, debug):
+    if debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    ctx.obj = {'data': data or default_data_dir()}
+    ctx.obj['catalog'] = catalog or f'{ctx.obj["data"]}/{CATALOG_NAME}'
+
+
+@main.command()
+@click.option('-p', '--processes', type=int, default=None, help='Number of runs read at once - Default: one per core')
+@click.option('--force', is_flag=True, help='Catalog the runs that are already in the catalog again')
+@click.pass_obj
+def backfill(obj, processes, force):
+    """ Adds the runs in the data directory to the catalog. """
+    catalog = RunCatalog(obj['catalog'])
+
+    added = catalog.backfill(obj['data'], processes, force)
+    logging.info(f'Cataloged {added} runs in {obj["catalog"]}')
+
+    catalog.close()
+
+
+@main.command()
+@click.option('-c', '--motor-class', type=str, default=None, help='Motor class, e.g. J')
+@click.option('--min-impulse', type=float, default=None, help='Minimum impulse in Ns')
+@click.option('--since', type=str, default=None, help='Only runs logged since this date, e.g. 2021-06-01')
+@click.option('--peak', type=str, multiple=True, help='Sensor peak, e.g. "Chamber Pressure>500", can be given more than once')
+@click.pass_obj
+def query(obj, motor_class, min_impulse, since, peak):
+    """ Lists the runs matching every filter. """
+    catalog = RunCatalog(obj['catalog'])
+
+    runs = catalog.runs(motor_class, min_impulse, since, [parse_peak(p) for p in peak])
+
+    for run in runs:
+        peaks = catalog.peaks(run['run_dir'])
+        peak_info = '  '.join(f'{name} max {sensor["max"]:.1f}' for name, sensor in peaks.items())
+
+        impulse = f'{run["impulse"]:.2f} Ns' if run['impulse'] is not None else '-'
+        burn_time = f'{run["burn_time"]:.1f} s' if run['burn_time'] is not None else '-'
+
+        click.echo(f'{run["timestamp_label"]}  {run["motor"] or "-":<8} {impulse:>12} {burn_time:>8}  {peak_info}')
+        click.echo(f'    {run["run_dir"]}')
+
+    logging.info(f'{len(runs)} runs')
+
+    catalog.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Binary encoding of the launch control commands, a fraction of the size of
+the JSON messages so they spend less time on air.
+
+Header, little endian:
+
+    byte 0     0xD0 | version
+    bytes 1-2  remote id, 0xFFFF for none
+    byte 3     command, its index in COMMANDS
+    bytes 4-5  sequence number
+    bytes 6-7  session, random for every start of the sender (version 2 on)
+
+followed by the args, if there are any, as one typed value: a tag byte
+and then the value, see _encode_value.
+"""
+
+import struct
+
+VERSION = 2
+
+_MAGIC = 0xD0
+_HEADER_V1 = struct.Struct('<BHBH')
+_HEADER = struct.Struct('<BHBHH')
+_NO_REMOTE_ID = 0xFFFF
+
+# Only ever append to this, the index is what goes on air
+COMMANDS = (
+    'ready',
+    'safe',
+    'launch',
+    'post-launch',
+    'fill-relay-on',
+    'fill-relay-off',
+    'dump-relay-on',
+    'dump-relay-off',
+    'start-cameras',
+    'stop-cameras'
+)
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _DICT = range(8)
+
+
+class CodecError(ValueError):
+    pass
+
+
+def is_binary(data):
+    return isinstance(data, (bytes, bytearray)) and len(data) >= _HEADER_V1.size and data[0] & 0xF0 == _MAGIC
+
+
+def encode(remoteid, command, sequence=0, args=None, session=0):
+    if command not in COMMANDS:
+        raise CodecError(f'Unknown command {command}')
+
+    if remoteid is None:
+        remoteid = _NO_REMOTE_ID
+    elif not 0 <= int(remoteid) < _NO_REMOTE_ID:
+        raise CodecError(f'Remote id {remoteid} does not fit in 16 bits')
+
+    data = bytearray(_HEADER.pack(_MAGIC | VERSION, int(remoteid), COMMANDS.index(command), sequence & 0xFFFF, session & 0xFFFF))
+
+    if args is not None:
+        _encode_value(args, data)
+
+    return bytes(data)
+
+
+def decode(data):
+    """
+    Returns the remoteid, command, sequence, session and args of a
+    message, the args being None when there were none and the session
+    None for version 1 messages.
+    """
+    if not is_binary(data):
+        raise CodecError('Not a binary message')
+
+    version = data[0] & 0x0F
+    if version > VERSION:
+        raise CodecError(f'Message version {version} is newer than {VERSION}')
+
+    header = _HEADER_V1 if version == 1 else _HEADER
+    if len(data) < header.size:
+        raise CodecError('Truncated message')
+
+    version_byte, remoteid, command, sequence, *session = header.unpack_from(data)
+
+    if command >= len(COMMANDS):
+        raise CodecError(f'Unknown command number {command}')
+
+    args = None
+    if len(data) > header.size:
+        args, offset = _decode_value(data, header.size)
+        if offset != len(data):
+            raise CodecError(f'{len(data) - offset} bytes left over')
+
+    return {
+        'remoteid': None if remoteid == _NO_REMOTE_ID else remoteid,
+        'command': COMMANDS[command],
+        'sequence': sequence,
+        'session': session[0] if session else None,
+        'args': args
+    }
+
+
+def _encode_varint(value, data):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return
+
+
+def _decode_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise CodecError('Truncated message')
+
+        byte = data[offset]
+        offset += 1
+
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value, offset
+
+
+def _encode_value(value, data):
+    # Ints are zigzag varints, so small ones of either sign are a byte, floats are doubles
+    if value is None:
+        data.append(_NONE)
+    elif value is True:
+        data.append(_TRUE)
+    elif value is False:
+        data.append(_FALSE)
+    elif isinstance(value, int):
+        data.append(_INT)
+        _encode_varint(value << 1 if value >= 0 else (-value << 1) - 1, data)
+    elif isinstance(value, float):
+        data.append(_FLOAT)
+        data.extend(struct.pack('<d', value))
+    elif isinstance(value, str):
+        encoded = value.encode()
+        data.append(_STR)
+        _encode_varint(len(encoded), data)
+        data.extend(encoded)
+    elif isinstance(value, (list, tuple)):
+        data.append(_LIST)
+        _encode_varint(len(value), data)
+        for item in value:
+            _encode_value(item, data)
+    elif isinstance(value, dict):
+        data.append(_DICT)
+        _encode_varint(len(value), data)
+        for key, item in value.items():
+            _encode_value(str(key), data)
+            _encode_value(item, data)
+    else:
+        raise CodecError(f'Can not encode {type(value).__name__}')
+
+
+def _decode_value(data, offset):
+    if offset >= len(data):
+        raise CodecError('Truncated message')
+
+    tag = data[offset]
+    offset += 1
+
+    if tag == _NONE:
+        return None, offset
+
+    if tag == _TRUE:
+        return True, offset
+
+    if tag == _FALSE:
+        return False, offset
+
+    if tag == _INT:
+        value, offset = _decode_varint(data, offset)
+        return (value >> 1) ^ -(value & 1), offset
+
+    if tag == _FLOAT:
+        if offset + 8 > len(data):
+            raise CodecError('Truncated message')
+        return struct.unpack_from('<d', data, offset)[0], offset + 8
+
+    if tag == _STR:
+        length, offset = _decode_varint(data, offset)
+        if offset + length > len(data):
+            raise CodecError('Truncated message')
+        try:
+            return bytes(data[offset:offset + length]).decode(), offset + length
+        except UnicodeDecodeError as e:
+            raise CodecError(f'Bad string: {e}')
+
+    if tag == _LIST:
+        count, offset = _decode_varint(data, offset)
+        items = []
+        for index in range(count):
+            item, offset = _decode_value(data, offset)
+            items.append(item)
+        return items, offset
+
+    if tag == _DICT:
+        count, offset = _decode_varint(data, offset)
+        items = {}
+        for index in range(count):
+            key, offset = _decode_value(data, offset)
+            items[key], offset = _decode_value(data, offset)
+        return items, offset
+
+    raise CodecError(f'Unknown value tag {tag}')
@@ -2,71 +2,516 @@ import meshtastic
 import meshtastic.serial_interface
 import json
 import time
+import random
 import logging
+import threading
+import statistics
 
+from collections import deque
 from pubsub import pub
+from meshtastic import portnums_pb2
+
+from common import codec
+
+# The radio settings every node runs with, set_config only writes what differs
+RADIO_PREFERENCES = {
+    'is_low_power': False,
+    'is_router': False,
+    'position_broadcast_secs': 300,
+    'gps_attempt_time': 300,
+    'gps_update_interval': 300,
+    'send_owner_interval': 10,
+    'wait_bluetooth_secs': 60,
+    'screen_on_secs': 900,
+    'phone_timeout_secs': 900,
+    'phone_sds_timeout_sec': 7200,
+    'mesh_sds_timeout_secs': 7200,
+    'sds_secs': 31536000,
+    'ls_secs': 3600
+}
+
+CHANNEL_SETTINGS = {
+    'modem_config': 0,
+    'tx_power': 0
+}
+
+# Longest a node takes to come back after a reboot
+REBOOT_TIMEOUT = 60
+
+# States of the RadioLink
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+RECONNECTING = 'reconnecting'
+REBOOTING = 'rebooting'
+
+
+class PendingAcks:
+    """
+    The sent messages waiting for an ack, by message id, each with an
+    Event that on_receive sets when the ack arrives.  Entries are dropped
+    ttl seconds after they were sent, acked or not, and there are never
+    more than max_entries of them.
+    """
+
+    def __init__(self, ttl=300, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # message id: (ack event, send time), oldest first
+        self.entries = {}
+        self.condition = threading.Condition()
+
+    def track(self, message_id):
+        with self.condition:
+            self._evict()
+
+            # The ack can beat the sender here
+            if message_id in self.entries:
+                return self.entries[message_id][0]
+
+            event = threading.Event()
+            self.entries[message_id] = (event, time.perf_counter())
+
+        return event
+
+    def ack(self, message_id):
+        """ Sets the event of the message, returns its round trip or None if it isn't tracked. """
+        with self.condition:
+            if message_id not in self.entries:
+                # Kept as acked in case the sender hasn't tracked it yet
+                self._evict()
+                self.entries[message_id] = (threading.Event(), time.perf_counter())
+                self.entries[message_id][0].set()
+                self.condition.notify_all()
+                return None
+
+            event, sent = self.entries[message_id]
+            if event.is_set():
+                return None
+
+            event.set()
+            self.condition.notify_all()
+
+        return time.perf_counter() - sent
+
+    def is_acked(self, message_id):
+        entry = self.entries.get(message_id)
+
+        return entry is not None and entry[0].is_set()
+
+    def wait(self, message_ids, timeout=None):
+        """ Waits for any of the messages to be acked, False on timeout. """
+        with self.condition:
+            return self.condition.wait_for(lambda: any(self.is_acked(message_id) for message_id in message_ids), timeout)
+
+    def _evict(self):
+        expired = time.perf_counter() - self.ttl
+
+        while self.entries:
+            message_id, (event, sent) = next(iter(self.entries.items()))
+            if sent > expired and len(self.entries) < self.max_entries:
+                break
+
+            del self.entries[message_id]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RetransmitTimer:
+    """
+    Retransmit timeout from the measured round trips, a smoothed round
+    trip plus four times its variation, doubled for every retransmission
+    of the same message.  Every copy of a message is its own mesh packet
+    with its own ack, so all the round trips can be used.
+    """
+
+    def __init__(self, initial=5., min_rto=1., max_rto=60.):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial
+
+    def sample(self, round_trip):
+        if self.srtt is None:
+            self.srtt = round_trip
+            self.rttvar = round_trip / 2
+        else:
+            self.rttvar = .75 * self.rttvar + .25 * abs(self.srtt - round_trip)
+            self.srtt = .875 * self.srtt + .125 * round_trip
+
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_rto), self.max_rto)
+
+    def backoff(self, rto):
+        return min(rto * 2, self.max_rto)
+
+
+class DuplicateFilter:
+    """
+    The last window sequence numbers seen from every sender, so the
+    retransmitted copies of a command are only acted on once.  A sender
+    picks a new session every time it starts, and its window starts
+    over with it, so a restarted sender's numbers are never taken for
+    repeats.  Numbers are also forgotten after ttl seconds without a
+    copy, for senders that don't send a session.
+    """
+
+    def __init__(self, window=64, ttl=300):
+        self.window = window
+        self.ttl = ttl
+
+        # sender: (session, {sequence: last seen}), oldest first
+        self.seen = {}
+
+    def is_duplicate(self, sender, sequence, session=None):
+        """ Records the sequence number, True if it was already seen in this session. """
+        now = time.monotonic()
+
+        if sender not in self.seen or self.seen[sender][0] != session:
+            self.seen[sender] = (session, {})
+
+        seen = self.seen[sender][1]
+
+        duplicate = sequence in seen and now - seen.pop(sequence) < self.ttl
+        seen[sequence] = now
+
+        while len(seen) > self.window:
+            del seen[next(iter(seen))]
+
+        return duplicate
+
+
+class RadioLink(threading.Thread):
+    """
+    Connection state machine of the radio, on its own thread so the
+    pubsub callbacks only ever hand a fault over.
+
+    A lost connection is reconnected with exponential backoff, starting at
+    first_delay and doubling up to max_delay between attempts.  Rebooting
+    the node is the last resort, after reconnects_before_reboot attempts
+    failed.  Commands sent while the link is down are queued and sent
+    once it is back, unless they are older than max_queue_age by then.
+
+    The state and the queue are only changed under lock, so a fault is
+    only acted on once.  The sends are serialized on send_lock instead,
+    so the commands go out one at a time and in order whichever thread
+    sends them, while a fault can still be handed over during a write
+    to the radio that blocks.
+    """
+
+    def __init__(self, comms, first_delay=.05, max_delay=5., connect_timeout=10, reconnects_before_reboot=5, max_queue_age=60):
+        super(RadioLink, self).__init__(name='radio', daemon=True)
+
+        self.comms = comms
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self.reconnects_before_reboot = reconnects_before_reboot
+        self.max_queue_age = max_queue_age
+
+        # Taken after send_lock when both are needed, never the other way around
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+        self.state = CONNECTING
+        self.fault = threading.Event()
+
+        self.faults = 0
+        self.fault_time = None
+        self.reboots = 0
+        self.reconnect_times = deque(maxlen=100)
+
+        # command, args, sequence, the message ids list to add to once sent and when it was queued
+        self.outgoing = deque()
+
+    @property
+    def is_up(self):
+        return self.state == CONNECTED
+
+    def set_state(self, state):
+        with self.lock:
+            self.state = state
+
+    def on_fault(self, force=False):
+        with self.lock:
+            # Only the first fault counts, the ones while recovering are part of it, unless forced by a failed reboot
+            if self.state != CONNECTED and not force:
+                return
+
+            logging.info('Radio connection lost')
+
+            self.state = RECONNECTING
+            self.comms.connected = False
+            self.comms.connection_event.clear()
+
+            self.faults += 1
+            self.fault_time = time.perf_counter()
+            self.fault.set()
+
+    def run(self):
+        while True:
+            self.fault.wait()
+            self.fault.clear()
+
+            self._recover()
+
+    def _recover(self):
+        delay = self.first_delay
+        attempts = 0
+
+        while True:
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+            attempts += 1
+            if attempts > self.reconnects_before_reboot:
+                attempts = 0
+                if self._reboot():
+                    break
+            elif self._reconnect():
+                break
+
+            logging.debug(f'Radio not back yet, next try in {delay:.2f} s')
+
+        reconnect_time = time.perf_counter() - self.fault_time
+        self.reconnect_times.append(reconnect_time)
+
+        logging.info(f'Radio reconnected in {reconnect_time:.2f} seconds')
+
+        self.connected()
+
+    def connected(self):
+        # Nothing is sent directly while there are commands queued, so they still go out first
+        self.set_state(CONNECTED)
+        self.flush()
+
+    def _reconnect(self):
+        try:
+            self.comms.interface.close()
+        except Exception as e:
+            logging.debug(f'Closing the old interface: {e}')
+
+        try:
+            self.comms.interface = meshtastic.serial_interface.SerialInterface()
+        except Exception as e:
+            logging.debug(f'Could not open the radio: {e}')
+            return False
+
+        return self.comms.connection_event.wait(self.connect_timeout)
+
+    def _reboot(self):
+        logging.info('Radio still not connected, rebooting the node')
+
+        self.set_state(REBOOTING)
+        self.reboots += 1
+
+        try:
+            self.comms.interface.localNode.reboot(secs=1)
+            return self.comms.connection_event.wait(REBOOT_TIMEOUT)
+        except Exception as e:
+            logging.debug(f'Could not reboot the node: {e}')
+            return False
+        finally:
+            self.set_state(RECONNECTING)
+
+    def send(self, command, args, sequence, message_ids=None):
+        """
+        Sends the command now if the link is up and nothing is queued
+        before it, otherwise queues it.  Returns the message id or None.
+        """
+        with self.send_lock:
+            with self.lock:
+                direct = self.is_up and not self.outgoing
+                if not direct:
+                    self._queue(command, args, sequence, message_ids)
+
+            if not direct:
+                self._flush()
+                return None
+
+            try:
+                message_id = self.comms._send(command, args, sequence)
+            except Exception as e:
+                logging.info(f'Could not send {command}: {e}')
+
+                self.on_fault()
+                self.queue(command, args, sequence, message_ids)
+                return None
+
+        if message_ids is not None:
+            message_ids.append(message_id)
+
+        return message_id
+
+    def queue(self, command, args, sequence, message_ids=None):
+        with self.lock:
+            self._queue(command, args, sequence, message_ids)
+
+    def _queue(self, command, args, sequence, message_ids):
+        # A retransmission of a command that is still waiting adds nothing
+        if any(queued[2] == sequence for queued in self.outgoing):
+            return
+
+        self.outgoing.append((command, args, sequence, message_ids, time.perf_counter()))
+
+        logging.info(f'Radio {self.state}, queued {command}')
+
+    def discard(self, sequence):
+        with self.lock:
+            self.outgoing = deque(queued for queued in self.outgoing if queued[2] != sequence)
+
+    def flush(self):
+        with self.send_lock:
+            self._flush()
+
+    def _flush(self):
+        # In the order they were queued.  A command only leaves the queue once it was sent, so one that
+        # can't be sent stays in front, and the radio is written to without holding the lock.
+        while True:
+            with self.lock:
+                if not self.is_up or not self.outgoing:
+                    return
+
+                entry = self.outgoing[0]
+                command, args, sequence, message_ids, queued = entry
+
+                if time.perf_counter() - queued > self.max_queue_age:
+                    logging.info(f'Dropping {command}, queued {time.perf_counter() - queued:.0f} seconds ago')
+                    self.outgoing.popleft()
+                    continue
+
+            try:
+                message_id = self.comms._send(command, args, sequence)
+            except Exception as e:
+                logging.info(f'Could not send {command}: {e}')
+
+                self.on_fault()
+                return
+
+            with self.lock:
+                # Unless it was discarded meanwhile
+                if self.outgoing and self.outgoing[0] is entry:
+                    self.outgoing.popleft()
+
+            if message_ids is not None:
+                message_ids.append(message_id)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'faults': self.faults,
+                'reboots': self.reboots,
+                'queued': len(self.outgoing),
+                'reconnect_s': {
+                    'last': self.reconnect_times[-1] if self.reconnect_times else None,
+                    'max': max(self.reconnect_times, default=None)
+                }
+            }
 
 
 class Comms:
-    def __init__(self, message_types, remoteid=None, display=None):
+    def __init__(self, message_types, remoteid=None, display=None, binary=False, size_metrics=False):
         self.message_types = message_types
         self.remoteid = remoteid
         self.display = display
 
+        # Sends the binary codec messages, JSON text otherwise.  Both are understood, but only by nodes
+        # that have the codec, so binary is only to be turned on once every node has been upgraded.
+        self.binary = binary
+
+        # Also works out how big every binary message would have been as JSON, for the metrics
+        self.size_metrics = size_metrics
+
+        # A new session every start, so the receivers forget the numbers from before it
+        self.session = random.randrange(0x10000)
+        self.sequence = random.randrange(0x10000)
+        self.duplicates = DuplicateFilter()
+
+        self.pending_acks = PendingAcks()
+        self.retransmit_timer = RetransmitTimer()
+        self.retransmissions = 0
+        self.round_trips = deque(maxlen=100)
+        self.message_sizes = deque(maxlen=100)
+
         pub.subscribe(self.on_receive, 'meshtastic.receive')
         pub.subscribe(self.on_connection, "meshtastic.connection.established")
         pub.subscribe(self.on_radio_fault, "meshtastic.connection.lost")
 
         self.connected = False
-        self.success_ids = []
+        self.connection_event = threading.Event()
+
+        self.link = RadioLink(self)
 
         self.interface = meshtastic.serial_interface.SerialInterface()
 
         self.wait_till_connected()
 
+        self.link.set_state(CONNECTED)
+        self.link.start()
+
         self.set_config()
 
     def reboot_meshnode(self):
         logging.info(f'Rebooting local mesh node')
-        self.interface.localNode.reboot(secs=1)
-
-        time.sleep(30)
 
-        self.wait_till_connected()
+        start = time.perf_counter()
 
-    def on_radio_fault(self, interface, topic=pub.AUTO_TOPIC):
-        time.sleep(10)
+        # The connection drops during a reboot on purpose, that isn't a fault
+        self.link.set_state(REBOOTING)
+        self.connected = False
+        self.connection_event.clear()
 
         try:
-            self.interface = meshtastic.serial_interface.SerialInterface()
-
-            self.wait_till_connected()
+            self.interface.localNode.reboot(secs=1)
 
-            self.reboot_meshnode()
+            # Connected again once the node is back up and has sent its config
+            back = self.connection_event.wait(REBOOT_TIMEOUT)
+            if not back:
+                logging.info(f'Mesh node not back after {REBOOT_TIMEOUT} seconds')
         except Exception as e:
-            logging.debug(f'Exception: {e}')
+            logging.info(f'Could not reboot the mesh node: {e}')
+            back = False
+
+        if not back:
+            # The RadioLink takes it from here
+            self.link.on_fault(force=True)
+            return False
+
+        logging.info(f'Mesh node rebooted in {time.perf_counter() - start:.1f} seconds')
+
+        self.link.connected()
+
+        return True
+
+    def on_radio_fault(self, interface, topic=pub.AUTO_TOPIC):
+        # Called on the pubsub thread, the RadioLink does the recovering
+        self.link.on_fault()
+
+    @staticmethod
+    def _apply(settings, desired):
+        # Sets whatever differs, returns what changed
+        changes = []
+        for name, value in desired.items():
+            current = getattr(settings, name)
+            if current != value:
+                changes.append(f'{name}: {current} -> {value}')
+                setattr(settings, name, value)
+
+        return changes
 
     def set_config(self):
-        # logging.info(self.interface.localNode.radioConfig)
-        # logging.info(dir(self.interface.localNode.channels))
-        self.interface.localNode.radioConfig.preferences.is_low_power = False
-        self.interface.localNode.radioConfig.preferences.is_router = False
-
-        self.interface.localNode.channels[0].settings.modem_config = 0
-
-        self.interface.localNode.radioConfig.preferences.position_broadcast_secs = 300
-        self.interface.localNode.radioConfig.preferences.gps_attempt_time = 300
-        self.interface.localNode.radioConfig.preferences.gps_update_interval = 300
-        self.interface.localNode.radioConfig.preferences.send_owner_interval = 10
-        self.interface.localNode.radioConfig.preferences.wait_bluetooth_secs = 60
-        self.interface.localNode.radioConfig.preferences.screen_on_secs = 900
-        self.interface.localNode.radioConfig.preferences.phone_timeout_secs = 900
-        self.interface.localNode.radioConfig.preferences.phone_sds_timeout_sec = 7200
-        self.interface.localNode.radioConfig.preferences.mesh_sds_timeout_secs = 7200
-        self.interface.localNode.radioConfig.preferences.sds_secs = 31536000
-        self.interface.localNode.radioConfig.preferences.ls_secs = 3600
-
-        self.interface.localNode.channels[0].settings.tx_power = 0
+        """ Writes the radio config and reboots the node, only if it isn't already set up. """
+        changes = self._apply(self.interface.localNode.radioConfig.preferences, RADIO_PREFERENCES)
+        changes += self._apply(self.interface.localNode.channels[0].settings, CHANNEL_SETTINGS)
+
+        if not changes:
+            logging.info('Radio config already up to date')
+            return False
+
+        logging.info(f'Radio config changes: {", ".join(changes)}')
 
         self.interface.localNode.writeConfig()
 
@@ -74,17 +519,19 @@ class Comms:
 
         self.reboot_meshnode()
 
+        return True
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.interface.close()
 
     def wait_till_connected(self):
-        while not self.connected:
-            time.sleep(1)
+        self.connection_event.wait()
 
         logging.info('Meshtastic comms successfully connected')
 
     def on_connection(self, interface, topic=pub.AUTO_TOPIC):
         self.connected = True
+        self.connection_event.set()
 
     def wait_for_ack(self, message_ids, timeout=1):
         message = [
@@ -93,19 +540,17 @@ class Comms:
             '...'
         ]
 
-        start_time = time.time()
+        deadline = time.perf_counter() + timeout
 
+        # Returns as soon as an ack arrives, the slices only keep the display ticking over
         count = 0
-        while all(message_id not in self.success_ids for message_id in message_ids):
-            time.sleep(0.1)
+        while not self.pending_acks.wait(message_ids, min(.5, max(deadline - time.perf_counter(), 0))):
+            if time.perf_counter() >= deadline:
+                return False
 
             count += 1
-            if count % 2000:
-                if self.display:
-                    self.display.add_message(message[count % 3])
-
-            if time.time() > start_time + timeout:
-                return False
+            if self.display:
+                self.display.add_message(message[count % 3])
 
         return True
 
@@ -113,34 +558,151 @@ class Comms:
         logging.debug(f'Received: {packet}')
 
         if 'priority' in packet and packet['priority'] == 'ACK':
-            self.success_ids.append(packet['decoded']['requestId'])
+            request_id = packet['decoded']['requestId']
 
-        if 'decoded' in packet and 'text' in packet['decoded']:
+            round_trip = self.pending_acks.ack(request_id)
+            if round_trip is not None:
+                self.round_trips.append(round_trip)
+                self.retransmit_timer.sample(round_trip)
+                logging.debug(f'Ack for {request_id} after {round_trip * 1000:.0f} ms')
+
+        if 'decoded' in packet and packet['decoded'].get('portnum') == 'PRIVATE_APP' and 'payload' in packet['decoded']:
             logging.info(f'packet: {packet}')
-            self.parse_message(packet['decoded']['text'], packet['id'])
+            self.parse_message(packet['decoded']['payload'], packet['id'], packet.get('from'))
+
+        elif 'decoded' in packet and 'text' in packet['decoded']:
+            logging.info(f'packet: {packet}')
+            self.parse_message(packet['decoded']['text'], packet['id'], packet.get('from'))
+
+    def next_sequence(self):
+        self.sequence = (self.sequence + 1) & 0xFFFF
+
+        return self.sequence
 
-    def send_message(self, command, args=None):
+    def send_message(self, command, args=None, sequence=None, message_ids=None):
+        """
+        Sends the command once, the copies of a command are sent with the
+        same sequence number.  The message id is added to message_ids when
+        given.  While the radio is down the command is queued instead and
+        None is returned, it is sent once the radio is back.
+        """
+        if sequence is None:
+            sequence = self.next_sequence()
+
+        # Through the link, so it can't overtake the queued commands or a flush on another thread
+        return self.link.send(command, args, sequence, message_ids)
+
+    def _send(self, command, args, sequence):
+        json_size = None
+
+        if self.binary:
+            data = codec.encode(self.remoteid, command, sequence, args or None, self.session)
+
+            message_id = self.interface.sendData(
+                data,
+                portNum=portnums_pb2.PortNum.PRIVATE_APP,
+                wantAck=True,
+                wantResponse=False
+            ).id
+
+            # Only to compare the sizes, the JSON isn't made for nothing on every send
+            if self.size_metrics or logging.getLogger().isEnabledFor(logging.DEBUG):
+                json_size = len(self._json(command, args, sequence))
+        else:
+            text = self._json(command, args, sequence)
+            data = text.encode()
+            json_size = len(text)
+
+            message_id = self.interface.sendText(
+                text=text,
+                wantAck=True,
+                wantResponse=False
+            ).id
+
+        logging.debug(f'Sent {command} as {len(data)} bytes, {json_size} as JSON')
+
+        self.message_sizes.append((len(data), json_size))
+
+        self.pending_acks.track(message_id)
+
+        return message_id
+
+    def _json(self, command, args, sequence):
         message = {
             'remoteid': self.remoteid,
-            'command': command
+            'command': command,
+            'sequence': sequence,
+            'session': self.session
         }
 
         if args:
             message['args'] = args
 
-        message_id = self.interface.sendText(
-            text=json.dumps(message),
-            wantAck=True,
-            wantResponse=False
-        ).id
+        return json.dumps(message)
 
-        return message_id
+    def send_reliable(self, command, args=None, keep_trying=None, timeout=None):
+        """
+        Sends the command until a copy of it is acked, waiting the
+        retransmit timeout between copies.  Gives up, returning False, once
+        keep_trying() is False or after timeout seconds.
+        """
+        sequence = self.next_sequence()
+        deadline = None if timeout is None else time.perf_counter() + timeout
 
-    def parse_message(self, message, message_id):
-        try:
-            message_json = json.loads(message)
-        except json.decoder.JSONDecodeError:
-            return False
+        rto = self.retransmit_timer.rto
+
+        # Copies sent from the outgoing queue once the radio is back are added to it too
+        message_ids = []
+        self.send_message(command, args, sequence, message_ids)
+
+        while not self.wait_for_ack(message_ids, rto if deadline is None else min(rto, max(deadline - time.perf_counter(), 0))):
+            if (keep_trying and not keep_trying()) or (deadline is not None and time.perf_counter() >= deadline):
+                # Not to be sent later on, after whatever is sent instead
+                self.link.discard(sequence)
+                return False
+
+            rto = self.retransmit_timer.backoff(rto)
+            self.retransmissions += 1
+
+            logging.info(f'No ack for {command}, sending it again, next try in {rto:.1f} s')
+            self.send_message(command, args, sequence, message_ids)
+
+        return True
+
+    def metrics(self):
+        round_trips = [round_trip * 1000 for round_trip in self.round_trips]
+        json_sizes = [json_size for size, json_size in self.message_sizes if json_size is not None]
+
+        return {
+            'messages': len(self.message_sizes),
+            'retransmissions': self.retransmissions,
+            'rto_s': self.retransmit_timer.rto,
+            'encoded_bytes': statistics.mean(size for size, json_size in self.message_sizes) if self.message_sizes else 0,
+            'json_bytes': statistics.mean(json_sizes) if json_sizes else None,
+            'round_trip_ms': {
+                'count': len(round_trips),
+                'p50': statistics.median(round_trips) if round_trips else 0.,
+                'max': max(round_trips, default=0.)
+            },
+            'link': self.link.metrics()
+        }
+
+    def parse_message(self, message, message_id, sender=None):
+        if codec.is_binary(message):
+            try:
+                message_json = codec.decode(message)
+            except codec.CodecError as e:
+                logging.info(f'Could not decode message {message_id}: {e}')
+                return False
+
+            if message_json['args'] is None:
+                del message_json['args']
+
+        else:
+            try:
+                message_json = json.loads(message)
+            except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+                return False
 
         logging.info(f'message_json: {message_json}')
 
@@ -149,10 +711,17 @@ class Comms:
 
             logging.debug(f'message_command: {message_command}')
 
+            # The radio acks every copy, only the first one is acted on
+            sequence = message_json.get('sequence')
+            if sequence is not None and self.duplicates.is_duplicate(sender, sequence, message_json.get('session')):
+                logging.info(f'Ignoring a repeated {message_command}, sequence {sequence}')
+                return True
+
             if message_command in self.message_types:
                 message_args = {
                     'message_id': message_id,
-                    'message_command': message_command
+                    'message_command': message_command,
+                    'sequence': sequence
                 }
 
                 if 'args' in message_json:
@@ -5,7 +5,7 @@ from common.comms import Comms
 
 
 class LaunchControl:
-    def __init__(self, remoteid, display=None, relays=None, buttons=None):
+    def __init__(self, remoteid, display=None, relays=None, buttons=None, binary=False):
         self.current_state = 'safe'
         self.filling = False
         self.dumping = False
@@ -27,7 +27,7 @@ class LaunchControl:
         self.gpio.all_relays_off()
 
         self.display = display
-        self.comms = Comms(message_types, remoteid=remoteid, display=display)
+        self.comms = Comms(message_types, remoteid=remoteid, display=display, binary=binary)
 
 
     def send_start_cameras(self):
@@ -42,14 +42,10 @@ class LaunchControl:
 
     def send_ready(self):
         logging.info(f'Sending Ready Command')
-        message_ids = [self.comms.send_message(command='ready')]
 
-        while not self.comms.wait_for_ack(message_ids, timeout=60):
-            message_ids.append(self.comms.send_message(command='ready'))
-
-            if not self.gpio.is_button_on('ready'):
-                self.send_safe()
-                return False
+        if not self.comms.send_reliable(command='ready', keep_trying=lambda: self.gpio.is_button_on('ready')):
+            self.send_safe()
+            return False
 
         return True
 
@@ -59,11 +55,7 @@ class LaunchControl:
 
     def send_safe(self):
         logging.info(f'Sending safe command.')
-        message_ids = [self.comms.send_message(command='safe')]
-
-        while not self.comms.wait_for_ack(message_ids, timeout=60):
-            logging.info('Waiting for safe...')
-            message_ids.append(self.comms.send_message(command='safe'))
+        self.comms.send_reliable(command='safe')
 
         logging.info('Safe...')
         self.display.add_message('SAFE')
@@ -71,29 +63,19 @@ class LaunchControl:
 
     def send_launch(self):
         logging.info('Sending Launch command!')
-        message_ids = [self.comms.send_message(command='launch')]
 
-        while not self.comms.wait_for_ack(message_ids, timeout=60):
-            logging.info('Waiting for launch...')
-            message_ids.append(self.comms.send_message(command='launch'))
-
-            if not self.gpio.is_button_on('ready'):
-                self.send_safe()
-                return False
+        if not self.comms.send_reliable(command='launch', keep_trying=lambda: self.gpio.is_button_on('ready')):
+            self.send_safe()
+            return False
 
         return True
 
     def send_post_launch(self):
         logging.info('Sending Post Launch command.')
-        message_ids = [self.comms.send_message(command='post-launch')]
-
-        while not self.comms.wait_for_ack(message_ids, timeout=60):
-            logging.info('Waiting for post launch...')
-            message_ids.append(self.comms.send_message(command='post-launch'))
 
-            if not self.gpio.is_button_on('ready'):
-                self.send_safe()
-                return False
+        if not self.comms.send_reliable(command='post-launch', keep_trying=lambda: self.gpio.is_button_on('ready')):
+            self.send_safe()
+            return False
 
         return True
 
@@ -0,0 +1,163 @@
+import queue
+import logging
+import multiprocessing
+
+import numpy as np
+
+from time import sleep
+from multiprocessing import shared_memory
+
+from usb1 import USBError
+from datalogger.libraries.mccUSB import OverrunError, table
+from datalogger.libraries.ring_buffer import RingBuffer
+
+
+class SharedRingBuffer(RingBuffer):
+    """
+    RingBuffer whose scans and cursors live in shared memory, so the
+    producer and the consumer can be in different processes.
+    """
+
+    def __init__(self, capacity, nchan, dtype=np.uint16, name=None, condition=None):
+        dtype = np.dtype(dtype)
+        state_size = 6 * np.dtype(np.int64).itemsize
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=state_size + capacity * nchan * dtype.itemsize)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        state = np.ndarray((6,), dtype=np.int64, buffer=self.shm.buf)
+        buffer = np.ndarray((capacity, nchan), dtype=dtype, buffer=self.shm.buf, offset=state_size)
+
+        if self.owner:
+            state[:] = 0
+
+        if condition is None:
+            condition = multiprocessing.Condition()
+
+        super(SharedRingBuffer, self).__init__(capacity, nchan, dtype, buffer, state, condition)
+
+    def __reduce__(self):
+        # Attach to the same shared memory when handed to a spawned process
+        return SharedRingBuffer, (self.capacity, self.nchan, self.buffer.dtype, self.shm.name, self.condition)
+
+    def __del__(self):
+        # The numpy views have to go before the shared memory can be closed
+        self.buffer = None
+        self.state = None
+
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (AttributeError, BufferError, FileNotFoundError):
+            pass
+
+
+class AcquisitionProcess(multiprocessing.Process):
+    """
+    Runs the USB side of the DataLogger in its own process.  It opens the
+    device, waits for the green switch, runs the scan and publishes the
+    raw scans in a SharedRingBuffer, so nothing done with the data in the
+    DataLogger process can hold up the USB reads.
+
+    The ring buffer is closed when the green switch goes off or the scan
+    overruns, and closing it from the DataLogger stops the scan.
+    """
+
+    def __init__(self, device, ring, frequency, nchan, channels, options, batch_exp, stream_transfers):
+        super(AcquisitionProcess, self).__init__(name='acquisition', daemon=True)
+
+        self.device = device
+        self.ring = ring
+        self.frequency = frequency
+        self.nchan = nchan
+        self.channels = channels
+        self.options = options
+        self.batch_exp = batch_exp
+        self.stream_transfers = stream_transfers
+
+        # Calibration table of the device, sent back once it is open
+        self.calibration = multiprocessing.Queue(1)
+        self.started = multiprocessing.Event()
+
+    def get_calibration(self):
+        while True:
+            try:
+                return [self._table(slope, intercept) for slope, intercept in self.calibration.get(timeout=.1)]
+            except queue.Empty:
+                if not self.is_alive():
+                    raise IOError('Acquisition process exited before opening the device')
+
+    @staticmethod
+    def _table(slope, intercept):
+        calibration = table()
+        calibration.slope = slope
+        calibration.intercept = intercept
+
+        return calibration
+
+    def wait_till_started(self):
+        while not self.started.wait(.1):
+            if not self.is_alive():
+                raise IOError('Acquisition process exited before starting the scan')
+
+    def write_scans(self, raw_data):
+        if not self.ring.write(raw_data):
+            logging.info(f'Ring buffer full, dropped {self.ring.overflows} batches so far')
+
+    def run(self):
+        usb20x = self.device()
+        stream = self.stream_transfers > 0
+
+        try:
+            usb20x.AInScanStop()
+            usb20x.AInScanClearFIFO()
+
+            self.calibration.put([(calibration.slope, calibration.intercept) for calibration in usb20x.table_AIn])
+
+            while not usb20x.DPort():
+                if self.ring.closed:
+                    return
+
+                sleep(.1)
+
+            usb20x.AInScanStart(0, self.frequency * self.nchan, self.channels, self.options, usb20x.NO_TRIGGER, usb20x.LEVEL_HIGH)
+
+            if stream:
+                usb20x.AInScanStream(2**self.batch_exp, self.write_scans, self.stream_transfers, as_array=True)
+
+            self.started.set()
+
+            while not self.ring.closed:
+                try:
+                    if stream:
+                        usb20x.AInScanStreamHandleEvents()
+                    else:
+                        self.write_scans(usb20x.AInScanRead(2**self.batch_exp, as_array=True))
+
+                    if not usb20x.DPort():
+                        logging.debug('Stopping due to stop flag trigger going low...')
+                        break
+
+                except USBError as e:
+                    if e.value == -7 or e.value == -4:
+                        # Normal, the device is probably waiting for a trigger
+                        logging.info(f'USB Timeout occurred, probably waiting for trigger')
+                    else:
+                        raise
+                except OverrunError:
+                    logging.info('Scan Overrun, stopping')
+                    break
+
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+        finally:
+            if stream:
+                usb20x.AInScanStreamStop()
+
+            usb20x.AInScanStop()
+            self.ring.close()
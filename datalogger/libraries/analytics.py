@@ -0,0 +1,307 @@
+import numpy as np
+
+
+def impulse_letter(impulse):
+    motor_codes = [
+        ('1/8A', 0.3125),
+        ('1/4A', 0.625),
+        ('1/2A', 1.25),
+        ('A', 2.5),
+        ('B', 5),
+        ('C', 10),
+        ('D', 20),
+        ('E', 40),
+        ('F', 80),
+        ('G', 160),
+        ('H', 320),
+        ('I', 640),
+        ('J', 1280),
+        ('K', 2560),
+        ('L', 5120),
+        ('M', 10240),
+        ('N', 20480),
+        ('O', 40960)
+    ]
+
+    motor_codes.reverse()
+
+    for index, (code, max_impulse) in enumerate(motor_codes):
+        if impulse > max_impulse:
+            return motor_codes[index - 1][0]
+
+    return 'Unknown'
+
+
+class BurnAnalytics:
+    """
+    Works out the burn stats of the load cell while the data comes in, so
+    they are ready as soon as the run is over.
+
+    It follows the same rules as the post-test analysis: the baseline is
+    the minimum of the 2nd second, the peak is the maximum without the
+    first and last second, the burn starts at the first sample above 10%
+    of the way from the baseline to the peak and ends at the last sample
+    above 5% of the way from the minimum of the second to last second to
+    the peak.  The impulse and average thrust are taken over the samples
+    in between, zeroed to the baseline and clipped at zero.
+
+    Neither threshold is known before the run is over, so the samples that
+    could still turn out to be the start or end crossing are kept as
+    candidates: the first crossing of any threshold is a running maximum
+    record and the last crossing is a maximum of everything after it.
+    Together with a cumulative sum of the thrust at every candidate, this
+    keeps the memory to a couple of seconds of samples and the candidates,
+    however long the run is.
+    """
+
+    def __init__(self, frequency):
+        self.frequency = int(frequency)
+        self.sample_time = 1 / frequency
+
+        self.count = 0
+        self.head = []
+        self.baseline = None
+
+        # The last two seconds, for the peak and the minimum of the second to last second
+        self.tail = np.empty(0)
+        self.peak = -np.inf
+        self.peak_count = self.frequency
+
+        # Cumulative clipped thrust and the last two samples of it
+        self.total = 0.
+        self.last_thrust = (0., 0.)
+        self.first_thrust = None
+
+        # Start candidates: index, value, cumulative thrust up to it and the thrust of the next sample
+        self.records = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0))
+        self.record_max = -np.inf
+
+        # End candidates: index, value, cumulative thrust up to the sample before it and the thrust of that sample
+        self.stack = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+
+        self.count += len(values)
+        self._update_tail(values)
+
+        if self.baseline is None:
+            # The baseline is only known after the first two seconds
+            self.head.append(values)
+
+            if self.count >= 2 * self.frequency:
+                head = np.concatenate(self.head)
+                self.head = []
+
+                self.baseline = head[self.frequency:2 * self.frequency].min()
+                self._update_candidates(head)
+
+            return
+
+        self._update_candidates(values)
+
+    def _update_tail(self, values):
+        tail = np.concatenate([self.tail, values])
+        tail_start = self.count - len(tail)
+
+        # Samples are only part of the peak once they are out of the last second
+        peak_stop = self.count - self.frequency
+        if peak_stop > self.peak_count:
+            self.peak = max(self.peak, tail[self.peak_count - tail_start:peak_stop - tail_start].max())
+            self.peak_count = peak_stop
+
+        self.tail = tail[-2 * self.frequency:]
+
+    def _update_candidates(self, values):
+        start = self.count - len(values)
+        index = np.arange(start, start + len(values))
+
+        thrust = np.clip(values - self.baseline, 0, None)
+        cumulative = self.total + np.cumsum(thrust)
+
+        previous_thrust = np.concatenate([[self.last_thrust[1]], thrust[:-1]])
+        next_thrust = np.concatenate([thrust[1:], [np.nan]])
+
+        if self.first_thrust is None:
+            self.first_thrust = (cumulative[0], next_thrust[0])
+
+        # The next sample of a record at the end of the last batch is this one
+        record_index, record_value, record_cumulative, record_next = self.records
+        if len(record_index) and record_index[-1] == start - 1:
+            record_next[-1] = thrust[0]
+
+        running_max = np.maximum.accumulate(values)
+        is_record = values > np.maximum(self.record_max, np.concatenate([[-np.inf], running_max[:-1]]))
+        self.record_max = max(self.record_max, running_max[-1])
+
+        self.records = tuple(
+            np.concatenate([old, new[is_record]])
+            for old, new in zip(self.records, (index, values, cumulative, next_thrust))
+        )
+
+        # Records at or below the start threshold so far can't be the start, the threshold only goes up
+        if self.peak > -np.inf:
+            keep = self.records[1] > self.baseline + .1 * (self.peak - self.baseline)
+            self.records = tuple(candidate[keep] for candidate in self.records)
+
+        suffix_max = np.maximum.accumulate(values[::-1])[::-1]
+        is_suffix_max = values > np.concatenate([suffix_max[1:], [-np.inf]])
+
+        keep = self.stack[1] > suffix_max[0]
+        self.stack = tuple(
+            np.concatenate([old[keep], new[is_suffix_max]])
+            for old, new in zip(self.stack, (index, values, cumulative - thrust, previous_thrust))
+        )
+
+        self.total = cumulative[-1]
+        self.last_thrust = (thrust[-2] if len(thrust) > 1 else self.last_thrust[1], thrust[-1])
+
+    def results(self):
+        if not self.count:
+            return None
+
+        if self.baseline is None:
+            # A run shorter than two seconds, the baseline is the minimum of what there is
+            head = np.concatenate(self.head)
+            self.head = []
+
+            self.baseline = head[self.frequency:2 * self.frequency].min() if len(head) > self.frequency else head.min()
+            self._update_candidates(head)
+
+        peak = self.peak
+        if peak == -np.inf:
+            peak = self.tail.max()
+
+        ending = self.tail[:-self.frequency] if len(self.tail) > self.frequency else self.tail
+        ending_min = ending.min()
+
+        # Start of the burn, the first sample over the threshold
+        start_threshold = self.baseline + .1 * (peak - self.baseline)
+
+        record_index, record_value, record_cumulative, record_next = self.records
+        crossed = np.flatnonzero(record_value > start_threshold)
+        if len(crossed):
+            start = record_index[crossed[0]]
+            start_cumulative = record_cumulative[crossed[0]]
+            start_next = record_next[crossed[0]]
+        else:
+            start = 0
+            start_cumulative, start_next = self.first_thrust
+
+        # End of the burn, the last sample over the threshold at least 10 ms after the start
+        end_threshold = ending_min + .05 * (peak - ending_min)
+
+        stack_index, stack_value, stack_cumulative, stack_previous = self.stack
+        crossed = np.flatnonzero((stack_value > end_threshold) & (stack_index > start + .01 * self.frequency))
+        if len(crossed):
+            end = stack_index[crossed[-1]]
+            end_cumulative = stack_cumulative[crossed[-1]]
+            end_previous = stack_previous[crossed[-1]]
+        else:
+            end = self.count - 1
+            end_cumulative = self.total - self.last_thrust[1]
+            end_previous = self.last_thrust[0]
+
+        # Trapezoidal impulse and mean over the samples between the start and the end
+        samples = end - start - 1
+        impulse = 0.
+        average_thrust = 0.
+        if samples > 0:
+            thrust = end_cumulative - start_cumulative
+            impulse = (thrust - (start_next + end_previous) / 2) * self.sample_time
+            average_thrust = thrust / samples
+
+        return {
+            'baseline': self.baseline,
+            'peak': peak,
+            'impulse': impulse,
+            'average_thrust': average_thrust,
+            'start_timestamp': (start + 1) * self.sample_time,
+            'end_timestamp': (end + 1) * self.sample_time,
+            'burn_time': (end - start) * self.sample_time
+        }
+
+
+class BurnAnalysis:
+    """
+    The post-test analysis of a whole load cell series.  The baseline,
+    peak, start and end are found once, with the same rules as
+    BurnAnalytics, and the stats and cleaned up data all come from them.
+    """
+
+    def __init__(self, values, frequency):
+        values = np.asarray(values, dtype=np.float64)
+
+        self.frequency = int(frequency)
+        self.sample_time = 1 / frequency
+
+        f = self.frequency
+
+        # Discard the 1st and last second in case it's a 'dirty' signal, as long as there is anything left
+        self.baseline = self._or_all(values[f:2 * f], values).min()
+        self.peak = self._or_all(values[f:-f], values).max()
+        ending_min = self._or_all(values[-2 * f:-f], values).min()
+
+        start_threshold = self.baseline + .1 * (self.peak - self.baseline)
+        crossed = values > start_threshold
+        self.start = int(np.argmax(crossed)) if crossed.any() else 0
+
+        # The end has to be at least 10 ms after the start
+        end_threshold = ending_min + .05 * (self.peak - ending_min)
+        first_end = self.start + int(np.floor(.01 * f)) + 1
+        crossed = values[first_end:] > end_threshold
+        self.end = first_end + len(crossed) - 1 - int(np.argmax(crossed[::-1])) if crossed.any() else len(values) - 1
+
+        thrust = np.clip(values[self.start + 1:self.end] - self.baseline, 0, None)
+
+        self.impulse = 0.
+        self.average_thrust = 0.
+        if len(thrust):
+            self.impulse = (thrust.sum() - (thrust[0] + thrust[-1]) / 2) * self.sample_time
+            self.average_thrust = thrust.mean()
+
+    @staticmethod
+    def _or_all(part, values):
+        return part if len(part) else values
+
+    @property
+    def start_timestamp(self):
+        return (self.start + 1) * self.sample_time
+
+    @property
+    def end_timestamp(self):
+        return (self.end + 1) * self.sample_time
+
+    @property
+    def burn_time(self):
+        return (self.end - self.start) * self.sample_time
+
+    def results(self):
+        return {
+            'baseline': self.baseline,
+            'peak': self.peak,
+            'impulse': self.impulse,
+            'average_thrust': self.average_thrust,
+            'start_timestamp': self.start_timestamp,
+            'end_timestamp': self.end_timestamp,
+            'burn_time': self.burn_time
+        }
+
+    def clean(self, df, offset_sec=0, load_cell='Load Cell'):
+        """
+        The rows of df from offset_sec before the start to offset_sec after
+        the end of the burn, with the load cell zeroed and the index in
+        seconds from the start.
+        """
+        index = df.index.to_numpy()
+
+        first = np.searchsorted(index, self.start_timestamp - offset_sec, side='right')
+        last = np.searchsorted(index, self.end_timestamp + offset_sec, side='left')
+
+        df_clean = df.iloc[first:last].copy()
+        df_clean[load_cell] -= self.baseline
+        df_clean.index = np.round(index[first:last] - self.start_timestamp, 4)
+
+        return df_clean
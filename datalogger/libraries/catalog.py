@@ -0,0 +1,229 @@
+import os
+import json
+import logging
+import sqlite3
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from datetime import datetime
+
+from datalogger.libraries.analytics import BurnAnalysis, impulse_letter
+from datalogger.libraries.journal import JournalReader, JOURNAL_NAME
+
+CATALOG_NAME = 'catalog.sqlite'
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_dir TEXT PRIMARY KEY,
+    timestamp_label TEXT,
+    started TEXT,
+    frequency REAL,
+    nchan INTEGER,
+    scans INTEGER,
+    duration REAL,
+    sensors TEXT,
+    motor TEXT,
+    motor_class TEXT,
+    impulse REAL,
+    average_thrust REAL,
+    burn_time REAL,
+    start_timestamp REAL,
+    end_timestamp REAL,
+    files TEXT,
+    cataloged TEXT
+);
+
+CREATE TABLE IF NOT EXISTS peaks (
+    run_dir TEXT REFERENCES runs(run_dir) ON DELETE CASCADE,
+    sensor_name TEXT,
+    units TEXT,
+    min REAL,
+    max REAL,
+    mean REAL,
+    PRIMARY KEY (run_dir, sensor_name)
+);
+
+CREATE INDEX IF NOT EXISTS runs_motor_class ON runs(motor_class);
+CREATE INDEX IF NOT EXISTS peaks_sensor_max ON peaks(sensor_name, max);
+"""
+
+
+def run_record(run_dir, df, frequency, sensors=None, analysis=None):
+    """
+    The catalog entry of a run from its converted data.  sensors is the
+    sensor config snapshot of the run, when there is one.
+    """
+    run_dir = os.path.abspath(run_dir)
+    timestamp_label = os.path.basename(run_dir)
+
+    try:
+        started = datetime.strptime(timestamp_label, '%y-%b-%d_%H:%M:%S').isoformat()
+    except ValueError:
+        started = None
+
+    if analysis is None and 'Load Cell' in df and len(df):
+        analysis = BurnAnalysis(df['Load Cell'].to_numpy(), frequency)
+
+    units = {}
+    for sensor_id, sensor in (sensors or {}).items():
+        units[sensor['sensor_name']] = sensor.get('units')
+
+    values = df.to_numpy(dtype=np.float64)
+    peaks = []
+    if len(values):
+        for name, sensor_min, sensor_max, sensor_mean in zip(df.columns, values.min(axis=0), values.max(axis=0), values.mean(axis=0)):
+            peaks.append((name, units.get(name), float(sensor_min), float(sensor_max), float(sensor_mean)))
+
+    record = {
+        'run_dir': run_dir,
+        'timestamp_label': timestamp_label,
+        'started': started,
+        'frequency': frequency,
+        'nchan': len(df.columns),
+        'scans': len(df),
+        'duration': len(df) / frequency,
+        'sensors': json.dumps(sensors) if sensors else None,
+        'motor': None,
+        'motor_class': None,
+        'impulse': None,
+        'average_thrust': None,
+        'burn_time': None,
+        'start_timestamp': None,
+        'end_timestamp': None,
+        'files': json.dumps(sorted(os.listdir(run_dir))),
+        'peaks': peaks
+    }
+
+    if analysis:
+        results = analysis.results()
+        record.update({
+            'motor': f'{impulse_letter(results["impulse"])}{int(results["average_thrust"])}',
+            'motor_class': impulse_letter(results['impulse']),
+            'impulse': results['impulse'],
+            'average_thrust': results['average_thrust'],
+            'burn_time': results['burn_time'],
+            'start_timestamp': results['start_timestamp'],
+            'end_timestamp': results['end_timestamp']
+        })
+
+    return record
+
+
+def read_run(run_dir):
+    """
+    Catalog entry of a run directory, from the journal or from the CSV
+    files of the runs logged before it.  None if it isn't a run.
+    """
+    try:
+        if os.path.exists(f'{run_dir}/{JOURNAL_NAME}'):
+            journal = JournalReader(f'{run_dir}/{JOURNAL_NAME}')
+            return run_record(run_dir, journal.get_data(), journal.frequency, journal.header['sensors'])
+
+        if os.path.exists(f'{run_dir}/converted_data.csv'):
+            df = pd.read_csv(f'{run_dir}/converted_data.csv', index_col=0)
+            frequency = round(1 / np.median(np.diff(df.index.to_numpy()))) if len(df) > 1 else 1
+            return run_record(run_dir, df, frequency)
+
+    except Exception as e:
+        logging.info(f'Could not read {run_dir}: {e}')
+
+    return None
+
+
+class RunCatalog:
+    """
+    SQLite index of the runs under a data directory: when and how they
+    were logged, the burn stats, the peaks of every sensor and the files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(_schema)
+
+    def add(self, record):
+        record = dict(record)
+        peaks = record.pop('peaks')
+        record['cataloged'] = datetime.now().isoformat()
+
+        columns = ', '.join(record)
+        placeholders = ', '.join(f':{column}' for column in record)
+
+        with self.connection:
+            self.connection.execute(f'INSERT OR REPLACE INTO runs ({columns}) VALUES ({placeholders})', record)
+            self.connection.execute('DELETE FROM peaks WHERE run_dir = ?', (record['run_dir'],))
+            self.connection.executemany(
+                'INSERT INTO peaks (run_dir, sensor_name, units, min, max, mean) VALUES (?, ?, ?, ?, ?, ?)',
+                [(record['run_dir'], *peak) for peak in peaks]
+            )
+
+    def runs(self, motor_class=None, min_impulse=None, since=None, peaks=()):
+        """
+        The runs matching every filter, newest first.  peaks are
+        (sensor_name, operator, value) tuples, e.g. ('Chamber Pressure', '>', 500).
+        """
+        where = []
+        params = []
+
+        if motor_class:
+            where.append('runs.motor_class = ?')
+            params.append(motor_class)
+
+        if min_impulse is not None:
+            where.append('runs.impulse >= ?')
+            params.append(min_impulse)
+
+        if since:
+            where.append('runs.started >= ?')
+            params.append(since)
+
+        for sensor_name, operator, value in peaks:
+            if operator not in ('>', '>=', '<', '<='):
+                raise ValueError(f'Unknown operator {operator}')
+
+            # Above a value is about the max of the sensor, below it about the min
+            column = 'max' if operator in ('>', '>=') else 'min'
+
+            where.append(f'EXISTS (SELECT 1 FROM peaks WHERE peaks.run_dir = runs.run_dir AND peaks.sensor_name = ? AND peaks.{column} {operator} ?)')
+            params.extend([sensor_name, value])
+
+        sql = 'SELECT * FROM runs'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY started DESC'
+
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def peaks(self, run_dir):
+        return {row['sensor_name']: dict(row) for row in self.connection.execute('SELECT * FROM peaks WHERE run_dir = ?', (run_dir,))}
+
+    def backfill(self, data_dir, processes=None, force=False):
+        """
+        Catalogs the run directories under data_dir, reading them in a
+        process pool.  Runs already in the catalog are skipped unless forced.
+        """
+        known = {row['run_dir'] for row in self.connection.execute('SELECT run_dir FROM runs')}
+
+        run_dirs = []
+        for name in sorted(os.listdir(data_dir)):
+            run_dir = os.path.abspath(f'{data_dir}/{name}')
+            if os.path.isdir(run_dir) and (force or run_dir not in known):
+                run_dirs.append(run_dir)
+
+        added = 0
+        with multiprocessing.Pool(processes) as pool:
+            for record in pool.imap_unordered(read_run, run_dirs):
+                if record:
+                    self.add(record)
+                    added += 1
+                    logging.info(f'Cataloged {record["timestamp_label"]}')
+
+        return added
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,36 @@
+import json
+
+
+def attach_formulas(config):
+    for sensor_id, sensor in config.items():
+        if sensor['sensor_type'] == 'loadcell':
+            sensor['formula'] = lambda v: v
+        if sensor['sensor_type'] == 'temp':
+            sensor['formula'] = lambda v: (v - 1.25) / 0.005
+        if sensor['sensor_type'] == 'pressure':
+            sensor['formula'] = lambda v, max_psi: (v / 4) * max_psi
+        else:
+            Exception('Unknown sensor type')
+
+    return config
+
+
+def load_config(config_file_name='sensors.json'):
+    with open(config_file_name) as config_file:
+        config = json.load(config_file)
+
+        return attach_formulas(config)
+
+
+def save_config(sensors, config_file_name='sensors.json'):
+    for sensor_id, sensor in sensors.items():
+        if 'formula' in sensor:
+            del (sensor['formula'])
+
+    with open(config_file_name, mode='w') as config_file:
+        json.dump(sensors, config_file, indent=4, sort_keys=True)
+
+
+def config_snapshot(sensors):
+    # The sensor config without the formulas, which can't be serialized
+    return {sensor_id: {key: value for key, value in sensor.items() if key != 'formula'} for sensor_id, sensor in sensors.items()}
@@ -0,0 +1,112 @@
+import logging
+import functools
+
+import numpy as np
+
+
+class SampleConverter:
+    """
+    Converts raw USB-20x counts into calibrated volts and engineering units
+    for every channel at once.
+
+    The whole chain for a channel is
+
+        calibrated code = code * slope + intercept         (device table_AIn)
+        volts = volts(calibrated code)
+        units = formula((volts + linear_adj) / opamp_mul) * scalar_adj
+
+    Every step except the sensor formula is affine, so when the formula is
+    affine too the chain collapses into one gain and offset per channel and
+    a batch is converted with a single multiply-add over the count matrix.
+    Sensors with a non-linear formula get their formula applied to their
+    column only.
+
+     sensors:    sensor config, with the formulas attached
+     table_AIn:  per channel calibration, objects with slope and intercept
+     volts:      function converting a calibrated code to volts
+    """
+
+    def __init__(self, sensors, table_AIn, volts, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.nchan = len(sensors)
+
+        slope = np.array([table_AIn[chan].slope for chan in range(self.nchan)], dtype=np.float64)
+        intercept = np.array([table_AIn[chan].intercept for chan in range(self.nchan)], dtype=np.float64)
+
+        # volts() is affine in the code
+        volts_offset = volts(0.)
+        volts_gain = volts(1.) - volts_offset
+
+        volts_gain, volts_offset = slope * volts_gain, intercept * volts_gain + volts_offset
+
+        units_gain = np.ones(self.nchan)
+        units_offset = np.zeros(self.nchan)
+
+        # channel -> (gain, offset, formula, scalar_adj) for the sensors with a non-linear formula
+        self.formulas = {}
+
+        for sensor_id, sensor in sensors.items():
+            chan = sensor['channel']
+
+            formula = self._vectorize(functools.partial(sensor['formula'], **sensor['input']))
+
+            input_gain = volts_gain[chan] / sensor['opamp_mul']
+            input_offset = (volts_offset[chan] + sensor['linear_adj']) / sensor['opamp_mul']
+
+            affine = self._affine(formula)
+            if affine:
+                formula_gain, formula_offset = affine
+                units_gain[chan] = input_gain * formula_gain * sensor['scalar_adj']
+                units_offset[chan] = (input_offset * formula_gain + formula_offset) * sensor['scalar_adj']
+            else:
+                logging.debug(f'{sensor["sensor_name"]} has a non-linear formula')
+                self.formulas[chan] = (input_gain, input_offset, formula, sensor['scalar_adj'])
+
+        self.volts_gain = volts_gain.astype(self.dtype)
+        self.volts_offset = volts_offset.astype(self.dtype)
+        self.units_gain = units_gain.astype(self.dtype)
+        self.units_offset = units_offset.astype(self.dtype)
+
+    @staticmethod
+    def _vectorize(formula):
+        try:
+            formula(np.zeros(2))
+            return formula
+        except Exception:
+            return np.vectorize(formula, otypes=[np.float64])
+
+    @staticmethod
+    def _affine(formula):
+        probe = np.linspace(-12, 12, 9)
+
+        try:
+            offset = float(formula(0.))
+            gain = float(formula(1.)) - offset
+            values = np.asarray(formula(probe), dtype=np.float64)
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+
+        if values.shape != probe.shape or not np.allclose(values, probe * gain + offset, rtol=1e-9, atol=1e-9):
+            return None
+
+        return gain, offset
+
+    def volts(self, counts):
+        counts = np.asarray(counts, dtype=self.dtype).reshape(-1, self.nchan)
+
+        return counts * self.volts_gain + self.volts_offset
+
+    def convert(self, counts):
+        """
+        Returns the calibrated volts and engineering units, both shaped
+        (nscans, nchan), for a matrix of raw counts.
+        """
+        counts = np.asarray(counts, dtype=self.dtype).reshape(-1, self.nchan)
+
+        volts = counts * self.volts_gain + self.volts_offset
+        units = counts * self.units_gain + self.units_offset
+
+        for chan, (gain, offset, formula, scalar_adj) in self.formulas.items():
+            units[:, chan] = formula(counts[:, chan] * gain + offset) * scalar_adj
+
+        return volts, units
@@ -0,0 +1,510 @@
+"""
+Live telemetry in a browser, for watching a run from a safe distance
+without an X display on the Pi.
+
+GET /     - the dashboard page
+GET /ws   - WebSocket streaming a JSON frame rate times a second:
+            {"label", "timestamp", "scans", "dropped", "sensors",
+             "x", "min", "max", "stats": {name: {last, min, max, mean}}}
+            /ws?rate=2 asks for fewer frames, up to the server rate.
+GET /stats - the latest frame without the series, as JSON
+
+The consumer only hands its batches over with put(), which never blocks.
+The batches are windowed, decimated to the min and max of every bucket
+and turned into frames on the dashboard's own thread.  Every client is
+sent the newest frame when it is ready for one, so a slow client only
+ever misses frames.
+"""
+
+import json
+import base64
+import hashlib
+import logging
+import select
+import socket
+import threading
+
+import numpy as np
+
+from time import sleep, perf_counter
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_ws_magic = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# The browser only sends control frames, which are at most 125 bytes, anything much bigger closes the connection
+_max_frame = 1024
+
+_page = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Datalogger</title>
+<style>
+body { font-family: sans-serif; margin: 0; background: #111; color: #ddd; }
+header { padding: 8px 12px; background: #222; }
+.sensor { padding: 4px 12px; }
+.sensor canvas { width: 100%; height: 160px; background: #000; }
+.name { font-weight: bold; }
+.stats { float: right; font-family: monospace; }
+</style>
+</head>
+<body>
+<header><span id="status">Connecting...</span></header>
+<div id="sensors"></div>
+<script>
+const panels = {};
+
+function panel(name) {
+    if (!panels[name]) {
+        const div = document.createElement('div');
+        div.className = 'sensor';
+        div.innerHTML = '<span class="name"></span><span class="stats"></span><canvas></canvas>';
+        div.querySelector('.name').textContent = name;
+        document.getElementById('sensors').appendChild(div);
+        panels[name] = div;
+    }
+    return panels[name];
+}
+
+function draw(canvas, x, lo, hi) {
+    canvas.width = canvas.clientWidth;
+    canvas.height = canvas.clientHeight;
+    const ctx = canvas.getContext('2d');
+    if (!x.length) return;
+
+    const finite = v => v !== null;
+    let ymin = Math.min(...lo.filter(finite)), ymax = Math.max(...hi.filter(finite));
+    if (!isFinite(ymin) || !isFinite(ymax)) return;
+    if (ymax === ymin) { ymax += 1; ymin -= 1; }
+    const xmin = x[0], xmax = x[x.length - 1] > xmin ? x[x.length - 1] : xmin + 1;
+    const px = t => (t - xmin) / (xmax - xmin) * canvas.width;
+    const py = v => canvas.height - (v - ymin) / (ymax - ymin) * canvas.height;
+
+    ctx.strokeStyle = '#4af';
+    ctx.beginPath();
+    for (let i = 0; i < x.length; i++) {
+        if (lo[i] === null || hi[i] === null) continue;
+        ctx.moveTo(px(x[i]), py(lo[i]));
+        ctx.lineTo(px(x[i]), py(hi[i]) - 1);
+    }
+    ctx.stroke();
+}
+
+// NaN and infinities are sent as null
+const fixed = (v, digits) => v === null ? '-' : v.toFixed(digits);
+
+function connect() {
+    const ws = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws' + location.search);
+    const status = document.getElementById('status');
+
+    ws.onmessage = event => {
+        const frame = JSON.parse(event.data);
+        status.textContent = `${frame.label || 'Waiting for a run'}  ${fixed(frame.timestamp, 1)} s  ${frame.scans} scans  ${frame.dropped} dropped frames`;
+
+        frame.sensors.forEach((name, i) => {
+            const div = panel(name);
+            const s = frame.stats[name];
+            div.querySelector('.stats').textContent = s ? `last ${fixed(s.last, 2)}  min ${fixed(s.min, 2)}  max ${fixed(s.max, 2)}  mean ${fixed(s.mean, 2)}` : '';
+            draw(div.querySelector('canvas'), frame.x, frame.min[i], frame.max[i]);
+        });
+    };
+    ws.onclose = () => { status.textContent = 'Disconnected, retrying...'; setTimeout(connect, 1000); };
+}
+
+connect();
+</script>
+</body>
+</html>
+"""
+
+
+class _Client:
+    """ A WebSocket connection and the newest frame waiting for it. """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.frame = None
+        self.sent = 0
+        self.dropped = 0
+        self.ready = threading.Event()
+
+    def offer(self, frame):
+        # Only the newest frame is kept, the one before it is dropped if it was never sent
+        if self.frame is not None:
+            self.dropped += 1
+
+        self.frame = frame
+        self.ready.set()
+
+    def take(self, timeout):
+        if not self.ready.wait(timeout):
+            return None
+
+        self.ready.clear()
+        frame, self.frame = self.frame, None
+
+        return frame
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'Datalogger'
+
+    def log_message(self, format, *args):
+        logging.debug(f'Dashboard {self.address_string()}: {format % args}')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        dashboard = self.server.dashboard
+
+        if url.path == '/':
+            self._send(200, 'text/html; charset=utf-8', _page.encode())
+        elif url.path == '/stats':
+            self._send(200, 'application/json', json.dumps(dashboard.summary(), allow_nan=False).encode())
+        elif url.path == '/ws' and self.headers.get('Upgrade', '').lower() == 'websocket':
+            rate = dashboard.rate
+            try:
+                rate = min(float(parse_qs(url.query).get('rate', [rate])[0]), dashboard.rate)
+            except ValueError:
+                pass
+
+            self._websocket(dashboard, max(rate, .1))
+        else:
+            self._send(404, 'text/plain', b'Not found')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _websocket(self, dashboard, rate):
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + _ws_magic).encode()).digest()).decode()
+
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        # A client that stops reading is dropped rather than waited on
+        self.connection.settimeout(dashboard.send_timeout)
+
+        # What was read of the frames from the browser so far
+        self.received = bytearray()
+
+        client = _Client(rate)
+        dashboard.add_client(client)
+        logging.info(f'Dashboard client connected from {self.address_string()} at {rate:g} frames/s')
+
+        try:
+            while not dashboard.closed:
+                if not self._read_control():
+                    break
+
+                frame = client.take(timeout=.5)
+                if frame is None:
+                    continue
+
+                sent = perf_counter()
+                self._write_frame(0x1, frame)
+                client.sent += 1
+
+                # Per client rate limit, whatever comes in meanwhile is coalesced into the newest frame
+                sleep(max(client.interval - (perf_counter() - sent), 0))
+
+        except (OSError, ValueError) as e:
+            logging.debug(f'Dashboard client {self.address_string()}: {e}')
+
+        finally:
+            dashboard.remove_client(client)
+            logging.info(f'Dashboard client {self.address_string()} left after {client.sent} frames, {client.dropped} dropped')
+
+            self.close_connection = True
+
+    def _read_control(self):
+        # Handles whatever the browser sent without blocking, False once it closed the connection.
+        # The socket is read directly, a frame that only partly arrived waits for the rest in received.
+        while select.select([self.connection], [], [], 0)[0]:
+            data = self.connection.recv(4096)
+            if not data:
+                return False
+
+            self.received += data
+
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return True
+
+            opcode, payload = frame
+
+            if opcode == 0x8:
+                self._write_frame(0x8, payload[:2])
+                return False
+
+            if opcode == 0x9:
+                self._write_frame(0xa, payload)
+
+    def _next_frame(self):
+        # The opcode and unmasked payload of the first whole frame in received, None until there is one
+        data = self.received
+        if len(data) < 2:
+            return None
+
+        length = data[1] & 0x7f
+        offset = 2
+        if length == 126:
+            if len(data) < 4:
+                return None
+            length = int.from_bytes(data[2:4], 'big')
+            offset = 4
+        elif length == 127:
+            if len(data) < 10:
+                return None
+            length = int.from_bytes(data[2:10], 'big')
+            offset = 10
+
+        if length > _max_frame:
+            raise ValueError(f'{length} byte frame from the browser, at most {_max_frame} are accepted')
+
+        mask = b'\0\0\0\0'
+        if data[1] & 0x80:
+            mask = data[offset:offset + 4]
+            offset += 4
+
+        if len(data) < offset + length:
+            return None
+
+        opcode = data[0] & 0x0f
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(data[offset:offset + length]))
+
+        del data[:offset + length]
+
+        return opcode, payload
+
+    def _write_frame(self, opcode, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 2**16:
+            header += bytes([126]) + len(payload).to_bytes(2, 'big')
+        else:
+            header += bytes([127]) + len(payload).to_bytes(8, 'big')
+
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+
+class Dashboard(threading.Thread):
+    """
+    HTTP and WebSocket server for the live data of the runs.
+
+     port:     port to listen on, on every interface
+     window:   seconds of data shown
+     points:   buckets the window is decimated to per sensor
+     rate:     frames per second, the most a client is sent
+     max_batches: batches waiting to be windowed before the oldest are dropped
+    """
+
+    def __init__(self, port=8080, window=10, points=500, rate=10, max_batches=256, send_timeout=5):
+        super(Dashboard, self).__init__(name='dashboard', daemon=True)
+
+        self.port = port
+        self.window = window
+        self.points = points
+        self.rate = rate
+        self.send_timeout = send_timeout
+
+        self.pending = deque(maxlen=max_batches)
+        self.dropped_batches = 0
+
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+
+        # The window and stats are swapped out by reset() while the frames are made
+        self.lock = threading.Lock()
+
+        self.frame = None
+        self.frames = 0
+        self.closed = False
+
+        self.server = ThreadingHTTPServer(('', port), _Handler)
+        self.server.daemon_threads = True
+        self.server.dashboard = self
+
+        self.reset([], 1)
+
+    def reset(self, sensor_names, frequency, label=None):
+        """ Starts over for a new run. """
+        with self.lock:
+            self._reset(sensor_names, frequency, label)
+
+    def _reset(self, sensor_names, frequency, label):
+        self.sensor_names = list(sensor_names)
+        self.frequency = frequency
+        self.label = label
+
+        self.pending.clear()
+
+        size = max(int(self.window * frequency), 1)
+        self.x = np.zeros(size)
+        self.y = np.zeros((size, len(self.sensor_names)))
+        self.write_index = 0
+        self.count = 0
+
+        self.timestamp = 0.
+        self.scans = 0
+        self.last = np.full(len(self.sensor_names), np.nan)
+        self.min = np.full(len(self.sensor_names), np.inf)
+        self.max = np.full(len(self.sensor_names), -np.inf)
+        self.sum = np.zeros(len(self.sensor_names))
+
+    def put(self, timestamps, values):
+        """
+        Hands a batch of converted scans over, shaped (nscans, nchan),
+        with the time of every scan.  Never blocks.
+        """
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped_batches += 1
+
+        self.pending.append((timestamps, values))
+
+    def add_client(self, client):
+        with self.clients_lock:
+            self.clients.add(client)
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            self.clients.discard(client)
+
+    def start(self):
+        super(Dashboard, self).start()
+
+        threading.Thread(name='dashboard-http', target=self.server.serve_forever, daemon=True).start()
+
+        logging.info(f'Dashboard on http://{socket.gethostname()}:{self.port}/')
+
+    def run(self):
+        interval = 1 / self.rate
+        next_frame = perf_counter()
+
+        while not self.closed:
+            with self.lock:
+                while self.pending:
+                    self._update(*self.pending.popleft())
+
+                frame = self._frame() if self.clients else None
+
+            next_frame += interval
+            if frame is not None:
+                self.frame = json.dumps(frame, allow_nan=False)
+                self.frames += 1
+
+                with self.clients_lock:
+                    clients = list(self.clients)
+
+                for client in clients:
+                    client.offer(self.frame)
+
+            sleep(max(next_frame - perf_counter(), 0))
+
+    def _update(self, timestamps, values):
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.sensor_names))
+        timestamps = np.asarray(timestamps)
+        if not len(values):
+            return
+
+        self.timestamp = timestamps[-1]
+        self.scans += len(values)
+        self.last = values[-1]
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+        self.sum += values.sum(axis=0)
+
+        # Only the window is kept, as a circular buffer
+        size = len(self.y)
+        timestamps = timestamps[-size:]
+        values = values[-size:]
+
+        indexes = (self.write_index + np.arange(len(values))) % size
+        self.x[indexes] = timestamps
+        self.y[indexes] = values
+
+        self.write_index = (self.write_index + len(values)) % size
+        self.count = min(self.count + len(values), size)
+
+    @staticmethod
+    def _finite(value):
+        # JSON has no NaN or infinity
+        return float(value) if np.isfinite(value) else None
+
+    @staticmethod
+    def _finite_list(values):
+        values = np.asarray(values)
+        if np.isfinite(values).all():
+            return values.tolist()
+
+        values = values.astype(object)
+        values[~np.isfinite(values.astype(np.float64))] = None
+
+        return values.tolist()
+
+    def _stats(self):
+        if not self.scans:
+            return {}
+
+        mean = self.sum / self.scans
+
+        return {
+            name: {'last': self._finite(self.last[i]), 'min': self._finite(self.min[i]), 'max': self._finite(self.max[i]), 'mean': self._finite(mean[i])}
+            for i, name in enumerate(self.sensor_names)
+        }
+
+    def summary(self):
+        with self.clients_lock:
+            dropped = sum(client.dropped for client in self.clients)
+
+        return {
+            'label': self.label,
+            'timestamp': self._finite(self.timestamp),
+            'scans': self.scans,
+            'dropped': dropped,
+            'dropped_batches': self.dropped_batches,
+            'clients': len(self.clients),
+            'sensors': self.sensor_names,
+            'stats': self._stats()
+        }
+
+    def _frame(self):
+        # The window in time order
+        start = self.write_index if self.count == len(self.y) else 0
+        order = (start + np.arange(self.count)) % len(self.y)
+        x = self.x[order]
+        y = self.y[order]
+
+        # The min and max of every channel over the same buckets, so they share the time axis
+        size = max(-(-len(y) // self.points), 1)
+        starts = np.arange(0, len(y), size)
+
+        frame = self.summary()
+        frame['x'] = self._finite_list(np.round(x[starts], 4))
+        frame['min'] = self._finite_list(np.minimum.reduceat(y, starts).T) if len(y) else [[] for name in self.sensor_names]
+        frame['max'] = self._finite_list(np.maximum.reduceat(y, starts).T) if len(y) else [[] for name in self.sensor_names]
+
+        return frame
+
+    def close(self):
+        self.closed = True
+
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,11 +1,8 @@
 import os
-import random
-import queue
 import threading
 import logging
 
-import pandas as pd
-from scipy import integrate
+import numpy as np
 
 from time import sleep, perf_counter
 from datetime import datetime
@@ -14,18 +11,16 @@ from usb1 import USBError
 from datalogger.libraries.mccUSB import OverrunError as mccOverrunError
 
 from datalogger.libraries.usb_20x import *
-from matplotlib import pyplot as plt
-
-data_queue = queue.Queue(50)
-exit_flag = queue.Queue(1)
-
-
-def roundup(x, mod):
-    return x if x % mod == 0 else x + mod - x % mod
-
-
-def rounddown(x, mod):
-    return x if x % mod == 0 else (x + 1) - mod - (x + 1) % mod
+from datalogger.libraries.conversion import SampleConverter
+from datalogger.libraries.ring_buffer import RingBuffer
+from datalogger.libraries.acquisition import SharedRingBuffer, AcquisitionProcess
+from datalogger.libraries.journal import JournalWriter, JournalReader, JOURNAL_NAME
+from datalogger.libraries.storage import StorageWriter, StorageError
+from datalogger.libraries.analytics import BurnAnalytics, impulse_letter
+from datalogger.libraries.report import format_stats, write_report
+from datalogger.libraries.pyramid import PyramidWriter, PyramidReader, PYRAMID_DIR
+from datalogger.libraries.catalog import RunCatalog, run_record, CATALOG_NAME
+from datalogger.libraries.config import config_snapshot
 
 
 class ProducerThread(threading.Thread):
@@ -36,37 +31,43 @@ class ProducerThread(threading.Thread):
         self.data_logger = data_logger
 
     def run(self):
+        ring = self.data_logger.ring
+
         try:
-            while exit_flag.empty():
-                if not data_queue.full():
-                    try:
-                        item = self.data_logger.collect_data()
-                        if item:
-                            data_queue.put(item)
-                            logging.debug(f'Putting 1 item in queue')
-
-                        stop_flag = self.data_logger.usb20x.DPort()
-                        logging.debug(f'Stop Flag: {stop_flag}')
-
-                        if not stop_flag:
-                            logging.debug('Stopping due to stop flag trigger going low...')
-                            self.data_logger.stop()
-
-                    except USBError as e:
-                        if e.value == -7 or e.value == -4:  # or e.value == -9:
-                            # Normal, the device is probably waiting for a trigger
-                            logging.info(f'USB Timeout occurred, probably waiting for trigger')
-                            sleep(random.random())
-                        else:
-                            raise
-                    except mccOverrunError:
+            while not ring.closed:
+                try:
+                    # Blocks in the USB read (or the stream event handling) until data arrives
+                    item = self.data_logger.collect_data()
+                    if item is not None and len(item):
+                        self.data_logger.write_scans(item)
+
+                    stop_flag = self.data_logger.usb20x.DPort()
+                    logging.debug(f'Stop Flag: {stop_flag}')
+
+                    if not stop_flag:
+                        logging.debug('Stopping due to stop flag trigger going low...')
                         self.data_logger.stop()
 
-                    sleep(random.random())
+                except USBError as e:
+                    if e.value == -7 or e.value == -4:  # or e.value == -9:
+                        # Normal, the device is probably waiting for a trigger
+                        logging.info(f'USB Timeout occurred, probably waiting for trigger')
+                    else:
+                        raise
+                except mccOverrunError:
+                    self.data_logger.stop()
 
         except (KeyboardInterrupt, SystemExit):
             self.data_logger.stop()
 
+        finally:
+            try:
+                if self.data_logger.stream:
+                    self.data_logger.usb20x.AInScanStreamStop()
+            finally:
+                # However the producer ends, the consumer must not wait on the ring buffer forever
+                ring.close()
+
 
 class ConsumerThread(threading.Thread):
     def __init__(self, data_logger, maxruntime, group=None, target=None, name=None, args=(), kwargs=None, verbose=None, daemon=True):
@@ -77,24 +78,53 @@ class ConsumerThread(threading.Thread):
         self.maxruntime = maxruntime
 
     def run(self):
+        ring = self.data_logger.ring
+
         try:
-            while exit_flag.empty():
-                if not data_queue.empty():
-                    item = data_queue.get()
-                    self.data_logger.process_data(item)
+            # Whatever is left in the ring buffer once it is closed is still processed
+            while not ring.drained:
+                scans = ring.read(2**self.data_logger.batch_exp, timeout=1)
+                if scans is None:
+                    continue
 
-                    if self.maxruntime and self.data_logger.timestamp > self.maxruntime:
-                        self.data_logger.stop()
+                self.data_logger.process_data(scans)
+                ring.release(len(scans))
+
+                if self.maxruntime and self.data_logger.timestamp > self.maxruntime:
+                    self.data_logger.stop()
 
-                sleep(0.001)
+            # The acquisition process closes the ring buffer itself when the green switch goes off
+            if self.data_logger.isolated:
+                self.data_logger.stop()
+
+        except StorageError as e:
+            # Nothing more can be saved, the run is stopped rather than left to overflow the ring buffer
+            logging.error(f'Stopping the run: {e}')
+            self.data_logger.stop()
 
         except (KeyboardInterrupt, SystemExit):
             self.data_logger.stop()
 
+        finally:
+            # Writes out whatever is still waiting and closes the journal
+            self.data_logger.storage.close()
+            self.data_logger.pyramid.close()
+
+            self.data_logger.output_stats()
+
 
 class DataLogger:
-    def __init__(self, frequency, sensors, maxruntime=0,  raw_voltage=False, base_dir='/home/pi/Desktop/video'):
-        self.usb20x = usb_204()
+    def __init__(self, frequency, sensors, maxruntime=0,  raw_voltage=False, base_dir='/home/pi/Desktop/video', stream_transfers=8, dtype=np.float64, device=usb_204, isolated=False, fsync='stop', dashboard=None):
+        # Called to open the device, again after every reset
+        self.device = device
+
+        # Runs the USB side in an AcquisitionProcess, the device is then only ever opened in that process
+        self.isolated = isolated
+        self.acquisition = None
+
+        self.usb20x = None
+        if not self.isolated:
+            self.usb20x = self.device()
 
         self.base_dir = base_dir
 
@@ -109,6 +139,34 @@ class DataLogger:
 
         logging.debug(f'Sensor Names: {self.sensor_names}')
 
+        # The burn stats are worked out from the load cell while logging
+        self.load_cell = None
+        if 'Load Cell' in self.sensor_names:
+            self.load_cell = self.sensor_names.index('Load Cell')
+
+        self.analytics = None
+        self.stats = None
+
+        # Seconds each plot of the last run took to render, by path
+        self.render_times = {}
+
+        self.dtype = dtype
+        self.converter = None
+        self.table_AIn = None
+        if not self.isolated:
+            self.table_AIn = self.usb20x.table_AIn
+            self.converter = SampleConverter(self.sensors, self.table_AIn, self.usb20x.volts, self.dtype)
+
+        # Raw scans of the current run, the CSV files are exported from it afterwards when wanted
+        self.journal = None
+
+        # Writes the journal behind the consumer, see StorageWriter for the fsync policies
+        self.storage = None
+        self.fsync = fsync
+
+        # Downsamples of the converted data, for showing long runs
+        self.pyramid = None
+
         self.nchan = len(self.sensors)  # Number of channels to measure
         self.frequency = frequency
         self.sample_time = 1 / frequency
@@ -118,27 +176,36 @@ class DataLogger:
         self.timestamp = 0
         self.transfer_count = 0
         self.maxruntime = maxruntime
-        self.qt_queue = None
-        self.qt_exit_queue = None
 
-        self.exit_flag = exit_flag
+        # Latest converted samples for the Qt plots to pull, see LiveBuffer
+        self.live = None
+
+        # Live data for browsers, it outlives the runs so it is started by the caller
+        self.dashboard = dashboard
+
+        # Raw scans handed from the producer to the consumer, sized for about 32 bulk transfers
+        if self.isolated:
+            self.ring = SharedRingBuffer(32 * 2**self.batch_exp, self.nchan)
+        else:
+            self.ring = RingBuffer(32 * 2**self.batch_exp, self.nchan)
 
         self.p = None
         self.c = None
 
         self.started = False
 
-        self.data = pd.DataFrame(columns=self.sensor_names)
-        self.raw_data = pd.DataFrame(columns=self.sensor_names)
+        # Number of asynchronous bulk transfers kept in flight, 0 falls back to synchronous AInScanRead calls
+        self.stream_transfers = stream_transfers
+        self.stream = stream_transfers > 0
 
         self.channels = 0
         for i in range(self.nchan):
             self.channels |= (0x1 << i)
 
         if self.frequency < 100:
-            self.options = self.usb20x.IMMEDIATE_TRANSFER_MODE
+            self.options = usb_20x.IMMEDIATE_TRANSFER_MODE
         else:
-            self.options = self.usb20x.STALL_ON_OVERRUN
+            self.options = usb_20x.STALL_ON_OVERRUN
 
     @staticmethod
     def _calc_batch_exp(frequency):
@@ -148,16 +215,29 @@ class DataLogger:
 
         return 20
 
-    def start(self, qt_queue=None, qt_exit_queue=None):
+    def start(self, live=None):
         self._reset()
 
+        # The threads of a previous run exit once _reset closes the ring buffer
+        for thread in (self.p, self.c):
+            if thread and thread.is_alive():
+                thread.join()
+
+        self.ring.reset()
+
         logging.info('Starting USB_204')
 
         logging.info('Turn on the green switch when ready to start logging...')
-        while not self.usb20x.DPort():
-            sleep(random.random())
+        if self.isolated:
+            self._start_acquisition()
+        else:
+            while not self.usb20x.DPort():
+                sleep(.1)
 
-        self.usb20x.AInScanStart(0, self.frequency * self.nchan, self.channels, self.options, self.usb20x.NO_TRIGGER, self.usb20x.LEVEL_HIGH)
+            self.usb20x.AInScanStart(0, self.frequency * self.nchan, self.channels, self.options, self.usb20x.NO_TRIGGER, self.usb20x.LEVEL_HIGH)
+
+            if self.stream:
+                self.usb20x.AInScanStream(2**self.batch_exp, self.write_scans, self.stream_transfers, as_array=True)
 
         if self.maxruntime:
             logging.info(f'Collecting data for {self.maxruntime} seconds...')
@@ -169,14 +249,26 @@ class DataLogger:
         self.timestamp = 0
         self.transfer_count = 0
 
-        self.data = pd.DataFrame(columns=self.sensor_names)
-        self.raw_data = pd.DataFrame(columns=self.sensor_names)
+        self.live = live
+
+        self.stats = None
+        if self.load_cell is not None:
+            self.analytics = BurnAnalytics(self.frequency)
+
+        if not os.path.exists(f'{self.base_dir}/{self.timestamp_label}/'):
+            os.makedirs(f'{self.base_dir}/{self.timestamp_label}/')
+
+        self.journal = JournalWriter(f'{self.base_dir}/{self.timestamp_label}/{JOURNAL_NAME}', self.frequency, self.sensors, self.table_AIn, self.timestamp_label)
+
+        # Built on the consumer, written out by the storage thread
+        self.pyramid = PyramidWriter(f'{self.base_dir}/{self.timestamp_label}/{PYRAMID_DIR}', self.frequency, self.sensor_names)
 
-        self.qt_queue = qt_queue
-        self.qt_exit_queue = qt_exit_queue
+        # Coalesces about a second of data per write
+        self.storage = StorageWriter(self.journal, flush_scans=self.frequency, flush_interval=1., fsync=self.fsync, pyramid=self.pyramid)
+        self.storage.start()
 
-        # To write out the column headers
-        self.output_to_csv(write_mode='w')
+        if self.dashboard:
+            self.dashboard.reset(self.sensor_names, self.frequency, self.timestamp_label)
 
         self.p = ProducerThread(
             name='producer',
@@ -191,84 +283,108 @@ class DataLogger:
             maxruntime=self.maxruntime
         )
 
-        while not exit_flag.empty():
-            exit_flag.get()
+        if not self.isolated:
+            self.p.start()
 
-        self.p.start()
         self.c.start()
 
         self.started = True
 
+    def _start_acquisition(self):
+        self.acquisition = AcquisitionProcess(
+            device=self.device,
+            ring=self.ring,
+            frequency=self.frequency,
+            nchan=self.nchan,
+            channels=self.channels,
+            options=self.options,
+            batch_exp=self.batch_exp,
+            stream_transfers=self.stream_transfers
+        )
+
+        self.acquisition.start()
+
+        self.table_AIn = self.acquisition.get_calibration()
+        self.converter = SampleConverter(self.sensors, self.table_AIn, usb_20x.volts, self.dtype)
+
+        self.acquisition.wait_till_started()
+
+    def _stop_acquisition(self):
+        if self.acquisition and self.acquisition.is_alive():
+            self.acquisition.join(timeout=5)
+
+            if self.acquisition.is_alive():
+                logging.info('Acquisition process did not stop, terminating it')
+                self.acquisition.terminate()
+
     def wait_for_datalogger(self):
         try:
             self.c.join()
+
+            if self.isolated:
+                self._stop_acquisition()
         except (KeyboardInterrupt, SystemExit):
             self.stop()
 
     def collect_data(self):
+        if self.stream:
+            # Completed transfers are handed to _stream_data while the events are handled
+            self.usb20x.AInScanStreamHandleEvents()
+            return None
+
         raw_data = None
         if self.usb20x.Status() == self.usb20x.AIN_SCAN_RUNNING:
-            raw_data = self.usb20x.AInScanRead(2**self.batch_exp)
+            raw_data = self.usb20x.AInScanRead(2**self.batch_exp, as_array=True)
         elif self.usb20x.Status() == self.usb20x.AIN_SCAN_RUNNING + self.usb20x.AIN_SCAN_OVERRUN:
             logging.info('Scan Overrun.  Forced to reset (cross fingers and hope timing is ok)!!!')
             self._reset()
         else:
             logging.info(f'Not running... Status: {self.usb20x.Status()}')
+            sleep(.1)
 
         return raw_data
 
-    def process_data(self, raw_input_data):
-        if raw_input_data and isinstance(raw_input_data, list):
-            df_index = []
-            df_temp = []
-            for index in range(int(len(raw_input_data) / self.nchan)):
-                voltage = []
-                for chan_index in range(self.nchan):
-                    voltage.append(self.usb20x.volts(raw_input_data[(index * self.nchan) + chan_index]))
-
-                self.timestamp += self.sample_time
+    @property
+    def dropped_batches(self):
+        return self.ring.overflows
 
-                df_index.append(self.timestamp)
-                df_temp.append(voltage)
+    def write_scans(self, raw_data):
+        if self.ring.write(raw_data):
+            logging.debug(f'Wrote {len(raw_data)} scans to the ring buffer, fill level: {self.ring.fill_ratio:.0%}')
+        else:
+            logging.info(f'Ring buffer full, dropped {self.dropped_batches} batches so far')
 
-            logging.debug(f'Sample Voltages: {df_temp[0]}')
+    def process_data(self, raw_input_data):
+        nscans = 0
+        if raw_input_data is not None and len(raw_input_data):
+            # Accepts either the flat list of samples or the (nscans, nchan) uint16 array from AInScanRead
+            counts = np.asarray(raw_input_data).reshape(-1, self.nchan)
+            nscans = len(counts)
 
-            temp_df = pd.DataFrame(df_temp, columns=self.sensor_names, index=df_index)
-            raw_temp_df = pd.DataFrame(df_temp, columns=self.sensor_names, index=df_index)
+            self.storage.put(counts)
 
-            for sensor_id, sensor in self.sensors.items():
-                temp_df[sensor['sensor_name']] = temp_df[sensor['sensor_name']].apply(
-                    lambda v, linear_adj, opamp_mul: (v + linear_adj) / opamp_mul,
-                    linear_adj=sensor['linear_adj'],
-                    opamp_mul=sensor['opamp_mul']
-                )
+            voltages, measurements = self.converter.convert(counts)
 
-                temp_df[sensor['sensor_name']] = temp_df[sensor['sensor_name']].apply(
-                    sensor['formula'],
-                    **sensor['input']
-                )
+            self.pyramid.append(measurements)
 
-                temp_df[sensor['sensor_name']] = temp_df[sensor['sensor_name']].apply(
-                    lambda v, scalar_adj: v * scalar_adj,
-                    scalar_adj=sensor['scalar_adj']
-                )
+            if self.analytics:
+                self.analytics.update(measurements[:, self.load_cell])
 
-            logging.debug(f'Sample transformed measurements:\n{temp_df.iloc[0]}')
+            df_index = self.timestamp + self.sample_time * np.arange(1, nscans + 1)
+            self.timestamp = df_index[-1]
 
-            if self.qt_queue:
-                if self.raw_voltage:
-                    self.qt_queue.put(raw_temp_df)
-                else:
-                    self.qt_queue.put(temp_df)
+            if self.dashboard:
+                self.dashboard.put(df_index, voltages if self.raw_voltage else measurements)
 
-            self.data = pd.concat([self.data, temp_df])
-            self.raw_data = pd.concat([self.raw_data, raw_temp_df])
+            logging.debug(f'Sample Voltages: {voltages[0]}')
+            logging.debug(f'Sample transformed measurements: {measurements[0]}')
 
-            self.output_to_csv()
+            if self.live:
+                self.live.write(voltages if self.raw_voltage else measurements)
 
         self.transfer_count += 1
 
-        logging.debug(f'{self.transfer_count}: Got {len(raw_input_data) / self.nchan} data points  -  Recorded time: {int(self.timestamp)} seconds')
+        logging.debug(f'{self.transfer_count}: Got {nscans} data points  -  Recorded time: {int(self.timestamp)} seconds')
 
     def print_debug_info(self):
         time_since_restart = perf_counter() - self.restart_timestamp
@@ -277,19 +393,21 @@ class DataLogger:
         logging.debug(f'Recorded time: {int(self.timestamp)} seconds or {int(self.timestamp / 60)} minutes')
         logging.debug(f'Time since last restart minus recorded time: {int(time_since_restart - (self.timestamp))} seconds')
         logging.debug(f'Number of bulk transfers: {self.transfer_count}')
+        logging.debug(f'Number of dropped batches: {self.dropped_batches} ({self.ring.dropped_scans} scans)')
+        logging.debug(f'Ring buffer high water mark: {self.ring.max_fill} of {self.ring.capacity} scans')
+
+        if self.storage:
+            logging.debug(f'Storage: {self.storage.metrics()}')
 
     def _reset(self):
-        if not exit_flag.full():
-            exit_flag.put(True)
+        self.ring.close()
 
         self.print_debug_info()
 
-        while not data_queue.empty():
-            data_queue.get()
-
-        if self.qt_queue:
-            while not self.qt_queue.empty():
-                self.qt_queue.get()
+        if self.isolated:
+            # The acquisition process stops the scan and closes the device once the ring buffer is closed
+            self._stop_acquisition()
+            return
 
         self.usb20x.AInScanStop()
         self.usb20x.AInScanClearFIFO()
@@ -307,7 +425,7 @@ class DataLogger:
 
         while reset_in_progress:
             try:
-                self.usb20x = usb_204()
+                self.usb20x = self.device()
                 logging.debug(f'Status: {self.usb20x.Status()}')
                 self.usb20x.AInScanStop()
                 self.usb20x.AInScanClearFIFO()
@@ -326,228 +444,57 @@ class DataLogger:
 
         logging.info('Stopping logging')
 
-        if self.qt_exit_queue and not self.qt_exit_queue.full():
-            self.qt_exit_queue.put(True)
+        self.ring.close()
 
-        if not exit_flag.full():
-            exit_flag.put(True)
+        if not self.isolated:
+            self.usb20x.AInScanStop()
 
-        self.usb20x.AInScanStop()
+    def get_journal(self):
+        return JournalReader(f'{self.base_dir}/{self.timestamp_label}/{JOURNAL_NAME}')
 
-    def get_data(self):
-        df = pd.read_csv(f'{self.base_dir}/{self.timestamp_label}/converted_data.csv', index_col=0)
+    def get_data(self, start_time=None, end_time=None):
+        return self.get_journal().get_data(start_time, end_time, sensors=self.sensors)
 
-        return df
+    def get_raw_data(self, start_time=None, end_time=None):
+        return self.get_journal().get_raw_data(start_time, end_time, sensors=self.sensors)
 
-    def get_raw_data(self):
-        df = pd.read_csv(f'{self.base_dir}/{self.timestamp_label}/raw_data.csv', index_col=0)
+    def query(self, start_time=None, end_time=None, pixels=1000):
+        pyramid = PyramidReader(f'{self.base_dir}/{self.timestamp_label}/{PYRAMID_DIR}', self.get_journal())
 
-        return df
+        return pyramid.query(start_time, end_time, pixels)
 
-    def output_to_csv(self, write_mode='a'):
-        if not os.path.exists(f'{self.base_dir}/{self.timestamp_label}/'):
-            os.makedirs(f'{self.base_dir}/{self.timestamp_label}/')
-
-        header = False
-        if write_mode == 'w':
-            header = True
-
-        self.data.to_csv(
-            f'{self.base_dir}/{self.timestamp_label}/converted_data.csv',
-            index_label='seconds',
-            mode=write_mode,
-            header=header,
-            chunksize=10000
-        )
-
-        # Reset data to be appended next time
-        self.data = pd.DataFrame(columns=self.sensor_names)
-
-        self.raw_data.to_csv(
-            f'{self.base_dir}/{self.timestamp_label}/raw_data.csv',
-            index_label='seconds',
-            mode=write_mode,
-            header=header,
-            chunksize=10000
-        )
-
-        # Reset raw_data to be appended next time
-        self.raw_data = pd.DataFrame(columns=self.sensor_names)
-
-    def _detect_starting_timestamp(self, df):
-        # Discard the 1st second in case it's a 'dirty' signal
-        starting_min = df['Load Cell'].iloc[self.frequency:2 * self.frequency].min()
-
-        # Discard the 1st and last second in case it's a 'dirty' signal
-        test_max = df['Load Cell'].iloc[self.frequency:-self.frequency].max()
-
-        test_threshold = ((test_max - starting_min) * .10) + starting_min
-
-        try:
-            start_timestamp = df.loc[df['Load Cell'] > test_threshold].iloc[0].name
-        except IndexError:
-            start_timestamp = df.iloc[0].name
-
-        return start_timestamp
-
-    def _detect_ending_timestamp(self, df):
-        # Discard the last second in case it's a 'dirty' signal
-        ending_min = df['Load Cell'].iloc[-2 * self.frequency:-self.frequency].min()
-
-        # Discard the 1st and last second in case it's a 'dirty' signal
-        test_max = df['Load Cell'].iloc[self.frequency:-self.frequency].max()
-
-        test_threshold = ((test_max - ending_min) * .05) + ending_min
-
-        start_timestamp = self._detect_starting_timestamp(df)
-
-        reduced_df = df.loc[df.index > start_timestamp + .01]
-
-        try:
-            end_timestamp = reduced_df.loc[reduced_df['Load Cell'] > test_threshold].iloc[-1].name
-        except IndexError:
-            end_timestamp = df.iloc[-1].name
-
-        return end_timestamp
-
-    def _zero_load_cell(self, df):
-        # Discard the 1st second in case it's a 'dirty' signal
-        starting_min = df['Load Cell'].iloc[self.frequency:2 * self.frequency].min()
-
-        df['Load Cell'] = df['Load Cell'].apply(
-            lambda v, linear_adj: v - linear_adj,
-            linear_adj=starting_min
-        )
-
-        return df
-
-    def _clean_up_test_data(self, df, offset_sec=0):
-        start_timestamp = self._detect_starting_timestamp(df) - offset_sec
-        end_timestamp = self._detect_ending_timestamp(df) + offset_sec
-
-        df_zeroed = self._zero_load_cell(df)
-
-        df_reduced = df_zeroed.loc[df_zeroed.index > start_timestamp]
-        df_cleaned = df_reduced.loc[df_reduced.index < end_timestamp]
-
-        df_cleaned.index = df_cleaned.index.map(
-            lambda v: round(v - start_timestamp, 4)
-        )
-
-        return df_cleaned
-
-    def _get_motor_impulse(self, df):
-        return integrate.trapz(df['Load Cell'].clip(lower=0), dx=self.sample_time)
+    def export_csv(self):
+        self.get_journal().export_csv(f'{self.base_dir}/{self.timestamp_label}', sensors=self.sensors)
 
     @staticmethod
     def _impulse_letter(impulse):
-        motor_codes = [
-            ('1/8A', 0.3125),
-            ('1/4A', 0.625),
-            ('1/2A', 1.25),
-            ('A', 2.5),
-            ('B', 5),
-            ('C', 10),
-            ('D', 20),
-            ('E', 40),
-            ('F', 80),
-            ('G', 160),
-            ('H', 320),
-            ('I', 640),
-            ('J', 1280),
-            ('K', 2560),
-            ('L', 5120),
-            ('M', 10240),
-            ('N', 20480),
-            ('O', 40960)
-        ]
-
-        motor_codes.reverse()
-
-        for index, (code, max_impulse) in enumerate(motor_codes):
-            if impulse > max_impulse:
-                return motor_codes[index - 1][0]
-
-        return 'Unknown'
-
-    def _avg_thrust(self, df):
-        return df['Load Cell'].clip(lower=0).mean()
-
-    def _burn_time(self, df):
-        start_timestamp = self._detect_starting_timestamp(df)
-        end_timestamp = self._detect_ending_timestamp(df)
-
-        return end_timestamp - start_timestamp
-
-    def output_final_results(self):
-        df = self.get_data()
+        return impulse_letter(impulse)
 
-        df_clean = self._clean_up_test_data(df)
-
-        impulse = self._get_motor_impulse(df_clean)
-        impulse_letter = self._impulse_letter(impulse)
-        average_thrust = self._avg_thrust(df_clean)
-        burn_time = self._burn_time(df_clean)
-        start_timestamp = self._detect_starting_timestamp(df_clean)
-        end_timestamp = self._detect_ending_timestamp(df_clean)
+    def output_stats(self):
+        results = self.analytics.results() if self.analytics else None
+        if not results:
+            return
 
-        stats = f"""
-        Motor: {impulse_letter}{int(average_thrust)}  
-        Impulse: {impulse:.2f} Ns  
-        Average Thrust: {average_thrust:.2f} N  
-        Burn Time: {burn_time:.1f} s  
-        Start Time: {start_timestamp:.1f} s  
-        End Time: {end_timestamp:.1f} s  
-        """
+        self.stats = format_stats(results)
 
-        logging.info(stats)
+        logging.info(self.stats)
 
         with open(f'{self.base_dir}/{self.timestamp_label}/stats.txt', 'w') as f:
-            f.write(stats)
-
-        df_clean = self._clean_up_test_data(df, offset_sec=5)
-
-        for sensor_id, sensor in self.sensors.items():
-            fig = plt.figure()
-            fig.suptitle(f'Rocket Motor Test - {self.timestamp_label} - {sensor["sensor_name"]}')
+            f.write(self.stats)
 
-            subplot = fig.add_subplot(1, 1, 1)
-
-            subplot.plot(df_clean[sensor['sensor_name']], linewidth=0.5)
-
-            if sensor['sensor_name'] == 'Load Cell':
-                fig.text(1, 1, stats, horizontalalignment='right', verticalalignment='top', transform=subplot.transAxes)
-
-            subplot.set_xlabel('Seconds')
-            subplot.set_ylabel(sensor['units'])
-            subplot_max = roundup(df_clean[sensor['sensor_name']].max(), 10)
-            subplot_min = rounddown(df_clean[sensor['sensor_name']].min(), 10)
-
-            if pd.isnull(subplot_min):
-                subplot_min = sensor['min']
-
-            if pd.isnull(subplot_max):
-                subplot_max = sensor['max']
-
-            logging.debug(f'subplot_min: {subplot_min}')
-            logging.debug(f'subplot_max: {subplot_max}')
-
-            if sensor['sensor_name'] == 'Load Cell':
-                subplot_min = -1
-
-            if subplot_min == subplot_max:
-                subplot_max += 10
-
-            subplot.set_ylim([subplot_min, subplot_max])
+    def output_final_results(self):
+        df = self.get_data()
 
-            fig.savefig(f'{self.base_dir}/{self.timestamp_label}/{sensor["sensor_name"]}.pdf', dpi=5000, orientation='landscape', bbox_inches='tight')
+        # The stats are already written out at the end of the run when the load cell was logged
+        analysis, self.stats, self.render_times = write_report(f'{self.base_dir}/{self.timestamp_label}', df, self.frequency, self.sensors, self.timestamp_label, self.stats)
 
-        plt.close('all')
+        self.update_catalog(df, analysis)
 
-        df_clean.to_csv(
-            f'{self.base_dir}/{self.timestamp_label}/processed_data.csv',
-            index_label='seconds',
-            mode='w',
-            header=True,
-            chunksize=10000
-        )
+    def update_catalog(self, df, analysis=None):
+        # The run is saved already, whatever goes wrong indexing it must not lose the rest of the shutdown
+        try:
+            catalog = RunCatalog(f'{self.base_dir}/{CATALOG_NAME}')
+            catalog.add(run_record(f'{self.base_dir}/{self.timestamp_label}', df, self.frequency, config_snapshot(self.sensors), analysis))
+            catalog.close()
+        except Exception:
+            logging.exception('Could not add the run to the catalog')
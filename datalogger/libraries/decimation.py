@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def minmax_decimate(x, y, buckets):
+    """
+    Cuts y down to the minimum and maximum of each of the buckets, in the
+    order they came in, so a line plot of the result has the same envelope
+    and peaks as a plot of every sample.  Series that already fit in the
+    buckets come back as they are.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    if len(y) <= 2 * buckets:
+        return x, y
+
+    size = -(-len(y) // buckets)
+    whole = len(y) // size * size
+
+    rows = y[:whole].reshape(-1, size)
+    offsets = np.arange(0, whole, size)
+
+    first = rows.argmin(axis=1)
+    second = rows.argmax(axis=1)
+
+    index = np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1) + offsets[:, None]
+    index = index.ravel()
+
+    if whole < len(y):
+        rest = y[whole:]
+        index = np.concatenate([index, np.sort([whole + rest.argmin(), whole + rest.argmax()])])
+
+    return x[index], y[index]
@@ -0,0 +1,177 @@
+"""
+Append-only binary journal of the raw scans of a run.
+
+    | magic 'RMDJ' | version (uint16) | header length (uint32) | JSON header | padding | scans ... |
+
+The JSON header holds the sample rate, the channel map, a snapshot of the
+sensor config and the device calibration table.  It is padded so the
+scans start on a 64 byte boundary, the scans follow as little-endian
+uint16 counts, one row of nchan samples per scan, appended as they come in.
+"""
+
+import os
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+from datetime import datetime
+
+from datalogger.libraries.config import attach_formulas, config_snapshot
+from datalogger.libraries.conversion import SampleConverter
+from datalogger.libraries.mccUSB import table
+from datalogger.libraries.usb_20x import usb_20x
+
+JOURNAL_MAGIC = b'RMDJ'
+JOURNAL_VERSION = 1
+JOURNAL_ALIGNMENT = 64
+JOURNAL_NAME = 'raw_data.journal'
+
+_prefix = struct.Struct('<4sHI')
+
+
+class JournalWriter:
+    def __init__(self, path, frequency, sensors, table_AIn, timestamp_label=None):
+        self.path = path
+
+        sensor_names = [None] * len(sensors)
+        for sensor_id, sensor in sensors.items():
+            sensor_names[sensor['channel']] = sensor['sensor_name']
+
+        self.nchan = len(sensor_names)
+        self.scans = 0
+
+        header = json.dumps({
+            'frequency': frequency,
+            'nchan': self.nchan,
+            'sensor_names': sensor_names,
+            'sensors': config_snapshot(sensors),
+            'calibration': [[table_AIn[chan].slope, table_AIn[chan].intercept] for chan in range(self.nchan)],
+            'dtype': '<u2',
+            'timestamp_label': timestamp_label,
+            'created': datetime.now().isoformat()
+        }).encode()
+
+        padding = -(_prefix.size + len(header)) % JOURNAL_ALIGNMENT
+
+        self.file = open(path, 'wb')
+        self.file.write(_prefix.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(header) + padding))
+        self.file.write(header + b' ' * padding)
+
+    def append(self, scans):
+        scans = np.ascontiguousarray(scans, dtype='<u2').reshape(-1, self.nchan)
+
+        self.file.write(scans.data)
+        self.scans += len(scans)
+
+    def flush(self, fsync=False):
+        self.file.flush()
+
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self, fsync=True):
+        if not self.file.closed:
+            self.flush(fsync)
+            self.file.close()
+
+
+class JournalReader:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as journal_file:
+            magic, version, header_length = _prefix.unpack(journal_file.read(_prefix.size))
+
+            if magic != JOURNAL_MAGIC:
+                raise ValueError(f'{path} is not a raw data journal')
+
+            if version > JOURNAL_VERSION:
+                raise ValueError(f'{path} is journal version {version}, only up to {JOURNAL_VERSION} is supported')
+
+            self.header = json.loads(journal_file.read(header_length))
+
+        self.frequency = self.header['frequency']
+        self.sample_time = 1 / self.frequency
+        self.nchan = self.header['nchan']
+        self.sensor_names = self.header['sensor_names']
+        self.sensors = attach_formulas(self.header['sensors'])
+
+        offset = _prefix.size + header_length
+        dtype = np.dtype(self.header['dtype'])
+
+        # A partly written last scan is left out
+        nscans = (os.path.getsize(path) - offset) // (dtype.itemsize * self.nchan)
+
+        if nscans:
+            self.data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(nscans, self.nchan))
+        else:
+            self.data = np.empty((0, self.nchan), dtype=dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def duration(self):
+        return len(self) * self.sample_time
+
+    @property
+    def table_AIn(self):
+        calibration = []
+        for slope, intercept in self.header['calibration']:
+            calibration.append(table())
+            calibration[-1].slope = slope
+            calibration[-1].intercept = intercept
+
+        return calibration
+
+    def converter(self, sensors=None, dtype=np.float64):
+        return SampleConverter(sensors or self.sensors, self.table_AIn, usb_20x.volts, dtype)
+
+    def scan_range(self, start_time=None, end_time=None):
+        # The first scan is logged at one sample time
+        start = 0 if start_time is None else int(np.clip(np.ceil(start_time * self.frequency) - 1, 0, len(self)))
+        stop = len(self) if end_time is None else int(np.clip(np.floor(end_time * self.frequency), start, len(self)))
+
+        return start, stop
+
+    def timestamps(self, start=0, stop=None):
+        stop = len(self) if stop is None else stop
+
+        return np.arange(start + 1, stop + 1) * self.sample_time
+
+    def scans(self, start_time=None, end_time=None):
+        """
+        Zero-copy view of the raw counts, shaped (nscans, nchan), logged
+        between start_time and end_time seconds.
+        """
+        start, stop = self.scan_range(start_time, end_time)
+
+        return self.data[start:stop]
+
+    def get_raw_data(self, start_time=None, end_time=None, sensors=None):
+        start, stop = self.scan_range(start_time, end_time)
+        volts = self.converter(sensors).volts(self.data[start:stop])
+
+        return pd.DataFrame(volts, columns=self.sensor_names, index=pd.Index(self.timestamps(start, stop), name='seconds'))
+
+    def get_data(self, start_time=None, end_time=None, sensors=None):
+        start, stop = self.scan_range(start_time, end_time)
+        volts, units = self.converter(sensors).convert(self.data[start:stop])
+
+        return pd.DataFrame(units, columns=self.sensor_names, index=pd.Index(self.timestamps(start, stop), name='seconds'))
+
+    def export_csv(self, directory, sensors=None, chunk_scans=2**16):
+        converter = self.converter(sensors)
+
+        for file_name in ('converted_data.csv', 'raw_data.csv'):
+            pd.DataFrame(columns=self.sensor_names).to_csv(f'{directory}/{file_name}', index_label='seconds')
+
+        for start in range(0, len(self), chunk_scans):
+            stop = min(start + chunk_scans, len(self))
+            volts, units = converter.convert(self.data[start:stop])
+            index = self.timestamps(start, stop)
+
+            pd.DataFrame(units, columns=self.sensor_names, index=index).to_csv(f'{directory}/converted_data.csv', mode='a', header=False)
+            pd.DataFrame(volts, columns=self.sensor_names, index=index).to_csv(f'{directory}/raw_data.csv', mode='a', header=False)
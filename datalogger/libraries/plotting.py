@@ -0,0 +1,64 @@
+import os
+import logging
+import multiprocessing
+
+from time import perf_counter
+
+from matplotlib.figure import Figure
+
+# Inches, and the resolution they are rendered at
+PLOT_SIZE = (6.4, 4.8)
+PLOT_DPI = 300
+
+# Pixels across a plot, the data is decimated to the min and max of this many buckets as more could never show
+PLOT_WIDTH = int(PLOT_SIZE[0] * PLOT_DPI)
+
+
+def render_plot(plot):
+    start = perf_counter()
+
+    # A bare Figure, so the rendering doesn't depend on the pyplot backend of the parent process
+    fig = Figure(figsize=PLOT_SIZE)
+    fig.suptitle(plot['title'])
+
+    subplot = fig.add_subplot(1, 1, 1)
+
+    subplot.plot(plot['x'], plot['y'], linewidth=0.5)
+
+    if plot['stats']:
+        fig.text(1, 1, plot['stats'], horizontalalignment='right', verticalalignment='top', transform=subplot.transAxes)
+
+    subplot.set_xlabel('Seconds')
+    subplot.set_ylabel(plot['units'])
+    subplot.set_ylim(plot['ylim'])
+
+    fig.savefig(plot['path'], dpi=PLOT_DPI, orientation='landscape', bbox_inches='tight')
+
+    return plot['path'], perf_counter() - start
+
+
+def render_plots(plots, processes=None):
+    """
+    Renders the plots in a process pool, one per plot up to the number of
+    cores, or right here on a single core.  Returns how long each one took to render, by path.
+    """
+    if not plots:
+        return {}
+
+    processes = processes or min(len(plots), os.cpu_count() or 1)
+
+    start = perf_counter()
+
+    if processes > 1:
+        # Not forked, the logger has threads running that may hold a lock the child would then wait on forever
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            render_times = dict(pool.map(render_plot, plots))
+    else:
+        render_times = dict(map(render_plot, plots))
+
+    for path, render_time in render_times.items():
+        logging.info(f'Rendered {os.path.basename(path)} in {render_time:.2f} seconds')
+
+    logging.info(f'Rendered {len(plots)} plots in {perf_counter() - start:.2f} seconds')
+
+    return render_times
@@ -0,0 +1,163 @@
+"""
+Min/max/mean downsamples of a run, so a window of any length can be shown
+without reading every sample of it.
+
+Every level is a file of float32 buckets of `factor` scans, each bucket
+being the min, max and mean of every channel, shaped (3, nchan).  The
+last bucket of a level holds whatever was left over at the end of the
+run.  pyramid.json describes the levels.
+"""
+
+import os
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+PYRAMID_DIR = 'pyramid'
+PYRAMID_LEVELS = (10, 100, 1000)
+PYRAMID_STATS = ('min', 'max', 'mean')
+
+
+class PyramidWriter:
+    """
+    Works out the buckets as the scans come in and keeps them until
+    write_pending(), which the StorageWriter calls from its own thread
+    every time it writes the journal, so the consumer never touches the
+    disk for them.
+    """
+
+    def __init__(self, directory, frequency, sensor_names, levels=PYRAMID_LEVELS):
+        self.directory = directory
+        self.nchan = len(sensor_names)
+        self.levels = levels
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(f'{directory}/pyramid.json', 'w') as header_file:
+            json.dump({
+                'frequency': frequency,
+                'nchan': self.nchan,
+                'sensor_names': sensor_names,
+                'levels': list(levels),
+                'stats': list(PYRAMID_STATS),
+                'dtype': '<f4'
+            }, header_file, indent=4)
+
+        self.files = {factor: open(f'{directory}/level_{factor}.bin', 'wb') for factor in levels}
+
+        # Scans that don't fill a bucket yet, per level
+        self.carry = {factor: np.empty((0, self.nchan)) for factor in levels}
+
+        # Buckets not written out yet, per level
+        self.pending = {factor: [] for factor in levels}
+        self.pending_lock = threading.Lock()
+
+    def append(self, values):
+        values = np.asarray(values, dtype=np.float64).reshape(-1, self.nchan)
+
+        for factor in self.levels:
+            scans = np.concatenate([self.carry[factor], values])
+            whole = len(scans) // factor * factor
+
+            if whole:
+                self._add(factor, scans[:whole].reshape(-1, factor, self.nchan))
+
+            self.carry[factor] = scans[whole:]
+
+    def _add(self, factor, buckets):
+        stats = np.stack([buckets.min(axis=1), buckets.max(axis=1), buckets.mean(axis=1)], axis=1)
+
+        with self.pending_lock:
+            self.pending[factor].append(stats.astype('<f4'))
+
+    def write_pending(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, {factor: [] for factor in self.levels}
+
+        for factor, stats in pending.items():
+            if stats and not self.files[factor].closed:
+                self.files[factor].write(np.concatenate(stats).data)
+
+                # So the levels can be read while logging
+                self.files[factor].flush()
+
+    def close(self):
+        for factor in self.levels:
+            if len(self.carry[factor]):
+                self._add(factor, self.carry[factor][None])
+                self.carry[factor] = np.empty((0, self.nchan))
+
+        self.write_pending()
+
+        for pyramid_file in self.files.values():
+            pyramid_file.close()
+
+
+class PyramidReader:
+    """
+    Reads the levels of a run and picks the one to show a window with.
+    The journal, when given, is used for windows too short for any level.
+    """
+
+    def __init__(self, directory, journal=None):
+        self.directory = directory
+        self.journal = journal
+
+        with open(f'{directory}/pyramid.json') as header_file:
+            self.header = json.load(header_file)
+
+        self.frequency = self.header['frequency']
+        self.sample_time = 1 / self.frequency
+        self.nchan = self.header['nchan']
+        self.sensor_names = self.header['sensor_names']
+        self.levels = sorted(self.header['levels'])
+
+    def level(self, factor):
+        path = f'{self.directory}/level_{factor}.bin'
+        dtype = np.dtype(self.header['dtype'])
+
+        nbuckets = os.path.getsize(path) // (dtype.itemsize * 3 * self.nchan)
+        if not nbuckets:
+            return np.empty((0, 3, self.nchan), dtype=dtype)
+
+        return np.memmap(path, dtype=dtype, mode='r', shape=(nbuckets, 3, self.nchan))
+
+    def pick_level(self, scans, pixels):
+        # The coarsest level that still gives every pixel a bucket
+        for factor in reversed(self.levels):
+            if scans / factor >= pixels:
+                return factor
+
+        return 1 if self.journal is not None else self.levels[0]
+
+    def query(self, start_time=None, end_time=None, pixels=1000):
+        """
+        Returns the level used and the min, max and mean DataFrames of the
+        window between start_time and end_time seconds, with about pixels
+        rows or more, indexed by the time of the first scan of each bucket.
+        """
+        start = 0 if start_time is None else max(int(np.ceil(start_time * self.frequency)) - 1, 0)
+        stop = None if end_time is None else int(np.floor(end_time * self.frequency))
+
+        if stop is None:
+            stop = len(self.journal) if self.journal is not None else len(self.level(self.levels[0])) * self.levels[0]
+
+        factor = self.pick_level(max(stop - start, 0), pixels)
+
+        if factor == 1:
+            units = self.journal.get_data(start_time, end_time)
+            return factor, units, units, units
+
+        buckets = self.level(factor)
+        first = min(start // factor, len(buckets))
+        last = min(-(-stop // factor), len(buckets))
+
+        index = pd.Index((np.arange(first, last) * factor + 1) * self.sample_time, name='seconds')
+
+        return (factor, *[
+            pd.DataFrame(buckets[first:last, stat], columns=self.sensor_names, index=index)
+            for stat in range(len(PYRAMID_STATS))
+        ])
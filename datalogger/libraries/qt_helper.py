@@ -8,66 +8,48 @@
 ###################################################################
 
 import sys
-import threading
 import numpy as np
 import matplotlib
-import queue
-import time
 import logging
 
-import pandas as pd
+from time import perf_counter
 
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 
 from matplotlib.figure import Figure
+from matplotlib.backend_bases import ResizeEvent
 from matplotlib.animation import TimedAnimation
 from matplotlib.lines import Line2D
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
-matplotlib.use("Qt5Agg")
-
-qt_queue = queue.Queue(10)
-qt_exit_queue = queue.Queue(1)
-
+from datalogger.libraries.decimation import minmax_decimate
+from datalogger.libraries.ring_buffer import LiveBuffer
 
-def data_send_loop(add_data_callback_func, app):
-    # Setup the signal-slot mechanism.
-    pyqt_callback = Communicate()
-    pyqt_callback.data_signal.connect(add_data_callback_func)
-
-    while qt_exit_queue.empty():
-        for x in range(100):
-            if not qt_queue.empty():
-                voltages = qt_queue.get()
-                pyqt_callback.data_signal.emit(voltages)  # <- Here you emit a signal when using pyqt!
-            else:
-                time.sleep(.1)
-                break
-
-        time.sleep(.01)
-
-    logging.debug('Stopping QT')
-    app.quit()
+matplotlib.use("Qt5Agg")
 
 
 class QTHelper:
-    def __init__(self, data_logger, raw_voltage=False):
+    def __init__(self, data_logger, raw_voltage=False, fps=25, grid=False):
         app = QApplication(sys.argv)
         QApplication.setStyle(QStyleFactory.create('Plastique'))
 
-        data_logger.start(qt_queue, qt_exit_queue)
+        # A few seconds of samples, the window pulls them many times a second
+        live = LiveBuffer(8 * 2**data_logger.batch_exp, data_logger.nchan)
+
+        data_logger.start(live)
 
-        CustomMainWindow(app, data_logger, raw_voltage)
+        CustomMainWindow(app, data_logger, live, raw_voltage, fps, grid)
 
         app.exec_()
 
 
 class CustomMainWindow(QMainWindow):
-    def __init__(self, app, data_logger, raw_voltage=False):
+    def __init__(self, app, data_logger, live, raw_voltage=False, fps=25, grid=False):
         super(CustomMainWindow, self).__init__()
 
+        self.app = app
         self.sensors = data_logger.sensors
         self.data_logger = data_logger
 
@@ -94,36 +76,51 @@ class CustomMainWindow(QMainWindow):
                 self.sensors[sensor_name]['min'],
                 self.sensors[sensor_name]['max'],
                 raw_voltage,
-                data_logger.frequency
+                data_logger.frequency,
+                fps
             )
 
             self.stackedGraphs.addWidget(self.myFigs[sensor_name])
 
-        self.LAYOUT_A.addWidget(self.stackedGraphs, *(0, 0, 1, 3))
+        # All the sensors together, as the last page
+        self.grid_sensors = sorted(self.sensors.values(), key=lambda sensor: sensor['channel'])
+        self.gridFig = CustomGridCanvas(self.grid_sensors, raw_voltage, data_logger.frequency, fps)
+        self.grid_index = self.stackedGraphs.addWidget(self.gridFig)
+
+        self.LAYOUT_A.addWidget(self.stackedGraphs, *(0, 0, 1, 4))
 
         self.sensor_index = 0
-        self.stackedGraphs.setCurrentIndex(self.sensor_index)
+        self.stackedGraphs.setCurrentIndex(self.grid_index if grid else self.sensor_index)
 
         self.prev_button = QPushButton("PREV")
         self.prev_button.clicked.connect(self.prev_button_callback)
         self.LAYOUT_A.addWidget(self.prev_button, *(1, 0))
 
+        self.grid_button = QPushButton("GRID")
+        self.grid_button.clicked.connect(self.grid_button_callback)
+        self.LAYOUT_A.addWidget(self.grid_button, *(1, 1))
+
         self.next_button = QPushButton("NEXT")
         self.next_button.clicked.connect(self.next_button_callback)
-        self.LAYOUT_A.addWidget(self.next_button, *(1, 2))
+        self.LAYOUT_A.addWidget(self.next_button, *(1, 3))
 
         self.done_button = QPushButton("DONE")
         self.done_button.clicked.connect(self.done_button_callback)
-        self.LAYOUT_A.addWidget(self.done_button, *(1, 1))
-
-        # Add the callbackfunc to ..
-        my_data_loop = threading.Thread(
-            name='my_data_loop',
-            target=data_send_loop,
-            daemon=True,
-            args=(self.add_data_callback_func, app,)
-        )
-        my_data_loop.start()
+        self.LAYOUT_A.addWidget(self.done_button, *(1, 2))
+
+        # The samples are pulled on the GUI thread, the consumer never waits on the GUI
+        self.live = live
+        self.live_cursor = 0
+        self.dropped_frames = 0
+        self.dropped_scans = 0
+
+        self.pull_interval = 1 / fps
+        self.last_pull = perf_counter()
+
+        self.pull_timer = QTimer(self)
+        self.pull_timer.timeout.connect(self.pull_data)
+        self.pull_timer.start(int(1000 / fps))
+
         self.show()
 
     def prev_button_callback(self):
@@ -135,19 +132,50 @@ class CustomMainWindow(QMainWindow):
     def next_button_callback(self):
         sensor_index = self.stackedGraphs.currentIndex()
 
-        if sensor_index != len(self.sensors) - 1:
+        if sensor_index < len(self.sensors) - 1:
             self.stackedGraphs.setCurrentIndex(sensor_index + 1)
 
+    def grid_button_callback(self):
+        # Toggles between the grid and the last sensor shown on its own
+        if self.stackedGraphs.currentIndex() == self.grid_index:
+            self.stackedGraphs.setCurrentIndex(self.sensor_index)
+        else:
+            self.sensor_index = self.stackedGraphs.currentIndex()
+            self.stackedGraphs.setCurrentIndex(self.grid_index)
+
     def done_button_callback(self):
         logging.debug('Stopping due to clicking Done button...')
         self.data_logger.stop()
 
-    def add_data_callback_func(self, df):
+    def pull_data(self):
+        now = perf_counter()
+
+        # Timer ticks that never happened because the GUI was busy
+        missed = int((now - self.last_pull) / self.pull_interval) - 1
+        if missed > 0:
+            self.dropped_frames += missed
+        self.last_pull = now
+
+        values, self.live_cursor, skipped = self.live.read(self.live_cursor)
+        if skipped:
+            self.dropped_scans += skipped
+            logging.debug(f'The plots fell behind, skipped {skipped} samples')
+
+        if len(values):
+            self.add_data_callback_func(values)
+
+        if not self.data_logger.started:
+            logging.debug(f'Stopping QT, dropped {self.dropped_frames} frames and {self.dropped_scans} samples')
+            self.pull_timer.stop()
+            self.app.quit()
+
+    def add_data_callback_func(self, values):
+        # The samples are already converted, every canvas gets its whole channel at once
         for sensor_id, sensor in self.sensors.items():
-            df[sensor['sensor_name']].apply(sensor['formula'], **sensor['input'])
+            self.myFigs[sensor_id].add_data(values[:, sensor['channel']])
 
-            for value in df[sensor['sensor_name']]:
-                self.myFigs[sensor_id].add_data(value)
+        # The grid shows the channels in order
+        self.gridFig.add_data(values)
 
     def closeEvent(self, event):
         logging.debug('Stopping due to closing QT window...')
@@ -156,13 +184,17 @@ class CustomMainWindow(QMainWindow):
 
 
 class CustomFigCanvas(FigureCanvas, TimedAnimation):
-    def __init__(self, sensor_name, sensor_units, sensor_min, sensor_max, raw_voltage, frequency):
-        self.added_data = []
+    def __init__(self, sensor_name, sensor_units, sensor_min, sensor_max, raw_voltage, frequency, fps=25):
         self.abc = 0
+        # Only redraw when there is something new to show
+        self.dirty = True
+        self.paused = False
         # The data
         self.xlim = (2 * 60) * frequency  # Chart the past 2 minutes regardless of the frequency
         self.n = np.linspace(0, self.xlim - 1, self.xlim)
+        # Circular buffer of the samples, the oldest one is at write_index
         self.y = (self.n * 0.0) + 50
+        self.write_index = 0
         # The window
         self.fig = Figure(figsize=(5, 5), dpi=75)
         self.ax1 = self.fig.add_subplot(111)
@@ -191,7 +223,7 @@ class CustomFigCanvas(FigureCanvas, TimedAnimation):
             self.ax1.yaxis.tick_right()
 
         FigureCanvas.__init__(self, self.fig)
-        TimedAnimation.__init__(self, self.fig, interval=1, blit=True)
+        TimedAnimation.__init__(self, self.fig, interval=int(1000 / fps), blit=True)
 
     def new_frame_seq(self):
         return iter(range(self.n.size))
@@ -201,36 +233,173 @@ class CustomFigCanvas(FigureCanvas, TimedAnimation):
         for line in lines:
             line.set_data([], [])
 
-    def add_data(self, value):
-        self.added_data.append(value)
+    def add_data(self, values):
+        # A column of samples, or a (samples, sensors) block for the grid
+        values = np.asarray(values, dtype=np.float64).reshape((-1,) + self.y.shape[1:])[-self.xlim:]
+
+        first = min(len(values), self.xlim - self.write_index)
+        self.y[self.write_index:self.write_index + first] = values[:first]
+        self.y[:len(values) - first] = values[first:]
+
+        self.write_index = (self.write_index + len(values)) % self.xlim
+        self.dirty = True
+
+    def showEvent(self, event):
+        super(CustomFigCanvas, self).showEvent(event)
+
+        # Hidden behind another sensor in the QStackedWidget until now, unless the animation was stopped for good
+        if self.paused and self.event_source is not None:
+            self.paused = False
+            self.dirty = True
+            self.event_source.start()
+
+    def hideEvent(self, event):
+        self.paused = True
+        if self.event_source is not None:
+            self.event_source.stop()
+
+        super(CustomFigCanvas, self).hideEvent(event)
+
+    def _draw_next_frame(self, framedata, blit):
+        if self.dirty:
+            TimedAnimation._draw_next_frame(self, framedata, blit)
 
     def _step(self, *args):
-        # Extends the _step() method for the TimedAnimation class.
+        # A frame that fails is skipped, the animation keeps going with the next one
         try:
-            TimedAnimation._step(self, *args)
+            return TimedAnimation._step(self, *args)
         except Exception:
             self.abc += 1
-            # logging.info(str(self.abc))
-            TimedAnimation._stop(self)
-            pass
+
+            # Only the first one in full, the same error would otherwise be logged every frame
+            if self.abc == 1:
+                logging.exception('Could not draw the live graph')
+            else:
+                logging.debug(f'Could not draw the live graph, {self.abc} frames failed')
+
+            return True
 
     def _draw_frame(self, framedata):
         margin = 2
 
-        while len(self.added_data) > 0:
-            self.y = np.roll(self.y, -1)
-            self.y[-1] = self.added_data[0]
-            del(self.added_data[0])
+        # Oldest to newest, one copy per frame
+        y = np.concatenate((self.y[self.write_index:], self.y[:self.write_index]))
 
-        self.line1.set_data(self.n[0: self.n.size - margin], self.y[0: self.n.size - margin])
-        self.line1_tail.set_data(np.append(self.n[-10:-1 - margin], self.n[-1 - margin]), np.append(self.y[-10:-1 - margin], self.y[-1 - margin]))
-        self.line1_head.set_data(self.n[-1 - margin], self.y[-1 - margin])
+        # Down to the min and max of each pixel column of the axes
+        pixels = max(int(self.ax1.bbox.width), 100)
+        self.line1.set_data(*minmax_decimate(self.n[0: self.n.size - margin], y[0: self.n.size - margin], pixels))
+        self.line1_tail.set_data(np.append(self.n[-10:-1 - margin], self.n[-1 - margin]), np.append(y[-10:-1 - margin], y[-1 - margin]))
+        self.line1_head.set_data(self.n[-1 - margin], y[-1 - margin])
         self._drawn_artists = [self.line1, self.line1_tail, self.line1_head]
 
+        self.dirty = False
+
+
+class CustomGridCanvas(CustomFigCanvas):
+    """
+    Every sensor in one figure, one panel each over a shared time axis.
+    All the lines are blitted in the same frame, and each panel rescales
+    on its own when its data leaves the y limits or shrinks well inside them.
+    """
+
+    def __init__(self, sensors, raw_voltage, frequency, fps=25):
+        self.abc = 0
+        self.dirty = True
+        self.paused = False
+
+        self.xlim = (2 * 60) * frequency  # Chart the past 2 minutes regardless of the frequency
+        self.n = np.linspace(0, self.xlim - 1, self.xlim)
+
+        # Circular buffer of all the sensors, filled as data arrives
+        self.y = np.zeros((self.xlim, len(sensors)))
+        self.write_index = 0
+        self.count = 0
+
+        self.fig = Figure(figsize=(5, 5), dpi=75)
+        axes = self.fig.subplots(len(sensors), 1, sharex=True, squeeze=False)[:, 0]
+
+        self.axes = []
+        self.lines = []
+        for ax, sensor in zip(axes, sensors):
+            ax.set_ylabel(sensor['sensor_name'] if raw_voltage else f'{sensor["sensor_name"]} ({sensor["units"]})', fontsize='small')
+            ax.yaxis.set_label_position("right")
+            ax.yaxis.tick_right()
+            ax.set_xlim(0, self.xlim - 1)
+            ax.set_ylim(-12, 12) if raw_voltage else ax.set_ylim(sensor['min'], sensor['max'])
+
+            line = Line2D([], [], color='blue', linewidth=1)
+            ax.add_line(line)
+
+            self.axes.append(ax)
+            self.lines.append(line)
+
+        axes[-1].set_xlabel('datapoints')
+
+        # The lines of the latest frame, decimated to the width of the axes
+        self.decimated = [([], []) for line in self.lines]
+
+        FigureCanvas.__init__(self, self.fig)
+        TimedAnimation.__init__(self, self.fig, interval=int(1000 / fps), blit=True)
+
+        # The decimation follows the width of the axes, so a resized window needs a new frame
+        self.mpl_connect('resize_event', self._resized)
+
+    def _resized(self, event):
+        self.dirty = True
+
+    def add_data(self, values):
+        super(CustomGridCanvas, self).add_data(values)
+        self.count += len(values)
+
+    def _init_draw(self):
+        for line in self.lines:
+            line.set_data([], [])
+
+    def _decimate(self):
+        # Oldest to newest, one copy per frame for all the sensors
+        y = np.concatenate((self.y[self.write_index:], self.y[:self.write_index]))
+
+        start = self.xlim - min(self.count, self.xlim)
+        pixels = max(int(self.axes[0].bbox.width), 100)
+
+        return [minmax_decimate(self.n[start:], y[start:, chan], pixels) for chan in range(len(self.lines))]
+
+    def _autoscale(self):
+        rescaled = False
+
+        # The decimation keeps the min and max of every bucket, so these are the limits of the whole window
+        for ax, (x, y) in zip(self.axes, self.decimated):
+            if not len(y):
+                continue
+
+            low, high = y.min(), y.max()
+            bottom, top = ax.get_ylim()
+
+            if low < bottom or high > top or (top - bottom) > 4 * max(high - low, 1e-9):
+                margin = (high - low) * .10 or 1
+                ax.set_ylim(low - margin, high + margin)
+                rescaled = True
+
+        return rescaled
+
+    def _draw_next_frame(self, framedata, blit):
+        if not self.dirty:
+            return
+
+        self.decimated = self._decimate()
+
+        if self._autoscale():
+            # Handled as a resize: a full draw for the new ticks, the blitting starts again once it is done
+            self.callbacks.process('resize_event', ResizeEvent('resize_event', self))
+            self.draw_idle()
+            return
+
+        TimedAnimation._draw_next_frame(self, framedata, blit)
+
+    def _draw_frame(self, framedata):
+        for line, decimated in zip(self.lines, self.decimated):
+            line.set_data(*decimated)
+
+        self._drawn_artists = list(self.lines)
 
-# You need to setup a signal slot mechanism, to
-# send data to your GUI in a thread-safe way.
-# Believe me, if you don't do this right, things
-# go very very wrong..
-class Communicate(QObject):
-    data_signal = pyqtSignal(pd.DataFrame)
+        self.dirty = False
@@ -0,0 +1,201 @@
+import os
+import json
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+
+from time import perf_counter
+from datetime import datetime
+
+from datalogger.libraries.analytics import BurnAnalysis, impulse_letter
+from datalogger.libraries.catalog import run_record
+from datalogger.libraries.config import attach_formulas, config_snapshot
+from datalogger.libraries.decimation import minmax_decimate
+from datalogger.libraries.journal import JournalReader, JOURNAL_NAME
+from datalogger.libraries.plotting import render_plots, PLOT_WIDTH
+
+# Bump when a change to the analysis or the report changes what comes out of the same data
+ANALYSIS_VERSION = 1
+
+ANALYSIS_CACHE = 'analysis.json'
+
+
+def roundup(x, mod):
+    return x if x % mod == 0 else x + mod - x % mod
+
+
+def rounddown(x, mod):
+    return x if x % mod == 0 else (x + 1) - mod - (x + 1) % mod
+
+
+def format_stats(results):
+    stats = f"""
+        Motor: {impulse_letter(results['impulse'])}{int(results['average_thrust'])}  
+        Impulse: {results['impulse']:.2f} Ns  
+        Average Thrust: {results['average_thrust']:.2f} N  
+        Burn Time: {results['burn_time']:.1f} s  
+        Start Time: {results['start_timestamp']:.1f} s  
+        End Time: {results['end_timestamp']:.1f} s  
+        """
+
+    return stats
+
+
+def write_report(run_dir, df, frequency, sensors, timestamp_label, stats=None, processes=None):
+    """
+    Writes stats.txt, a plot per sensor and processed_data.csv of a run
+    from its converted data.  stats.txt is left alone when the stats are
+    passed in.  Returns the BurnAnalysis, the stats and the render time of
+    every plot.
+    """
+    analysis = BurnAnalysis(df['Load Cell'].to_numpy(), frequency)
+
+    if not stats:
+        stats = format_stats(analysis.results())
+
+        logging.info(stats)
+
+        with open(f'{run_dir}/stats.txt', 'w') as f:
+            f.write(stats)
+
+    df_clean = analysis.clean(df, offset_sec=5)
+
+    plots = []
+    for sensor_id, sensor in sensors.items():
+        # The axis limits come from every sample, only the plotted line is decimated
+        subplot_max = roundup(df_clean[sensor['sensor_name']].max(), 10)
+        subplot_min = rounddown(df_clean[sensor['sensor_name']].min(), 10)
+
+        if pd.isnull(subplot_min):
+            subplot_min = sensor['min']
+
+        if pd.isnull(subplot_max):
+            subplot_max = sensor['max']
+
+        logging.debug(f'subplot_min: {subplot_min}')
+        logging.debug(f'subplot_max: {subplot_max}')
+
+        if sensor['sensor_name'] == 'Load Cell':
+            subplot_min = -1
+
+        if subplot_min == subplot_max:
+            subplot_max += 10
+
+        x, y = minmax_decimate(df_clean.index.to_numpy(), df_clean[sensor['sensor_name']].to_numpy(), PLOT_WIDTH)
+
+        plots.append({
+            'title': f'Rocket Motor Test - {timestamp_label} - {sensor["sensor_name"]}',
+            'path': f'{run_dir}/{sensor["sensor_name"]}.pdf',
+            'x': x,
+            'y': y,
+            'units': sensor['units'],
+            'ylim': [subplot_min, subplot_max],
+            'stats': stats if sensor['sensor_name'] == 'Load Cell' else None
+        })
+
+    render_times = render_plots(plots, processes)
+
+    df_clean.to_csv(
+        f'{run_dir}/processed_data.csv',
+        index_label='seconds',
+        mode='w',
+        header=True,
+        chunksize=10000
+    )
+
+    return analysis, stats, render_times
+
+
+def file_hash(path, chunk_size=2**20):
+    digest = hashlib.blake2b(digest_size=20)
+
+    with open(path, 'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def cache_key(data_hash, sensors):
+    key = json.dumps({
+        'data': data_hash,
+        'sensors': config_snapshot(sensors) if sensors else None,
+        'version': ANALYSIS_VERSION
+    }, sort_keys=True)
+
+    return hashlib.blake2b(key.encode(), digest_size=20).hexdigest()
+
+
+def _csv_sensors(columns):
+    # Runs logged before the journal don't record their sensors
+    return {
+        f'channel{chan}': {'channel': chan, 'sensor_name': name, 'units': '', 'min': 0, 'max': 10}
+        for chan, name in enumerate(columns)
+    }
+
+
+def reanalyze_run(run_dir, sensors=None, force=False):
+    """
+    Writes the report of a run directory again, unless the data, the
+    sensors and the analysis are the same as last time.  The sensors
+    default to the ones the run was logged with.  Returns what was done,
+    how long it took and the catalog entry of the run.
+    """
+    start = perf_counter()
+    timestamp_label = os.path.basename(os.path.abspath(run_dir))
+
+    # Sent to the pool without the formulas, which can't be pickled
+    if sensors:
+        sensors = attach_formulas(config_snapshot(sensors))
+
+    result = {'run_dir': run_dir, 'status': 'skipped', 'seconds': 0., 'record': None}
+
+    try:
+        if os.path.exists(f'{run_dir}/{JOURNAL_NAME}'):
+            data_file = f'{run_dir}/{JOURNAL_NAME}'
+        elif os.path.exists(f'{run_dir}/converted_data.csv'):
+            data_file = f'{run_dir}/converted_data.csv'
+        else:
+            return result
+
+        key = cache_key(file_hash(data_file), sensors)
+
+        if not force and os.path.exists(f'{run_dir}/{ANALYSIS_CACHE}'):
+            with open(f'{run_dir}/{ANALYSIS_CACHE}') as cache_file:
+                if json.load(cache_file).get('key') == key:
+                    result.update(status='cached', seconds=perf_counter() - start)
+                    return result
+
+        if data_file.endswith(JOURNAL_NAME):
+            journal = JournalReader(data_file)
+            run_sensors = sensors or journal.sensors
+            df = journal.get_data(sensors=run_sensors)
+            frequency = journal.frequency
+        else:
+            df = pd.read_csv(data_file, index_col=0)
+            run_sensors = _csv_sensors(df.columns)
+            frequency = round(1 / np.median(np.diff(df.index.to_numpy())))
+
+        # The processes of the pool can't start a pool of their own for the plots
+        analysis, stats, render_times = write_report(run_dir, df, frequency, run_sensors, timestamp_label, processes=1)
+
+        with open(f'{run_dir}/{ANALYSIS_CACHE}', 'w') as cache_file:
+            json.dump({
+                'key': key,
+                'version': ANALYSIS_VERSION,
+                'created': datetime.now().isoformat(),
+                'results': {name: float(value) for name, value in analysis.results().items()},
+                'render_times': render_times
+            }, cache_file, indent=4)
+
+        result.update(status='analyzed', record=run_record(run_dir, df, frequency, config_snapshot(run_sensors), analysis))
+
+    except Exception as e:
+        logging.info(f'Could not reanalyze {timestamp_label}: {e}')
+        result['status'] = 'failed'
+
+    result['seconds'] = perf_counter() - start
+
+    return result
@@ -0,0 +1,203 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer of raw scans between a single producer and a
+    single consumer.
+
+    Only the producer moves the write cursor and only the consumer moves the
+    read cursor, so the scans are copied in and read out without holding a
+    lock.  The condition variable is only used to wake up a consumer that
+    is waiting for data.
+
+    The producer never blocks: a write that does not fit is dropped and
+    counted as an overflow, the device FIFO has to keep being drained.
+    """
+
+    # Indexes into self.state
+    WRITE = 0
+    READ = 1
+    OVERFLOWS = 2
+    DROPPED = 3
+    MAX_FILL = 4
+    CLOSED = 5
+
+    def __init__(self, capacity, nchan, dtype=np.uint16, buffer=None, state=None, condition=None):
+        self.capacity = capacity
+        self.nchan = nchan
+
+        if buffer is None:
+            buffer = np.zeros((capacity, nchan), dtype=dtype)
+
+        if state is None:
+            state = np.zeros(6, dtype=np.int64)
+
+        if condition is None:
+            condition = threading.Condition()
+
+        self.buffer = buffer
+        self.state = state
+        self.condition = condition
+
+    @property
+    def write_cursor(self):
+        return int(self.state[self.WRITE])
+
+    @property
+    def read_cursor(self):
+        return int(self.state[self.READ])
+
+    @property
+    def fill_level(self):
+        return int(self.state[self.WRITE] - self.state[self.READ])
+
+    @property
+    def fill_ratio(self):
+        return self.fill_level / self.capacity
+
+    @property
+    def max_fill(self):
+        return int(self.state[self.MAX_FILL])
+
+    @property
+    def overflows(self):
+        return int(self.state[self.OVERFLOWS])
+
+    @property
+    def dropped_scans(self):
+        return int(self.state[self.DROPPED])
+
+    @property
+    def closed(self):
+        return bool(self.state[self.CLOSED])
+
+    @property
+    def drained(self):
+        return self.closed and not self.fill_level
+
+    def reset(self):
+        with self.condition:
+            self.state[:] = 0
+
+    def close(self):
+        with self.condition:
+            self.state[self.CLOSED] = 1
+            self.condition.notify_all()
+
+    def write(self, scans):
+        """
+        Copies the scans into the buffer.  Returns False, and counts an
+        overflow, if they do not fit.
+        """
+        scans = np.asarray(scans).reshape(-1, self.nchan)
+        count = len(scans)
+
+        write = int(self.state[self.WRITE])
+        fill = write - int(self.state[self.READ])
+
+        if count > self.capacity - fill:
+            self.state[self.OVERFLOWS] += 1
+            self.state[self.DROPPED] += count
+            return False
+
+        start = write % self.capacity
+        first = min(count, self.capacity - start)
+
+        self.buffer[start:start + first] = scans[:first]
+        self.buffer[:count - first] = scans[first:]
+
+        with self.condition:
+            self.state[self.WRITE] = write + count
+            self.state[self.MAX_FILL] = max(self.state[self.MAX_FILL], fill + count)
+            self.condition.notify()
+
+        return True
+
+    def read(self, max_scans=None, timeout=None):
+        """
+        Waits up to timeout seconds for scans and returns a view of the
+        oldest contiguous run of them, at most max_scans long.  The view
+        stays valid until it is handed back with release().  Returns None
+        on timeout, or once the buffer is closed and has been drained.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.state[self.CLOSED] or self.state[self.WRITE] > self.state[self.READ], timeout)
+
+            read = int(self.state[self.READ])
+            count = int(self.state[self.WRITE]) - read
+
+        if not count:
+            return None
+
+        start = read % self.capacity
+        count = min(count, self.capacity - start)
+
+        if max_scans:
+            count = min(count, max_scans)
+
+        return self.buffer[start:start + count]
+
+    def release(self, count):
+        self.state[self.READ] += count
+
+
+class LiveBuffer:
+    """
+    The latest converted samples, for a GUI to pull on its own timer.
+
+    Unlike RingBuffer the writer never waits for the reader: once the
+    buffer is full the oldest samples are overwritten.  Every reader keeps
+    its own cursor and gets whatever came in since, along with how many
+    samples it missed because it fell more than a buffer behind.
+
+    There is no lock.  The writer moves the `writing` cursor before it
+    copies and the `written` cursor after, so a reader can tell which of
+    the samples it copied were overwritten meanwhile and throw them away.
+    """
+
+    def __init__(self, capacity, nchan, dtype=np.float64):
+        self.capacity = capacity
+        self.nchan = nchan
+
+        self.buffer = np.zeros((capacity, nchan), dtype=dtype)
+
+        self.writing = 0
+        self.written = 0
+
+    def write(self, values):
+        values = np.asarray(values).reshape(-1, self.nchan)
+        count = len(values)
+
+        # Only the newest samples fit
+        skipped = max(count - self.capacity, 0)
+        values = values[skipped:]
+
+        start = (self.written + skipped) % self.capacity
+        first = min(count - skipped, self.capacity - start)
+
+        self.writing = self.written + count
+
+        self.buffer[start:start + first] = values[:first]
+        self.buffer[:count - skipped - first] = values[first:]
+
+        self.written = self.writing
+
+    def read(self, cursor=0):
+        """
+        Returns the samples written since cursor, the cursor to read from
+        next time and the number of samples missed since cursor.
+        """
+        written = self.written
+        start = max(cursor, written - self.capacity)
+
+        indexes = np.arange(start, written) % self.capacity
+        values = self.buffer[indexes]
+
+        # Whatever the writer started overwriting while these were copied is dropped too
+        valid = min(max(self.writing - self.capacity - start, 0), len(values))
+        values = values[valid:]
+
+        return values, written, start + valid - cursor
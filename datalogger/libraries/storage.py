@@ -0,0 +1,183 @@
+import queue
+import logging
+import threading
+
+import numpy as np
+
+from time import perf_counter
+from collections import deque
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': 0., 'p95': 0., 'p99': 0., 'max': 0.}
+
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+
+    return {'p50': p50, 'p95': p95, 'p99': p99, 'max': max(values) * 1000}
+
+
+class StorageError(OSError):
+    pass
+
+
+class StorageWriter(threading.Thread):
+    """
+    Write-behind stage between the consumer and the journal.
+
+    The consumer hands its batches over with put() and carries on, the
+    batches are coalesced here and written in one go once flush_scans of
+    them are waiting or flush_interval seconds have passed.  put() only
+    blocks when max_batches are already waiting, which holds the consumer
+    back instead of losing data.
+
+     fsync:  'none'  - leave it to the OS
+             'stop'  - only once the run is over
+             seconds - at most that long between fsyncs, e.g. '5' or 5.
+
+    The buckets waiting in the pyramid, when there is one, are written
+    out along with every journal write.
+
+    A write that fails, e.g. the USB stick is full, stops the writer and
+    is kept in error.  put() raises StorageError from then on, rather
+    than waiting on a queue nothing takes from any more.
+    """
+
+    def __init__(self, journal, max_batches=64, flush_scans=2**16, flush_interval=1., fsync='stop', pyramid=None):
+        super(StorageWriter, self).__init__(name='storage', daemon=True)
+
+        self.journal = journal
+        self.pyramid = pyramid
+        self.flush_scans = flush_scans
+        self.flush_interval = flush_interval
+
+        self.fsync_interval = None
+        if fsync not in ('none', 'stop'):
+            self.fsync_interval = float(fsync)
+        self.fsync = fsync
+
+        self.queue = queue.Queue(max_batches)
+
+        self.writes = 0
+        self.written_scans = 0
+        self.max_queue_depth = 0
+        self.write_latencies = deque(maxlen=10000)
+        self.fsync_latencies = deque(maxlen=10000)
+
+        self.error = None
+
+        self._closing = object()
+
+    def put(self, scans):
+        # The scans are usually a view into the ring buffer, which is reused as soon as they are released
+        if not self._put(np.array(scans, dtype='<u2')):
+            raise StorageError(f'The storage writer stopped: {self.error}') from self.error
+
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def _put(self, item):
+        # Never waits on a writer that died, the queue would never empty again
+        while self.is_alive():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def close(self):
+        self._put(self._closing)
+        self.join()
+
+    def run(self):
+        pending = []
+        pending_scans = 0
+        last_write = last_fsync = perf_counter()
+
+        try:
+            while True:
+                timeout = max(self.flush_interval - (perf_counter() - last_write), 0)
+
+                try:
+                    scans = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    scans = None
+
+                closing = scans is self._closing
+                if scans is not None and not closing:
+                    pending.append(scans)
+                    pending_scans += len(scans)
+
+                if closing or pending_scans >= self.flush_scans or perf_counter() - last_write >= self.flush_interval:
+                    if pending:
+                        self._write(pending)
+                        pending = []
+                        pending_scans = 0
+
+                    last_write = perf_counter()
+
+                    if self.fsync_interval is not None and last_write - last_fsync >= self.fsync_interval:
+                        self._fsync()
+                        last_fsync = perf_counter()
+
+                if closing:
+                    break
+
+        except Exception as e:
+            self.error = e
+            logging.exception('Could not write the journal, stopping the storage writer')
+
+        finally:
+            try:
+                # After a failed write the same batches would only fail again
+                if self.error is None:
+                    if pending:
+                        self._write(pending)
+
+                    if self.pyramid:
+                        self.pyramid.write_pending()
+
+                    if self.fsync != 'none':
+                        self._fsync()
+
+                self.journal.close(fsync=False)
+            except Exception as e:
+                self.error = self.error or e
+                logging.exception('Could not close the journal')
+
+            logging.debug(f'Storage: {self.metrics()}')
+
+    def _write(self, pending):
+        start = perf_counter()
+
+        self.journal.append(np.concatenate(pending) if len(pending) > 1 else pending[0])
+        self.journal.flush()
+
+        if self.pyramid:
+            self.pyramid.write_pending()
+
+        self.write_latencies.append(perf_counter() - start)
+        self.writes += 1
+        self.written_scans += sum(len(scans) for scans in pending)
+
+    def _fsync(self):
+        start = perf_counter()
+
+        self.journal.flush(fsync=True)
+
+        self.fsync_latencies.append(perf_counter() - start)
+
+    def metrics(self):
+        return {
+            'writes': self.writes,
+            'written_scans': self.written_scans,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'write_latency_ms': percentiles(list(self.write_latencies)),
+            'fsync_latency_ms': percentiles(list(self.fsync_latencies))
+        }
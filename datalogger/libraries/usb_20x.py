@@ -16,6 +16,8 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
 import logging
+import queue
+import numpy as np
 from struct import *
 from datalogger.libraries.mccUSB import *
 
@@ -177,6 +179,15 @@ class usb_20x(mccUSB):
         self.table_AIn = [table(), table(), table(), table(), table(), table(), table(), table()]
         self.BuildGainTable()
 
+        # Ring of asynchronous bulk IN transfers used by AInScanStream
+        self.streaming = False
+        self.stream_transfers = []
+        self.stream_callback = None
+        self.stream_as_array = False
+        self.stream_remainder = b''
+        self.read_remainder = b''
+        self.stream_status = None
+
         super().__init__()
 
     def BuildGainTable(self):
@@ -418,13 +429,23 @@ class usb_20x(mccUSB):
             if (channels & (0x1 << i)) != 0x0:
                 self.nChan += 1
 
+        self.read_remainder = b''
+
         request_type = (HOST_TO_DEVICE | VENDOR_TYPE | DEVICE_RECIPIENT)
         scanPacket = pack('IIBBBB', count, pacer_period, channels, options, trigger_source, trigger_mode)
         result = self.udev.controlWrite(request_type, self.AIN_SCAN_START, 0x0, 0x0, scanPacket, timeout=200)
 
         return result
 
-    def AInScanRead(self, nScan):
+    def AInScanRead(self, nScan, as_array=False):
+        """
+        Reads nScan scans of an analog input scan started with AInScanStart.
+
+        By default the samples are returned as a flat list.  With as_array
+        the samples are returned as a numpy.uint16 view over the received
+        bytes, shaped (nscans, nchan), without creating a Python object per
+        sample.  The view is read-only, copy it to change the samples.
+        """
         status = self.Status()
 
         if status & self.AIN_SCAN_OVERRUN:
@@ -432,12 +453,12 @@ class usb_20x(mccUSB):
             raise OverrunError
 
         nSamples = int(nScan * self.nChan)
-        data = []
+        buffer = bytearray()
         if self.options & self.IMMEDIATE_TRANSFER_MODE:
             for i in range(nSamples):
                 try:
                     timeout = int(1000 * self.nChan / self.frequency + 100)
-                    data.extend(unpack('H', self.udev.bulkRead(usb1.ENDPOINT_IN | 1, int(2 * self.nChan), timeout)))
+                    buffer += self.udev.bulkRead(usb1.ENDPOINT_IN | 1, int(2 * self.nChan), timeout)
                 except:
                     logging.debug('AInScanRead: error in bulk transfer in immediate transfer mode.')
                     raise
@@ -445,22 +466,149 @@ class usb_20x(mccUSB):
             try:
                 timeout = int(1000 * self.nChan * nScan / self.frequency + 1000)
 
-                pre_data = self.udev.bulkRead(usb1.ENDPOINT_IN | 1, int(2 * nSamples),  timeout)
-                data = unpack('H' * nSamples, pre_data)
+                buffer = self.udev.bulkRead(usb1.ENDPOINT_IN | 1, int(2 * nSamples),  timeout)
             except:
-                logging.debug(f'AInScanRead: error in bulk transfer! - {len(data)} , {nSamples}')
+                logging.debug(f'AInScanRead: error in bulk transfer! - {len(buffer)} , {nSamples}')
                 raise
 
+        # A short read can end part way through a scan, the rest of it comes with the next read
+        buffer, self.read_remainder = self._splitScans(buffer, self.read_remainder)
+        data = self._unpackScans(buffer, as_array)
+
         if self.continuous_mode:
-            return list(data)
+            return data
 
         # if nbytes is a multiple of wMaxPacketSize the device will send a zero byte packet.
         if (int(nSamples * 2) % self.wMaxPacketSize) == 0 and not (status & self.AIN_SCAN_RUNNING):
-            data = self.udev.bulkRead(usb1.ENDPOINT_IN | 1, 2, 100)
+            self.udev.bulkRead(usb1.ENDPOINT_IN | 1, 2, 100)
 
         self.AInScanStop()
         self.AInScanClearFIFO()
-        return list(data)
+        return data
+
+    def _splitScans(self, buffer, remainder=b''):
+        # A view of the whole scans and a copy of the partial scan after them.  Only a short read
+        # leaves a partial scan, the received bytes are then copied once to put it in front.
+        if remainder:
+            buffer = remainder + buffer
+
+        view = memoryview(buffer)
+        length = len(view) - (len(view) % int(2 * self.nChan))
+
+        return view[:length], bytes(view[length:])
+
+    def _unpackScans(self, buffer, as_array=False):
+        # Only ever whole scans, see _splitScans
+        nSamples = len(buffer) // 2
+
+        if as_array:
+            data = np.frombuffer(buffer, dtype='<u2', count=nSamples).reshape(-1, self.nChan)
+
+            # Read-only whatever the buffer was, so it is the same for every read
+            data.flags.writeable = False
+
+            return data
+
+        return list(unpack('H' * nSamples, buffer[:2 * nSamples]))
+
+    def AInScanStream(self, nScan, callback, nTransfers=8, as_array=False):
+        """
+        Streams an analog input scan started with AInScanStart using a ring
+        of nTransfers asynchronous bulk IN transfers.  Each transfer is
+        sized for nScan scans and is resubmitted as soon as it completes,
+        so there is always a transfer queued on the bus while the host is
+        busy with the previous buffer.
+
+        The scans are handed to callback (a callable or a queue.Queue) in
+        the same layout AInScanRead returns for as_array.  Only
+        whole scans are delivered, partial scans are held back until the
+        rest of the scan arrives.
+
+        The transfers only make progress while AInScanStreamHandleEvents
+        is being called.
+        """
+        if self.streaming:
+            self.AInScanStreamStop()
+
+        self.stream_callback = callback
+        self.stream_as_array = as_array
+        self.stream_remainder = b''
+        self.stream_status = None
+        self.streaming = True
+
+        nSamples = int(nScan * self.nChan)
+        timeout = int(1000 * self.nChan * nScan / self.frequency + 1000)
+
+        self.stream_transfers = []
+        for i in range(nTransfers):
+            transfer = self.udev.getTransfer()
+            transfer.setBulk(usb1.ENDPOINT_IN | 1, int(2 * nSamples), callback=self._AInScanStreamCallback, timeout=timeout)
+            transfer.submit()
+            self.stream_transfers.append(transfer)
+
+    def _AInScanStreamCallback(self, transfer):
+        status = transfer.getStatus()
+
+        # A timed out transfer may still hold a partial buffer, e.g. while waiting for a trigger
+        if status in (usb1.TRANSFER_COMPLETED, usb1.TRANSFER_TIMED_OUT):
+            length = transfer.getActualLength()
+            if length:
+                # One copy, the transfer buffer is filled again as soon as it is resubmitted
+                self._AInScanStreamDeliver(bytes(memoryview(transfer.getBuffer())[:length]))
+        elif status != usb1.TRANSFER_CANCELLED:
+            # The device stalls the bulk in endpoint on overrun
+            logging.debug(f'AInScanStream: transfer failed... status: {status}')
+            self.stream_status = status
+            self.streaming = False
+
+        if self.streaming:
+            transfer.submit()
+
+    def _AInScanStreamDeliver(self, buffer):
+        buffer, self.stream_remainder = self._splitScans(buffer, self.stream_remainder)
+        if not buffer:
+            return
+
+        data = self._unpackScans(buffer, self.stream_as_array)
+
+        if isinstance(self.stream_callback, queue.Queue):
+            self.stream_callback.put(data)
+        else:
+            self.stream_callback(data)
+
+    def AInScanStreamHandleEvents(self, timeout=0.1):
+        """
+        Services the streaming transfers, waiting up to timeout seconds
+        for one of them to complete.  Raises OverrunError if the device
+        stalled the endpoint.
+        """
+        self.context.handleEventsTimeout(timeout)
+
+        if self.stream_status == usb1.TRANSFER_STALL:
+            raise OverrunError
+        elif self.stream_status is not None:
+            raise usb1.USBErrorIO
+
+    def AInScanStreamStop(self):
+        """
+        Cancels the streaming transfers and waits for them to be returned.
+        """
+        self.streaming = False
+
+        for transfer in self.stream_transfers:
+            try:
+                transfer.cancel()
+            except usb1.USBError:
+                # Not submitted any more
+                pass
+
+        while any(transfer.isSubmitted() for transfer in self.stream_transfers):
+            self.context.handleEventsTimeout(0.1)
+
+        for transfer in self.stream_transfers:
+            transfer.close()
+
+        self.stream_transfers = []
 
     def AInScanStop(self):
         """
@@ -733,7 +881,8 @@ class usb_20x(mccUSB):
         wIndex = 0
         self.udev.controlWrite(request_type, self.DFU, wValue, wIndex, [0x0], timeout=100)
 
-    def volts(self, value):
+    @staticmethod
+    def volts(value):
         """
         Convert 12 bit raw value to volts.
         All values single ended +/- 10V.
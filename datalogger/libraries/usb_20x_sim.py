@@ -0,0 +1,298 @@
+import logging
+import random
+
+import numpy as np
+
+from time import sleep, perf_counter
+
+from datalogger.libraries.usb_20x import *
+from datalogger.libraries.conversion import SampleConverter
+from datalogger.libraries.config import attach_formulas, config_snapshot
+
+
+class usb_20x_sim(usb_20x):
+    """
+    Software stand-in for a USB-20x that generates a synthetic motor burn.
+
+    It implements the subset of the usb_20x interface the DataLogger uses
+    (AInScanStart, AInScanRead, AInScanStream, Status, DPort, AInScanStop,
+    AInScanClearFIFO and Reset) so the acquisition pipeline can be run and
+    profiled without the DAQ plugged in.
+
+     sensors:        sensor config, used to generate each channel in its
+                     engineering units.  Without it channels 0-4 follow the
+                     layout of sensors.json.example directly in volts.
+                     The formulas are attached here, so pass it without
+                     them (config_snapshot) and a partial of the simulator
+                     can be pickled to a spawned AcquisitionProcess.
+     realtime:       pace the scans at the scan rate, otherwise produce
+                     them as fast as they are read.
+     burn_start:     seconds after the scan starts until ignition
+     burn_time:      seconds of burn before tail-off
+     run_time:       seconds after the scan starts until the green switch
+                     (DPort) goes low, None to leave it on
+     max_scans:      scans to produce before the green switch goes low and
+                     no more are produced, None for no limit
+     noise:          standard deviation of the noise as a fraction of each
+                     sensor's range
+     overrun_rate:   probability of an overrun on each read
+     timeout_rate:   probability of a USB timeout on each read
+    """
+
+    def __init__(self, serial=None, sensors=None, realtime=True, burn_start=3., burn_time=4., run_time=None, max_scans=None,
+                 noise=0.005, overrun_rate=0., timeout_rate=0., seed=None):
+        self.productID = self.USB_204_PID
+        self.wMaxPacketSize = self.MAX_PACKET_SIZE
+
+        self.table_AIn = [table(), table(), table(), table(), table(), table(), table(), table()]
+        self.BuildGainTable()
+
+        self.streaming = False
+        self.stream_transfers = []
+        self.stream_callback = None
+        self.stream_as_array = False
+        self.stream_nScan = 0
+
+        self.sensors = attach_formulas(config_snapshot(sensors)) if sensors else None
+        self.realtime = realtime
+        self.burn_start = burn_start
+        self.burn_time = burn_time
+        self.run_time = run_time
+        self.max_scans = max_scans
+        self.noise = noise
+        self.overrun_rate = overrun_rate
+        self.timeout_rate = timeout_rate
+
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+
+        self.frequency = 0
+        self.options = 0
+        self.nChan = 0
+        self.count = 0
+        self.continuous_mode = True
+
+        self.profiles = []
+        self.status = 0
+        self.scan_index = 0
+        self.start_time = perf_counter()
+
+    def BuildGainTable(self):
+        for chan in range(self.NCHAN):
+            self.table_AIn[chan].slope = 1.
+            self.table_AIn[chan].intercept = 0.
+
+    def _channel_profiles(self):
+        # Each profile is (function of the time in seconds, engineering -> counts gain, offset)
+        profiles = []
+
+        if self.sensors:
+            sensors = sorted(self.sensors.values(), key=lambda sensor: sensor['channel'])
+            converter = SampleConverter(self.sensors, self.table_AIn, self.volts)
+
+            for sensor in sensors[:self.nChan]:
+                chan = sensor['channel']
+
+                if chan in converter.formulas:
+                    gain, offset = converter.volts_gain[chan], converter.volts_offset[chan]
+                    profiles.append((self._volts_profile(chan), 1 / gain, -offset / gain))
+                else:
+                    gain, offset = converter.units_gain[chan], converter.units_offset[chan]
+                    profiles.append((self._sensor_profile(sensor), 1 / gain, -offset / gain))
+        else:
+            for chan in range(self.nChan):
+                gain, offset = self.volts(1.) - self.volts(0.), self.volts(0.)
+                profiles.append((self._volts_profile(chan), 1 / gain, -offset / gain))
+
+        return profiles
+
+    def _thrust_curve(self, t):
+        t = t - self.burn_start
+
+        rise = np.clip(t / 0.1, 0, 1)
+        # Progressive burn that regresses to 80% of the peak, then an exponential tail-off
+        sustain = 1 - 0.2 * np.clip(t / self.burn_time, 0, 1)
+        tail = np.exp(-np.clip(t - self.burn_time, 0, None) / 0.3)
+
+        return np.where(t > 0, rise * sustain * tail, 0.)
+
+    def _sensor_profile(self, sensor):
+        sensor_type = sensor['sensor_type']
+        sensor_min = sensor['min']
+        sensor_max = sensor['max']
+        noise = (sensor_max - sensor_min) * self.noise
+
+        if sensor_type == 'loadcell':
+            def profile(t):
+                return self._thrust_curve(t) * sensor_max * 0.6
+
+        elif sensor_type == 'pressure' and 'Tank' in sensor['sensor_name']:
+            def profile(t):
+                blowdown = np.clip((t - self.burn_start) / (self.burn_time + 0.5), 0, 1)
+                return sensor_max * (0.8 - 0.6 * blowdown)
+
+        elif sensor_type == 'pressure':
+            def profile(t):
+                return self._thrust_curve(t) * sensor_max * 0.6
+
+        elif sensor_type == 'temp' and 'Tank' in sensor['sensor_name']:
+            def profile(t):
+                cooling = np.clip((t - self.burn_start) / (self.burn_time + 0.5), 0, 1)
+                return 20 - 40 * cooling
+
+        elif sensor_type == 'temp':
+            def profile(t):
+                heating = 1 - np.exp(-np.clip(t - self.burn_start, 0, None) / 2.)
+                cooling = np.exp(-np.clip(t - self.burn_start - self.burn_time, 0, None) / 30.)
+                return 20 + (sensor_max * 0.8 - 20) * heating * cooling
+
+        else:
+            def profile(t):
+                return np.full_like(t, sensor_min)
+
+        return lambda t: profile(t) + self.rng.normal(0, noise, t.shape)
+
+    def _volts_profile(self, chan):
+        def profile(t):
+            if chan in (0, 1):
+                signal = self._thrust_curve(t) * 8
+            elif chan == 2:
+                signal = 6 - 5 * np.clip((t - self.burn_start) / (self.burn_time + 0.5), 0, 1)
+            elif chan == 3:
+                signal = 1.35 - 0.2 * np.clip((t - self.burn_start) / (self.burn_time + 0.5), 0, 1)
+            elif chan == 4:
+                signal = 1.35 + 1.5 * (1 - np.exp(-np.clip(t - self.burn_start, 0, None) / 2.))
+            else:
+                signal = np.zeros_like(t)
+
+            return signal + self.rng.normal(0, 20 * self.noise, t.shape)
+
+        return profile
+
+    def _generate(self, nScan):
+        if self.max_scans is not None:
+            nScan = max(min(nScan, self.max_scans - self.scan_index), 0)
+
+        t = (self.scan_index + np.arange(nScan)) / (self.frequency / self.nChan)
+
+        data = np.empty((nScan, self.nChan), dtype=np.uint16)
+        for chan, (profile, gain, offset) in enumerate(self.profiles):
+            data[:, chan] = np.clip(np.rint(profile(t) * gain + offset), 0, 4095)
+
+        self.scan_index += nScan
+
+        if not self.continuous_mode and self.scan_index >= self.count:
+            self.status &= ~self.AIN_SCAN_RUNNING
+
+        return data
+
+    def _scan_due(self, nScan):
+        return self.start_time + (self.scan_index + nScan) / (self.frequency / self.nChan)
+
+    def AInScanStart(self, count, frequency, channels, options, trigger_source, trigger_mode):
+        if frequency > 100000.:
+            frequency = 100000
+
+        self.frequency = frequency
+        self.options = options & 0xff
+        self.count = count
+        self.continuous_mode = count == 0
+
+        self.nChan = 0
+        for i in range(self.NCHAN):
+            if (channels & (0x1 << i)) != 0x0:
+                self.nChan += 1
+
+        self.profiles = self._channel_profiles()
+
+        self.scan_index = 0
+        self.start_time = perf_counter()
+        self.status = self.AIN_SCAN_RUNNING
+
+    def _check_faults(self):
+        if self.status & self.AIN_SCAN_OVERRUN:
+            raise OverrunError
+
+        if self.random.random() < self.overrun_rate:
+            logging.debug('usb_20x_sim: injecting an overrun')
+            self.status |= self.AIN_SCAN_OVERRUN
+            raise OverrunError
+
+        if self.random.random() < self.timeout_rate:
+            logging.debug('usb_20x_sim: injecting a USB timeout')
+            raise usb1.USBErrorTimeout
+
+    def AInScanRead(self, nScan, as_array=False):
+        self._check_faults()
+
+        if self.realtime:
+            sleep(max(0., self._scan_due(nScan) - perf_counter()))
+
+        data = self._generate(nScan)
+
+        if as_array:
+            return data
+
+        return data.ravel().tolist()
+
+    def AInScanStream(self, nScan, callback, nTransfers=8, as_array=False):
+        self.stream_nScan = nScan
+        self.stream_callback = callback
+        self.stream_as_array = as_array
+        self.streaming = True
+
+    def AInScanStreamHandleEvents(self, timeout=0.1):
+        if not self.streaming:
+            return
+
+        if self.realtime:
+            delay = self._scan_due(self.stream_nScan) - perf_counter()
+            if delay > timeout:
+                sleep(timeout)
+                return
+
+            sleep(max(0., delay))
+
+        try:
+            self._check_faults()
+        except usb1.USBErrorTimeout:
+            # The transfer is resubmitted, the same as a timed out transfer on the device
+            return
+
+        data = self._generate(self.stream_nScan)
+        if not len(data):
+            return
+
+        if not self.stream_as_array:
+            data = data.ravel().tolist()
+
+        if isinstance(self.stream_callback, queue.Queue):
+            self.stream_callback.put(data)
+        else:
+            self.stream_callback(data)
+
+    def AInScanStreamStop(self):
+        self.streaming = False
+
+    def AInScanStop(self):
+        self.status &= ~self.AIN_SCAN_RUNNING
+
+    def AInScanClearFIFO(self):
+        self.status &= ~self.AIN_SCAN_OVERRUN
+
+    def Reset(self):
+        self.streaming = False
+        self.status = 0
+        self.scan_index = 0
+
+    def Status(self):
+        return self.status
+
+    def DPort(self):
+        if self.max_scans is not None and self.scan_index >= self.max_scans:
+            return 0
+
+        if self.run_time is None or not self.frequency:
+            return 1
+
+        return int(self.scan_index / (self.frequency / self.nChan) < self.run_time)
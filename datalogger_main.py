@@ -2,14 +2,18 @@
 
 import click
 import logging
-import json
 import sys
 import os
 import time
+import functools
 
 from gpiozero import LED
 
 from datalogger.libraries.datalogging import DataLogger
+from datalogger.libraries.dashboard import Dashboard
+from datalogger.libraries.config import load_config, save_config, config_snapshot
+from datalogger.libraries.usb_20x import usb_204
+from datalogger.libraries.usb_20x_sim import usb_20x_sim
 from common.launch_control import LaunchControl
 
 
@@ -39,40 +43,14 @@ sys.stdout = sl
 logging.getLogger('matplotlib').setLevel(logging.WARNING)
 
 
-def load_config(config_file_name='sensors.json'):
-    with open(config_file_name) as config_file:
-        config = json.load(config_file)
-
-        for sensor_id, sensor in config.items():
-            if sensor['sensor_type'] == 'loadcell':
-                sensor['formula'] = lambda v: v
-            if sensor['sensor_type'] == 'temp':
-                sensor['formula'] = lambda v: (v - 1.25) / 0.005
-            if sensor['sensor_type'] == 'pressure':
-                sensor['formula'] = lambda v, max_psi: (v / 4) * max_psi
-            else:
-                Exception('Unknown sensor type')
-
-        return config
-
-
-def save_config(sensors, config_file_name='sensors.json'):
-    for sensor_id, sensor in sensors.items():
-        if 'formula' in sensor:
-            del (sensor['formula'])
-
-    with open(config_file_name, mode='w') as config_file:
-        json.dump(sensors, config_file, indent=4, sort_keys=True)
-
-
 def roundup(x, mod):
     return x if x % mod == 0 else x + mod - x % mod
 
 
-def calibrate_mode(sensors, config, freq):
+def calibrate_mode(sensors, config, freq, device=usb_204, isolated=False):
     input('Remove any test weights from the stand and press enter.')
     maxruntime = 10  # seconds
-    data_logger = DataLogger(freq, sensors, maxruntime, raw_voltage=True)
+    data_logger = DataLogger(freq, sensors, maxruntime, raw_voltage=True, device=device, isolated=isolated)
     data_logger.start()
     data_logger.wait_for_datalogger()
 
@@ -156,18 +134,43 @@ def wait_for_safe(lc):
         time.sleep(0.5)
 
 
+def validate_fsync(ctx, param, value):
+    if value in ('none', 'stop'):
+        return value
+
+    try:
+        if float(value) > 0:
+            return value
+    except ValueError:
+        pass
+
+    raise click.BadParameter('none, stop or a number of seconds')
+
+
 @click.command()
 @click.option('-f', '--freq', type=int, default=1000, help='Data Logging Frequency - Default: 1000 Hz')
 @click.option('-c', '--calibrate', is_flag=True, help='Use this mode to calibrate the channels')
 @click.option('-r', '--remoteid', type=int, default=None, help='Remote ID')
 @click.option('--config', type=str, default='datalogger/sensors.json', help='Config file - Default: datalogger/sensors.json')
+@click.option('-s', '--simulate', is_flag=True, help='Log a simulated motor burn instead of the USB-204')
+@click.option('-i', '--isolated', is_flag=True, help='Read the USB-204 in its own process')
+@click.option('--csv', is_flag=True, help='Also export the data of every run to CSV files')
+@click.option('--fsync', type=str, default='stop', callback=validate_fsync, help='When to fsync the data to disk: none, stop or every N seconds - Default: stop')
+@click.option('--fps', type=int, default=25, help='Frame rate of the live plots in calibration mode - Default: 25')
+@click.option('--grid', is_flag=True, help='Start calibration mode showing every sensor at once')
+@click.option('--dashboard', type=int, default=None, help='Serve the live data to browsers on this port, e.g. 8080')
 @click.option('-d', '--debug', is_flag=True, help='Turn on debugging')
-def main(freq, calibrate, remoteid, config, debug):
+def main(freq, calibrate, remoteid, config, simulate, isolated, csv, fsync, fps, grid, dashboard, debug):
     if debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
     sensors = load_config(config)
 
+    device = usb_204
+    if simulate:
+        # Without the formulas, lambdas can't be pickled to a spawned acquisition process
+        device = functools.partial(usb_20x_sim, sensors=config_snapshot(sensors))
+
     media_dirs = os.listdir('/media/pi/')
     if media_dirs:
         base_dir = f'/media/pi/{media_dirs[0]}'
@@ -181,9 +184,9 @@ def main(freq, calibrate, remoteid, config, debug):
         from datalogger.libraries.qt_helper import QTHelper  # No need to import this if it's not required
 
         freq = 200
-        data_logger = DataLogger(frequency=freq, sensors=sensors, maxruntime=0, raw_voltage=True, base_dir=base_dir)
-        QTHelper(data_logger, raw_voltage=True)
-        calibrate_mode(sensors, config, freq)
+        data_logger = DataLogger(frequency=freq, sensors=sensors, maxruntime=0, raw_voltage=True, base_dir=base_dir, device=device, isolated=isolated)
+        QTHelper(data_logger, raw_voltage=True, fps=fps, grid=grid)
+        calibrate_mode(sensors, config, freq, device, isolated)
 
     else:
         relays = {
@@ -195,17 +198,25 @@ def main(freq, calibrate, remoteid, config, debug):
 
         lc = LaunchControl(remoteid, relays=relays)
 
+        if dashboard:
+            dashboard = Dashboard(port=dashboard)
+            dashboard.start()
+
         while True:
             wait_for_ready(lc)
 
-            data_logger = DataLogger(frequency=freq, sensors=sensors, maxruntime=0, raw_voltage=False, base_dir=base_dir)
+            data_logger = DataLogger(frequency=freq, sensors=sensors, maxruntime=0, raw_voltage=False, base_dir=base_dir, device=device, isolated=isolated, fsync=fsync, dashboard=dashboard)
             data_logger.start()
 
             wait_for_safe(lc)
 
             data_logger.stop()
+            data_logger.wait_for_datalogger()
             data_logger.output_final_results()
 
+            if csv:
+                data_logger.export_csv()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+import click
+import logging
+import multiprocessing
+import os
+
+from time import perf_counter
+
+from datalogger.libraries.catalog import RunCatalog, CATALOG_NAME
+from datalogger.libraries.config import load_config, config_snapshot
+from datalogger.libraries.report import reanalyze_run
+
+
+logging.basicConfig(level=logging.INFO, format='(%(threadName)-9s) %(message)s', )
+
+logging.getLogger('matplotlib').setLevel(logging.WARNING)
+
+
+def reanalyze(args):
+    return reanalyze_run(*args)
+
+
+@click.command()
+@click.argument('data', type=click.Path(exists=True, file_okay=False))
+@click.option('--config', type=str, default=None, help='Reconvert the runs with this sensor config instead of the one each run was logged with')
+@click.option('-p', '--processes', type=int, default=None, help='Number of runs analysed at once - Default: one per core')
+@click.option('--force', is_flag=True, help='Analyse every run again, even when nothing changed')
+@click.option('--nocatalog', is_flag=True, help=f'Do not update {CATALOG_NAME} in the data directory')
+@click.option('-d', '--debug', is_flag=True, help='Turn on debugging')
+def main(data, config, processes, force, nocatalog, debug):
+    if debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    sensors = None
+    if config:
+        sensors = config_snapshot(load_config(config))
+
+    run_dirs = sorted(f'{data}/{name}' for name in os.listdir(data) if os.path.isdir(f'{data}/{name}'))
+
+    catalog = None
+    if not nocatalog:
+        catalog = RunCatalog(f'{data}/{CATALOG_NAME}')
+
+    logging.info(f'Reanalysing {len(run_dirs)} directories in {data}...')
+
+    start = perf_counter()
+    counts = {'analyzed': 0, 'cached': 0, 'skipped': 0, 'failed': 0}
+
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.imap_unordered(reanalyze, [(run_dir, sensors, force) for run_dir in run_dirs])
+
+        for done, result in enumerate(results, start=1):
+            counts[result['status']] += 1
+
+            logging.info(f'[{done}/{len(run_dirs)}] {os.path.basename(result["run_dir"])}: {result["status"]} in {result["seconds"]:.2f} seconds')
+
+            if catalog and result['record']:
+                catalog.add(result['record'])
+
+    if catalog:
+        catalog.close()
+
+    logging.info(
+        f'Done in {perf_counter() - start:.2f} seconds: {counts["analyzed"]} analysed, {counts["cached"]} unchanged, '
+        f'{counts["skipped"]} not runs, {counts["failed"]} failed'
+    )
+
+
+if __name__ == '__main__':
+    main()
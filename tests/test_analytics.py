@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from datalogger.libraries.analytics import BurnAnalytics, BurnAnalysis, impulse_letter
+
+
+def burn(rng, frequency, seconds):
+    t = np.arange(int(frequency * seconds)) / frequency
+    start = rng.uniform(2, seconds - 2)
+    end = start + rng.uniform(.5, 4)
+
+    thrust = 10 * np.abs(np.sin(np.pi * (t - start) / (end - start))) ** .3
+
+    return rng.normal(0, .05, len(t)) + np.where((t > start) & (t < end), thrust, 0)
+
+
+def streamed(values, frequency, rng):
+    analytics = BurnAnalytics(frequency)
+
+    # Batches of any size, as they come from the ring buffer
+    index = 0
+    while index < len(values):
+        count = int(rng.integers(1, 3 * frequency))
+        analytics.update(values[index:index + count])
+        index += count
+
+    return analytics.results()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_streaming_matches_the_post_test_analysis(seed):
+    rng = np.random.default_rng(seed)
+    frequency = int(rng.choice([100, 1000, 3000]))
+    values = burn(rng, frequency, rng.uniform(4, 20))
+
+    expected = BurnAnalysis(values, frequency).results()
+    results = streamed(values, frequency, rng)
+
+    assert results.keys() == expected.keys()
+    for key, value in expected.items():
+        assert results[key] == pytest.approx(value), key
+
+
+@pytest.mark.parametrize('seconds', [.5, 1.5, 2.5])
+def test_short_runs(seconds):
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, .05, int(100 * seconds))
+    values[len(values) // 3:2 * len(values) // 3] += 5
+
+    expected = BurnAnalysis(values, 100).results()
+    results = streamed(values, 100, rng)
+
+    for key, value in expected.items():
+        assert results[key] == pytest.approx(value), key
+
+
+def test_no_data():
+    assert BurnAnalytics(100).results() is None
+
+
+def test_square_burn():
+    values = np.zeros(1000)
+    values[300:500] = 10
+
+    results = BurnAnalysis(values, 100).results()
+
+    assert results['start_timestamp'] == pytest.approx(3.01)
+    assert results['end_timestamp'] == pytest.approx(5.)
+    assert results['average_thrust'] == pytest.approx(10)
+    assert results['impulse'] == pytest.approx(19.7)
+
+
+@pytest.mark.parametrize('impulse, letter', [(1, '1/2A'), (3, 'B'), (100, 'G')])
+def test_impulse_letter(impulse, letter):
+    assert impulse_letter(impulse) == letter
@@ -0,0 +1,117 @@
+import struct
+
+import pytest
+
+from common import codec
+
+
+@pytest.mark.parametrize('args', [
+    None,
+    True,
+    False,
+    0,
+    63,
+    -64,
+    2**40,
+    -2**40,
+    1.5,
+    '',
+    'fill',
+    [1, 'two', 3.],
+    {'relay': 'fill', 'on': True, 'seconds': [1, 2]},
+])
+def test_round_trip(args):
+    data = codec.encode(42, 'launch', 1234, args, session=0xBEEF)
+
+    assert codec.is_binary(data)
+    assert codec.decode(data) == {'remoteid': 42, 'command': 'launch', 'sequence': 1234, 'session': 0xBEEF, 'args': args}
+
+
+def test_every_command():
+    for command in codec.COMMANDS:
+        assert codec.decode(codec.encode(1, command))['command'] == command
+
+
+def test_no_remote_id():
+    assert codec.decode(codec.encode(None, 'safe'))['remoteid'] is None
+
+
+def test_sequence_and_session_wrap():
+    message = codec.decode(codec.encode(1, 'safe', 0x10001, session=0x1FFFF))
+
+    assert message['sequence'] == 1
+    assert message['session'] == 0xFFFF
+
+
+def test_header_only_without_args():
+    assert len(codec.encode(1, 'ready')) == 8
+
+
+def test_version_1_has_no_session():
+    data = struct.pack('<BHBH', 0xD1, 7, codec.COMMANDS.index('ready'), 5)
+
+    assert codec.decode(data) == {'remoteid': 7, 'command': 'ready', 'sequence': 5, 'session': None, 'args': None}
+
+
+def test_json_is_not_binary():
+    assert not codec.is_binary(b'{"command": "launch"}')
+    assert not codec.is_binary('launch')
+
+
+@pytest.mark.parametrize('remoteid, command, args', [
+    (1, 'self-destruct', None),
+    (-1, 'safe', None),
+    (0xFFFF, 'safe', None),
+    (1, 'safe', object()),
+])
+def test_encode_errors(remoteid, command, args):
+    with pytest.raises(codec.CodecError):
+        codec.encode(remoteid, command, args=args)
+
+
+def test_newer_version():
+    data = bytearray(codec.encode(1, 'safe'))
+    data[0] = 0xD0 | (codec.VERSION + 1)
+
+    with pytest.raises(codec.CodecError, match='newer'):
+        codec.decode(bytes(data))
+
+
+def test_unknown_command_number():
+    data = bytearray(codec.encode(1, 'safe'))
+    data[3] = len(codec.COMMANDS)
+
+    with pytest.raises(codec.CodecError, match='Unknown command'):
+        codec.decode(bytes(data))
+
+
+def test_truncated():
+    data = codec.encode(1, 'safe', args={'name': 'fill relay'})
+
+    for length in range(5, len(data)):
+        if length == 8:
+            # The header on its own is a valid message without args
+            continue
+
+        with pytest.raises(codec.CodecError):
+            codec.decode(data[:length])
+
+
+def test_left_over_bytes():
+    with pytest.raises(codec.CodecError, match='left over'):
+        codec.decode(codec.encode(1, 'safe', args=1) + b'\0')
+
+
+def test_unknown_value_tag():
+    with pytest.raises(codec.CodecError, match='tag'):
+        codec.decode(codec.encode(1, 'safe') + b'\x7f')
+
+
+def test_bad_string():
+    with pytest.raises(codec.CodecError, match='Bad string'):
+        codec.decode(codec.encode(1, 'safe') + bytes([5, 2, 0xff, 0xfe]))
+
+
+def test_not_binary():
+    with pytest.raises(codec.CodecError):
+        codec.decode(b'{}')
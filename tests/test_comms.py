@@ -0,0 +1,459 @@
+import json
+import threading
+import time
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('meshtastic')
+pytest.importorskip('pubsub')
+
+from pubsub import pub
+
+from common import codec
+from common import comms as comms_module
+from common.comms import PendingAcks, RetransmitTimer, DuplicateFilter, RadioLink, Comms, CONNECTED, RECONNECTING
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(comms_module.time, 'perf_counter', clock)
+    monkeypatch.setattr(comms_module.time, 'monotonic', clock)
+
+    return clock
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(.01)
+
+    return True
+
+
+class TestPendingAcks:
+    def test_ack(self, clock):
+        acks = PendingAcks()
+        event = acks.track(1)
+
+        clock.now += .25
+        assert acks.ack(1) == pytest.approx(.25)
+        assert event.is_set()
+        assert acks.is_acked(1)
+
+        # The radio acks a message once, a second ack is not another round trip
+        assert acks.ack(1) is None
+
+    def test_ack_before_track(self):
+        acks = PendingAcks()
+
+        assert acks.ack(1) is None
+        assert acks.track(1).is_set()
+
+    def test_ttl(self, clock):
+        acks = PendingAcks(ttl=10)
+        acks.track(1)
+
+        clock.now += 5
+        acks.track(2)
+
+        clock.now += 6
+        acks.track(3)
+
+        assert list(acks.entries) == [2, 3]
+
+    def test_max_entries(self):
+        acks = PendingAcks(max_entries=3)
+        for message_id in range(5):
+            acks.track(message_id)
+
+        assert len(acks) == 3
+        assert list(acks.entries) == [2, 3, 4]
+
+    def test_wait_for_any(self):
+        acks = PendingAcks()
+        acks.track(1)
+        acks.track(2)
+
+        assert not acks.wait([1, 2], timeout=0)
+
+        threading.Timer(.05, acks.ack, args=(2,)).start()
+
+        start = time.perf_counter()
+        assert acks.wait([1, 2], timeout=5)
+        assert time.perf_counter() - start < 1
+
+
+class TestRetransmitTimer:
+    def test_initial(self):
+        assert RetransmitTimer(initial=5.).rto == 5.
+
+    def test_first_sample(self):
+        timer = RetransmitTimer()
+        timer.sample(2.)
+
+        # The round trip plus four times half of it
+        assert timer.rto == pytest.approx(6.)
+
+    def test_converges(self):
+        timer = RetransmitTimer(min_rto=0)
+        for i in range(200):
+            timer.sample(2.)
+
+        assert timer.srtt == pytest.approx(2.)
+        assert timer.rto == pytest.approx(2., abs=.01)
+
+    def test_clamped(self):
+        timer = RetransmitTimer(min_rto=1., max_rto=60.)
+
+        timer.sample(.01)
+        assert timer.rto == 1.
+
+        timer = RetransmitTimer(min_rto=1., max_rto=60.)
+        timer.sample(100.)
+        assert timer.rto == 60.
+
+    def test_backoff(self):
+        timer = RetransmitTimer(max_rto=60.)
+
+        assert timer.backoff(5.) == 10.
+        assert timer.backoff(40.) == 60.
+
+
+class TestDuplicateFilter:
+    def test_repeats(self):
+        duplicates = DuplicateFilter()
+
+        assert not duplicates.is_duplicate(42, 10, 1)
+        assert duplicates.is_duplicate(42, 10, 1)
+        assert not duplicates.is_duplicate(42, 11, 1)
+
+    def test_per_sender(self):
+        duplicates = DuplicateFilter()
+
+        assert not duplicates.is_duplicate(42, 10, 1)
+        assert not duplicates.is_duplicate(43, 10, 1)
+
+    def test_new_session_starts_over(self):
+        duplicates = DuplicateFilter()
+
+        assert not duplicates.is_duplicate(42, 10, 1)
+        assert not duplicates.is_duplicate(42, 10, 2)
+        assert duplicates.is_duplicate(42, 10, 2)
+
+        # The old session's numbers are gone with it
+        assert not duplicates.is_duplicate(42, 10, 1)
+
+    def test_window(self):
+        duplicates = DuplicateFilter(window=4)
+        for sequence in range(5):
+            duplicates.is_duplicate(42, sequence)
+
+        assert not duplicates.is_duplicate(42, 0)
+        assert duplicates.is_duplicate(42, 4)
+
+    def test_ttl(self, clock):
+        duplicates = DuplicateFilter(ttl=300)
+        duplicates.is_duplicate(42, 10)
+
+        clock.now += 301
+        assert not duplicates.is_duplicate(42, 10)
+
+
+class FakeComms:
+    """ The side of Comms a RadioLink uses, with a radio that fails the sends in fail. """
+
+    def __init__(self):
+        self.connected = True
+        self.connection_event = threading.Event()
+        self.sent = []
+        self.fail = set()
+
+    def _send(self, command, args, sequence):
+        if command in self.fail:
+            raise OSError('write failed')
+
+        self.sent.append(command)
+
+        return len(self.sent)
+
+
+@pytest.fixture
+def link():
+    # Not started, so a fault is only handed over and nothing reconnects
+    link = RadioLink(FakeComms())
+    link.set_state(CONNECTED)
+
+    return link
+
+
+class TestRadioLink:
+    def test_sends_directly(self, link):
+        message_ids = []
+
+        assert link.send('ready', None, 1, message_ids) == 1
+        assert message_ids == [1]
+        assert link.comms.sent == ['ready']
+
+    def test_queued_while_down(self, link):
+        link.on_fault()
+
+        assert link.send('safe', None, 1) is None
+        assert link.comms.sent == []
+        assert [queued[0] for queued in link.outgoing] == ['safe']
+
+        link.connected()
+        assert link.comms.sent == ['safe']
+        assert not link.outgoing
+
+    def test_one_fault_at_a_time(self, link):
+        link.on_fault()
+        link.on_fault()
+
+        assert link.faults == 1
+        assert link.state == RECONNECTING
+        assert link.fault.is_set()
+        assert not link.comms.connected
+
+    def test_order_after_a_failed_flush(self, link):
+        link.on_fault()
+        for sequence, command in enumerate(['fill-relay-on', 'dump-relay-on', 'safe']):
+            link.queue(command, None, sequence)
+
+        link.comms.fail = {'dump-relay-on'}
+        link.connected()
+
+        # The one that failed stays in front of the rest
+        assert link.comms.sent == ['fill-relay-on']
+        assert [queued[0] for queued in link.outgoing] == ['dump-relay-on', 'safe']
+        assert link.state == RECONNECTING
+
+        # A new command goes behind them
+        link.send('launch', None, 3)
+
+        link.comms.fail = set()
+        link.connected()
+
+        assert link.comms.sent == ['fill-relay-on', 'dump-relay-on', 'safe', 'launch']
+
+    def test_retransmission_is_queued_once(self, link):
+        link.on_fault()
+        link.send('safe', None, 1)
+        link.send('safe', None, 1)
+
+        assert len(link.outgoing) == 1
+
+    def test_max_queue_age(self, link, clock):
+        link.max_queue_age = 60
+
+        link.on_fault()
+        link.queue('fill-relay-on', None, 1)
+
+        clock.now += 30
+        link.queue('safe', None, 2)
+
+        clock.now += 31
+        link.connected()
+
+        assert link.comms.sent == ['safe']
+
+    def test_discard(self, link):
+        link.on_fault()
+        link.queue('launch', None, 1)
+        link.queue('safe', None, 2)
+
+        link.discard(1)
+        link.connected()
+
+        assert link.comms.sent == ['safe']
+
+    def test_fault_during_a_blocking_write(self, link):
+        writing = threading.Event()
+        release = threading.Event()
+
+        def blocking_send(command, args, sequence):
+            writing.set()
+            release.wait(5)
+            raise OSError('write failed')
+
+        link.comms._send = blocking_send
+
+        sender = threading.Thread(target=link.send, args=('launch', None, 1))
+        sender.start()
+        assert writing.wait(5)
+
+        # The lost connection is handed over while the write still hangs
+        faulted = threading.Thread(target=link.on_fault)
+        faulted.start()
+        faulted.join(1)
+        assert not faulted.is_alive()
+        assert link.state == RECONNECTING
+
+        release.set()
+        sender.join(5)
+
+        assert [queued[0] for queued in link.outgoing] == ['launch']
+
+
+class FakeRadio:
+    """
+    Stands in for the meshtastic serial interface: reports the connection
+    and acks the messages through pubsub, the same as the real one.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.up = True
+        self.fail_opens = 0
+        self.ack_delay = .05
+
+        # Which copies are acked, by how many were sent before
+        self.acked = lambda index: True
+
+    def open(self):
+        if self.fail_opens:
+            self.fail_opens -= 1
+            raise OSError('no such device')
+
+        self.up = True
+        return FakeInterface(self)
+
+
+class FakeInterface:
+    def __init__(self, radio):
+        self.radio = radio
+        self.localNode = SimpleNamespace(
+            radioConfig=SimpleNamespace(preferences=SimpleNamespace(**comms_module.RADIO_PREFERENCES)),
+            channels=[SimpleNamespace(settings=SimpleNamespace(**comms_module.CHANNEL_SETTINGS))]
+        )
+
+        threading.Timer(.01, pub.sendMessage, args=('meshtastic.connection.established',), kwargs={'interface': self}).start()
+
+    def close(self):
+        pass
+
+    def _sent(self, message):
+        if not self.radio.up:
+            raise OSError('write failed')
+
+        index = len(self.radio.sent)
+        self.radio.sent.append(message)
+
+        if self.radio.acked(index):
+            packet = {'priority': 'ACK', 'decoded': {'requestId': index}}
+            threading.Timer(self.radio.ack_delay, pub.sendMessage, args=('meshtastic.receive',), kwargs={'packet': packet, 'interface': self}).start()
+
+        return SimpleNamespace(id=index)
+
+    def sendText(self, text, **kwargs):
+        return self._sent(json.loads(text))
+
+    def sendData(self, data, **kwargs):
+        return self._sent(codec.decode(data))
+
+
+@pytest.fixture
+def radio(monkeypatch):
+    radio = FakeRadio()
+    monkeypatch.setattr(comms_module.meshtastic.serial_interface, 'SerialInterface', radio.open)
+
+    yield radio
+
+    # The Comms of the other tests must not hear this one's radio
+    pub.unsubAll()
+
+
+@pytest.fixture(params=[False, True], ids=['json', 'binary'])
+def comms(radio, request):
+    comms = Comms({}, remoteid=1, binary=request.param)
+    comms.retransmit_timer.rto = .2
+
+    return comms
+
+
+class TestComms:
+    def test_ack_wakes_the_sender(self, comms, radio):
+        start = time.perf_counter()
+
+        assert comms.send_reliable('safe')
+        assert time.perf_counter() - start < .2
+        assert [message['command'] for message in radio.sent] == ['safe']
+
+    def test_retransmits_until_acked(self, comms, radio):
+        radio.acked = lambda index: index == 2
+
+        assert comms.send_reliable('launch')
+        assert comms.retransmissions == 2
+
+        # Every copy is the same command
+        assert len({message['sequence'] for message in radio.sent}) == 1
+        assert len(radio.sent) == 3
+
+    def test_gives_up(self, comms, radio):
+        radio.acked = lambda index: False
+
+        assert not comms.send_reliable('ready', keep_trying=lambda: False)
+        assert len(radio.sent) == 1
+
+    def test_gives_up_after_timeout(self, comms, radio):
+        radio.acked = lambda index: False
+
+        start = time.perf_counter()
+        assert not comms.send_reliable('ready', timeout=.5)
+        assert time.perf_counter() - start < 1.5
+
+    def test_queued_while_down_and_flushed_after_reconnect(self, comms, radio):
+        radio.up = False
+        radio.fail_opens = 2
+
+        pub.sendMessage('meshtastic.connection.lost', interface=comms.interface)
+
+        comms.send_message('fill-relay-on')
+        comms.send_message('dump-relay-on')
+        assert radio.sent == []
+
+        assert comms.send_reliable('safe', timeout=10)
+        assert [message['command'] for message in radio.sent] == ['fill-relay-on', 'dump-relay-on', 'safe']
+
+        assert wait_until(lambda: comms.link.is_up)
+        assert comms.link.faults == 1
+
+    def test_duplicate_is_ignored(self, radio):
+        received = []
+        comms = Comms({'launch': received.append}, remoteid=1)
+
+        message = json.dumps({'remoteid': 1, 'command': 'launch', 'sequence': 7, 'session': 99})
+        for message_id in range(3):
+            comms.parse_message(message, message_id, sender=42)
+
+        assert len(received) == 1
+        assert received[0]['sequence'] == 7
+
+    def test_binary_and_json_both_understood(self, radio):
+        received = []
+        comms = Comms({'safe': received.append}, remoteid=1)
+
+        comms.parse_message(json.dumps({'remoteid': 1, 'command': 'safe', 'sequence': 1}), 1, sender=42)
+        comms.parse_message(codec.encode(1, 'safe', 2, session=5), 2, sender=42)
+
+        assert [message['sequence'] for message in received] == [1, 2]
+
+    def test_other_remote_id_ignored(self, radio):
+        received = []
+        comms = Comms({'launch': received.append}, remoteid=1)
+
+        comms.parse_message(json.dumps({'remoteid': 2, 'command': 'launch', 'sequence': 1}), 1, sender=42)
+
+        assert received == []
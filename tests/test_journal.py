@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from datalogger.libraries.config import load_config
+from datalogger.libraries.conversion import SampleConverter
+from datalogger.libraries.journal import JournalWriter, JournalReader, JOURNAL_ALIGNMENT, JOURNAL_VERSION
+from datalogger.libraries.mccUSB import table
+from datalogger.libraries.usb_20x import usb_20x
+
+FREQUENCY = 100
+
+
+@pytest.fixture
+def sensors():
+    return load_config('datalogger/sensors.json.example')
+
+
+@pytest.fixture
+def table_AIn():
+    calibration = []
+    for chan in range(8):
+        calibration.append(table())
+        calibration[-1].slope = 1 + chan / 100
+        calibration[-1].intercept = -chan
+
+    return calibration
+
+
+@pytest.fixture
+def raw():
+    return np.random.default_rng(0).integers(0, 4096, (1000, 5), dtype=np.uint16)
+
+
+@pytest.fixture
+def path(tmp_path, sensors, table_AIn, raw):
+    path = tmp_path / 'raw_data.journal'
+
+    journal = JournalWriter(path, FREQUENCY, sensors, table_AIn, timestamp_label='test')
+    for batch in np.array_split(raw, 7):
+        journal.append(batch)
+    journal.close()
+
+    assert journal.scans == len(raw)
+
+    return path
+
+
+def test_header(path, sensors, table_AIn):
+    journal = JournalReader(path)
+
+    assert journal.frequency == FREQUENCY
+    assert journal.nchan == 5
+    assert journal.sensor_names == ['Load Cell', 'Chamber Pressure', 'Tank Pressure', 'Tank Temperature', 'Chamber Temperature']
+    assert journal.header['timestamp_label'] == 'test'
+    assert callable(journal.sensors['channel0']['formula'])
+
+    for chan, calibration in enumerate(journal.table_AIn):
+        assert calibration.slope == table_AIn[chan].slope
+        assert calibration.intercept == table_AIn[chan].intercept
+
+
+def test_scans_are_aligned(path, raw):
+    assert (path.stat().st_size - raw.nbytes) % JOURNAL_ALIGNMENT == 0
+
+
+def test_round_trip(path, raw):
+    journal = JournalReader(path)
+
+    assert len(journal) == len(raw)
+    assert journal.duration == pytest.approx(len(raw) / FREQUENCY)
+    np.testing.assert_array_equal(journal.scans(), raw)
+
+
+def test_time_range(path, raw):
+    journal = JournalReader(path)
+
+    # The first scan is logged at one sample time
+    np.testing.assert_array_equal(journal.scans(0.01, 0.05), raw[0:5])
+    np.testing.assert_array_equal(journal.scans(2, 3), raw[199:300])
+    np.testing.assert_allclose(journal.timestamps(199, 300), np.arange(200, 301) / FREQUENCY)
+
+    assert len(journal.scans(20, 30)) == 0
+
+
+def test_converted(path, raw, sensors, table_AIn):
+    journal = JournalReader(path)
+    volts, units = SampleConverter(sensors, table_AIn, usb_20x.volts).convert(raw)
+
+    df = journal.get_data()
+    np.testing.assert_allclose(df.to_numpy(), units)
+    np.testing.assert_allclose(df.index.to_numpy(), np.arange(1, len(raw) + 1) / FREQUENCY)
+
+    np.testing.assert_allclose(journal.get_raw_data().to_numpy(), volts)
+
+
+def test_partial_last_scan(path, raw):
+    # As if the logger stopped part way through writing a scan
+    with open(path, 'ab') as journal_file:
+        journal_file.write(b'\1\2\3')
+
+    np.testing.assert_array_equal(JournalReader(path).scans(), raw)
+
+
+def test_empty(tmp_path, sensors, table_AIn):
+    path = tmp_path / 'raw_data.journal'
+    JournalWriter(path, FREQUENCY, sensors, table_AIn).close()
+
+    journal = JournalReader(path)
+    assert len(journal) == 0
+    assert journal.scans().shape == (0, 5)
+
+
+def test_not_a_journal(tmp_path):
+    path = tmp_path / 'raw_data.journal'
+    path.write_bytes(b'nope' + bytes(64))
+
+    with pytest.raises(ValueError, match='not a raw data journal'):
+        JournalReader(path)
+
+
+def test_newer_version(path):
+    data = bytearray(path.read_bytes())
+    data[4:6] = (JOURNAL_VERSION + 1).to_bytes(2, 'little')
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match='version'):
+        JournalReader(path)
@@ -0,0 +1,189 @@
+import threading
+
+import numpy as np
+
+from datalogger.libraries.ring_buffer import RingBuffer, LiveBuffer
+
+
+def scans(start, count, nchan=2):
+    return np.arange(start * nchan, (start + count) * nchan, dtype=np.uint16).reshape(-1, nchan)
+
+
+def read_all(ring, max_scans=None):
+    read = []
+    while ring.fill_level:
+        view = ring.read(max_scans, timeout=0)
+        read.append(view.copy())
+        ring.release(len(view))
+
+    return np.concatenate(read)
+
+
+class TestRingBuffer:
+    def test_write_read(self):
+        ring = RingBuffer(8, 2)
+
+        assert ring.write(scans(0, 5))
+        assert ring.fill_level == 5
+
+        view = ring.read()
+        np.testing.assert_array_equal(view, scans(0, 5))
+
+        ring.release(len(view))
+        assert ring.fill_level == 0
+        assert ring.read(timeout=0) is None
+
+    def test_wrap(self):
+        ring = RingBuffer(8, 2)
+
+        ring.write(scans(0, 6))
+        ring.release(len(ring.read()))
+
+        # Split over the end and the start of the buffer
+        assert ring.write(scans(6, 5))
+
+        first = ring.read()
+        assert len(first) == 2
+        ring.release(len(first))
+
+        second = ring.read()
+        np.testing.assert_array_equal(np.concatenate((first, second)), scans(6, 5))
+
+    def test_max_scans(self):
+        ring = RingBuffer(16, 2)
+        ring.write(scans(0, 10))
+
+        assert len(ring.read(4)) == 4
+        np.testing.assert_array_equal(read_all(ring, 4), scans(0, 10))
+
+    def test_overrun_drops_the_whole_write(self):
+        ring = RingBuffer(8, 2)
+
+        assert ring.write(scans(0, 6))
+        assert not ring.write(scans(6, 3))
+
+        assert ring.overflows == 1
+        assert ring.dropped_scans == 3
+        assert ring.max_fill == 6
+        np.testing.assert_array_equal(read_all(ring), scans(0, 6))
+
+    def test_fills_exactly(self):
+        ring = RingBuffer(8, 2)
+
+        assert ring.write(scans(0, 8))
+        assert ring.fill_ratio == 1
+        assert not ring.write(scans(8, 1))
+
+    def test_close_drains(self):
+        ring = RingBuffer(8, 2)
+        ring.write(scans(0, 3))
+        ring.close()
+
+        assert ring.closed
+        assert not ring.drained
+
+        read_all(ring)
+        assert ring.drained
+        assert ring.read(timeout=1) is None
+
+    def test_close_wakes_the_reader(self):
+        ring = RingBuffer(8, 2)
+        result = []
+
+        reader = threading.Thread(target=lambda: result.append(ring.read(timeout=10)))
+        reader.start()
+        ring.close()
+        reader.join(2)
+
+        assert not reader.is_alive()
+        assert result == [None]
+
+    def test_many_wraps(self):
+        ring = RingBuffer(7, 3)
+        rng = np.random.default_rng(0)
+
+        written = 0
+        read = []
+        for i in range(200):
+            count = int(rng.integers(1, 7))
+            if ring.write(scans(written, count, 3)):
+                written += count
+
+            view = ring.read(int(rng.integers(1, 7)), timeout=0)
+            if view is not None:
+                read.append(view.copy())
+                ring.release(len(view))
+
+        read.append(read_all(ring))
+        np.testing.assert_array_equal(np.concatenate(read), scans(0, written, 3))
+
+
+class TestLiveBuffer:
+    def test_read_since_cursor(self):
+        live = LiveBuffer(8, 2)
+
+        live.write(scans(0, 3))
+        values, cursor, skipped = live.read()
+        np.testing.assert_array_equal(values, scans(0, 3))
+        assert (cursor, skipped) == (3, 0)
+
+        live.write(scans(3, 2))
+        values, cursor, skipped = live.read(cursor)
+        np.testing.assert_array_equal(values, scans(3, 2))
+        assert (cursor, skipped) == (5, 0)
+
+        values, cursor, skipped = live.read(cursor)
+        assert len(values) == 0
+
+    def test_wrap(self):
+        live = LiveBuffer(8, 2)
+
+        live.write(scans(0, 6))
+        values, cursor, skipped = live.read()
+
+        live.write(scans(6, 5))
+        values, cursor, skipped = live.read(cursor)
+        np.testing.assert_array_equal(values, scans(6, 5))
+        assert (cursor, skipped) == (11, 0)
+
+    def test_slow_reader_skips_the_overwritten(self):
+        live = LiveBuffer(8, 2)
+
+        live.write(scans(0, 6))
+        live.write(scans(6, 6))
+
+        values, cursor, skipped = live.read()
+        np.testing.assert_array_equal(values, scans(4, 8))
+        assert (cursor, skipped) == (12, 4)
+
+    def test_write_bigger_than_the_buffer(self):
+        live = LiveBuffer(8, 2)
+
+        live.write(scans(0, 20))
+
+        values, cursor, skipped = live.read()
+        np.testing.assert_array_equal(values, scans(12, 8))
+        assert (cursor, skipped) == (20, 12)
+
+    def test_readers_are_independent(self):
+        live = LiveBuffer(8, 1)
+        live.write(np.arange(4))
+
+        first, first_cursor, skipped = live.read()
+        live.write(np.arange(4, 6))
+        second, second_cursor, skipped = live.read()
+
+        assert first_cursor == 4
+        np.testing.assert_array_equal(live.read(first_cursor)[0].ravel(), [4, 5])
+        np.testing.assert_array_equal(second.ravel(), np.arange(6))
+
+    def test_write_during_read(self):
+        live = LiveBuffer(8, 1)
+        live.write(np.arange(8))
+
+        # As if the writer had started overwriting the 3 oldest samples while they were copied
+        live.writing = live.written + 3
+
+        values, cursor, skipped = live.read()
+        np.testing.assert_array_equal(values.ravel(), np.arange(3, 8))
+        assert skipped == 3